@@ -1,14 +1,31 @@
-from flask import Flask, Response, jsonify, render_template
+from flask import Flask, Response, jsonify, render_template, request
 from flask_cors import CORS
 import cv2
 import numpy as np
 import threading
 import time
 import json
+import os
 from datetime import datetime
 import logging
 from object_detector import ObjectDetector
 from camera_handler import CameraHandler
+from frame_pipeline import FramePipeline
+from batch_scheduler import BatchScheduler
+from model_registry import ModelRegistry
+from model_cache import FingerprintCache
+from motion_gate import MotionGate
+from tracker import MultiObjectTracker
+from process_pool import ProcessPoolDetector
+from event_stream import DetectionEventHub
+from stream_encoder import TIER_NAMES, tier_index
+from detection_store import DetectionStore
+from detection_export import EXPORT_FORMATS, export_chunks
+from object_categories import OBJECT_CATEGORIES, enrich_objects
+from region_detector import RegionDetector, parse_roi
+from response_cache import ResponseCache
+import asgi_server
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,132 +36,258 @@ CORS(app)
 
 # Initialize components
 detector = ObjectDetector()
-camera = CameraHandler()
+
+# SHA-256 of the model files, memoized by size and mtime across restarts
+detector.fingerprints = FingerprintCache(os.environ.get('SCANNER_MODEL_CACHE', '.model_cache.json'))
+DEFAULT_MODEL = os.environ.get('SCANNER_MODEL', 'yolov3')
+
+# Camera sources: device indices and/or ESP32 MJPEG URLs, comma separated,
+# e.g. SCANNER_CAMERAS=0,http://192.168.1.50/stream. The first one is the
+# primary camera behind /video_feed and the detection endpoints.
+CAMERA_SOURCES = [source.strip() for source in
+                  os.environ.get('SCANNER_CAMERAS', '0').split(',') if source.strip()]
+cameras = [CameraHandler(name=f'camera{index}') for index in range(len(CAMERA_SOURCES))]
+camera = cameras[0]
+registry = ModelRegistry(detector, max_warm=2)
+
+# Number of inference worker processes (0 = detect in the server process)
+INFERENCE_WORKERS = int(os.environ.get('SCANNER_INFERENCE_WORKERS', '0'))
+inference_pool = None
+
+# Stream JPEG encoder: 'auto' uses TurboJPEG when installed, else OpenCV
+JPEG_BACKEND = os.environ.get('SCANNER_JPEG_BACKEND', 'auto')
+
+# 'async' serves through ASGI (uvicorn) with streams on an event loop and
+# other routes on SCANNER_THREADS threads; 'threaded' is Flask's server
+SERVER_MODE = os.environ.get('SCANNER_SERVER', 'async')
+SERVER_THREADS = int(os.environ.get('SCANNER_THREADS', '32'))
+SERVER_PORT = int(os.environ.get('SCANNER_PORT', '5000'))
+
+# Regions of interest per camera as x,y,w,h frame fractions, e.g.
+# SCANNER_ROIS=0=0.5,0.4,0.5,0.6|0,0,0.2,0.2;1=0,0.5,1,0.5, and cameras
+# whose ROIs (or whole frame) are cut into native-resolution tiles,
+# e.g. SCANNER_TILED=0,1
+CAMERA_ROIS = {}
+for entry in os.environ.get('SCANNER_ROIS', '').split(';'):
+    if entry.strip():
+        camera_id, _, rois = entry.partition('=')
+        CAMERA_ROIS[int(camera_id)] = [parse_roi(roi) for roi in rois.split('|')]
+TILED_CAMERAS = {int(camera_id) for camera_id in
+                 os.environ.get('SCANNER_TILED', '').split(',') if camera_id.strip()}
+
+# Append-only detection log, written in batches off the frame loop
+history = DetectionStore(os.environ.get('SCANNER_HISTORY_DB', 'detections.db'),
+                         retention_days=float(os.environ.get('SCANNER_HISTORY_RETENTION_DAYS', '7')))
 
 # Global variables
 detected_objects = []
+detected_tracks = []
 frame_lock = threading.Lock()
 scan_active = False
 last_scan_time = time.time()
 
-# Available detection models
+# Bumped for every published detection result; /get_detections is
+# serialized once per value and /get_stats at most once per second
+detection_seq = 0
+detections_cache = ResponseCache()
+stats_cache = ResponseCache()
+STATS_MAX_AGE = 1.0
+start_time = time.time()
+
+# Set once every camera has had its first connection attempt
+cameras_initialized = threading.Event()
+
+# Sampling profiler, toggled through /profiler (or SCANNER_PROFILE=1 at start)
+profiler = metrics.SamplingProfiler(interval=0.01)
+
+# Available detection models (keys match ObjectDetector.MODEL_PATHS)
 DETECTION_MODELS = {
-    'yolov4': 'YOLOv4 (Fastest)',
+    'yolov4': 'YOLOv4 (Most Accurate)',
     'yolov3': 'YOLOv3 (Balanced)',
-    'ssd_mobilenet': 'SSD MobileNet (Lightweight)',
-    'faster_rcnn': 'Faster R-CNN (Most Accurate)'
+    'yolov4-tiny': 'YOLOv4-Tiny (Fastest)',
+    'yolov3-tiny': 'YOLOv3-Tiny (Lightweight)'
 }
 
-# Object categories with descriptions
-OBJECT_CATEGORIES = {
-    'person': 'Human Being',
-    'car': 'Vehicle - Car',
-    'motorcycle': 'Vehicle - Motorcycle',
-    'bus': 'Vehicle - Bus',
-    'truck': 'Vehicle - Truck',
-    'bicycle': 'Vehicle - Bicycle',
-    'traffic light': 'Traffic Signal',
-    'stop sign': 'Road Sign - Stop',
-    'chair': 'Furniture - Chair',
-    'sofa': 'Furniture - Sofa',
-    'bed': 'Furniture - Bed',
-    'dining table': 'Furniture - Table',
-    'tv': 'Electronics - Television',
-    'laptop': 'Electronics - Laptop',
-    'mouse': 'Electronics - Computer Mouse',
-    'keyboard': 'Electronics - Keyboard',
-    'cell phone': 'Electronics - Mobile Phone',
-    'book': 'Stationery - Book',
-    'clock': 'Decor - Clock',
-    'vase': 'Decor - Vase',
-    'scissors': 'Tool - Scissors',
-    'teddy bear': 'Toy - Teddy Bear',
-    'hair drier': 'Appliance - Hair Dryer',
-    'toothbrush': 'Personal Care - Toothbrush',
-    'cup': 'Kitchenware - Cup',
-    'fork': 'Kitchenware - Fork',
-    'knife': 'Kitchenware - Knife',
-    'spoon': 'Kitchenware - Spoon',
-    'bowl': 'Kitchenware - Bowl',
-    'banana': 'Food - Banana',
-    'apple': 'Food - Apple',
-    'sandwich': 'Food - Sandwich',
-    'orange': 'Food - Orange',
-    'broccoli': 'Food - Broccoli',
-    'carrot': 'Food - Carrot',
-    'hot dog': 'Food - Hot Dog',
-    'pizza': 'Food - Pizza',
-    'donut': 'Food - Donut',
-    'cake': 'Food - Cake',
-    'bottle': 'Container - Bottle',
-    'wine glass': 'Container - Wine Glass',
-    'cup': 'Container - Cup',
-    'fork': 'Utensil - Fork',
-    'knife': 'Utensil - Knife',
-    'spoon': 'Utensil - Spoon'
-}
+# Push channel for dashboards; one event per published detection result
+events = DetectionEventHub()
 
-def generate_frames():
+def live_stats():
+    """Lightweight stats pushed with every detection event"""
+    with frame_lock:
+        obj_count = len(detected_objects)
+        scan_time = last_scan_time
+    
+    return {
+        'objects_detected': obj_count,
+        'scan_active': scan_active,
+        'last_scan': scan_time,
+        'fps': camera.get_fps(),
+        'camera_status': 'connected' if camera.is_connected() else 'disconnected',
+        'model': detector.get_current_model(),
+        'latency': round(detector.context.avg_latency_ms, 1) if detector.context else None
+    }
+
+def publish_detections(detected):
+    """Store the latest detection results and push them to dashboards"""
+    global detected_objects, detected_tracks, last_scan_time, detection_seq
+    # Tracks as of this result, so the cached response matches it
+    tracks = tracker.get_tracks()
+    with frame_lock:
+        detected_objects = detected
+        detected_tracks = tracks
+        last_scan_time = time.time()
+        detection_seq += 1
+    history.record(detected, camera='camera0', model=detector.current_model)
+    events.publish(enrich_objects(detected), live_stats())
+
+# Skip detection on static frames; full pass every 15 frames or on motion
+motion_gate = MotionGate(keyframe_interval=15, motion_threshold=0.01)
+
+# Stable IDs and between-keyframe box prediction; the pipeline stretches
+# max_age to cover the gate's keyframe period at the camera's frame rate
+tracker = MultiObjectTracker(iou_threshold=0.3, max_age=1.0)
+
+# ROI / tiled detection per camera; inactive until configured
+regions = [RegionDetector(detector, rois=CAMERA_ROIS.get(index), tile=index in TILED_CAMERAS)
+           for index in range(len(cameras))]
+
+# With several cameras, all pipelines share batched forward passes
+scheduler = BatchScheduler(detector) if len(cameras) > 1 else None
+
+# Single capture -> inference -> encode producer shared by all stream clients
+pipeline = FramePipeline(camera, detector,
+                         is_active=lambda: scan_active,
+                         on_detections=publish_detections,
+                         scheduler=scheduler,
+                         source='camera0',
+                         motion_gate=motion_gate,
+                         tracker=tracker,
+                         jpeg_backend=JPEG_BACKEND,
+                         regions=regions[0])
+
+# Additional units get their own pipeline, motion gate and tracker
+pipelines = [pipeline] + [
+    FramePipeline(extra_camera, detector,
+                  is_active=lambda: scan_active,
+                  on_detections=lambda detected, source=f'camera{index}': history.record(
+                      detected, camera=source, model=detector.current_model),
+                  scheduler=scheduler,
+                  source=f'camera{index}',
+                  motion_gate=MotionGate(keyframe_interval=15, motion_threshold=0.01),
+                  tracker=MultiObjectTracker(iou_threshold=0.3, max_age=1.0),
+                  jpeg_backend=JPEG_BACKEND,
+                  regions=regions[index])
+    for index, extra_camera in enumerate(cameras[1:], start=1)
+]
+
+def generate_frames(stream_pipeline=pipeline, tier=0, adaptive=True):
     """Generate video frames with object detection"""
-    global detected_objects, scan_active
+    subscriber = stream_pipeline.subscribe(tier, adaptive)
     
-    while True:
-        try:
-            # Get frame from camera
-            frame = camera.get_frame()
-            
-            if frame is None:
-                # Send black frame if no camera
-                black_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                cv2.putText(black_frame, "NO CAMERA FEED", (200, 240), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                ret, buffer = cv2.imencode('.jpg', black_frame)
-                frame_bytes = buffer.tobytes()
-            else:
-                # Perform object detection if active
-                if scan_active:
-                    detected = detector.detect_objects(frame)
-                    
-                    with frame_lock:
-                        detected_objects = detected
-                        last_scan_time = time.time()
-                    
-                    # Draw detection results on frame
-                    frame = detector.draw_detections(frame, detected)
-                
-                # Encode frame
-                ret, buffer = cv2.imencode('.jpg', frame, 
-                                         [cv2.IMWRITE_JPEG_QUALITY, 85])
-                frame_bytes = buffer.tobytes()
+    try:
+        while True:
+            # Wait for the next already-encoded frame
+            frame_bytes = subscriber.get(timeout=1.0)
+            if frame_bytes is None:
+                continue
             
             # Yield frame for streaming
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + 
                    frame_bytes + b'\r\n')
+    finally:
+        stream_pipeline.unsubscribe(subscriber)
+
+async def generate_frames_async(stream_pipeline=pipeline, tier=0, adaptive=True):
+    """generate_frames for the async server, waiting on the event loop"""
+    subscriber = stream_pipeline.subscribe(tier, adaptive)
+    
+    try:
+        while True:
+            frame_bytes = await subscriber.get_async(timeout=1.0)
+            if frame_bytes is None:
+                continue
             
-            # Control frame rate
-            time.sleep(0.033)  # ~30 FPS
-            
-        except Exception as e:
-            logger.error(f"Frame generation error: {e}")
-            time.sleep(1)
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + 
+                   frame_bytes + b'\r\n')
+    finally:
+        stream_pipeline.unsubscribe(subscriber)
 
 @app.route('/')
 def index():
     """Serve main HTML page"""
     return render_template('index.html')
 
+def stream_options(args=None):
+    """Read ?tier= and ?adaptive= for a video feed request"""
+    args = request.args if args is None else args
+    tier = tier_index(args.get('tier', TIER_NAMES[0]))
+    adaptive = args.get('adaptive', '1').lower() not in ('0', 'false', 'no')
+    return tier, adaptive
+
 @app.route('/video_feed')
 def video_feed():
-    """Video streaming route"""
-    return Response(generate_frames(),
+    """Video streaming route.
+
+    ?tier=high|medium|low|minimal picks resolution and JPEG quality; slow
+    clients step down automatically unless ?adaptive=0.
+    """
+    try:
+        tier, adaptive = stream_options()
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid tier, expected one of {TIER_NAMES}'
+        }), 400
+    return Response(generate_frames(pipeline, tier, adaptive),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/video_feed/<int:camera_id>')
+def camera_feed(camera_id):
+    """Video streaming route for one of the configured cameras"""
+    if not 0 <= camera_id < len(pipelines):
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid camera id'
+        }), 404
+    try:
+        tier, adaptive = stream_options()
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid tier, expected one of {TIER_NAMES}'
+        }), 400
+    return Response(generate_frames(pipelines[camera_id], tier, adaptive),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/cameras')
+def list_cameras():
+    """Get every configured camera with its capture state and detections"""
+    units = []
+    for camera_id, (unit, unit_pipeline) in enumerate(zip(cameras, pipelines)):
+        with unit_pipeline.detections_lock:
+            count = len(unit_pipeline.latest_detections)
+        units.append({
+            'id': camera_id,
+            'source': CAMERA_SOURCES[camera_id],
+            'feed': f'/video_feed/{camera_id}',
+            'resolution': unit.get_resolution(),
+            'objects_detected': count,
+            'capture': unit.get_stats()
+        })
+    return jsonify({
+        'status': 'success',
+        'cameras': units,
+        'scheduler': scheduler.get_stats() if scheduler else None
+    })
+
 @app.route('/start_scan')
 def start_scan():
     """Start object scanning"""
     global scan_active
     scan_active = True
+    events.publish([], live_stats())
     logger.info("Object scanning started")
     return jsonify({
         'status': 'success',
@@ -157,6 +300,7 @@ def stop_scan():
     """Stop object scanning"""
     global scan_active
     scan_active = False
+    events.publish([], live_stats())
     logger.info("Object scanning stopped")
     return jsonify({
         'status': 'success',
@@ -164,40 +308,166 @@ def stop_scan():
         'timestamp': datetime.now().isoformat()
     })
 
+def cached_json(cache, key, build):
+    """JSON response built once per cache key, 304 if the client has it already"""
+    body, etag = cache.get(key, lambda: app.json.dumps(build(), separators=(',', ':')) + '\n')
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    if request.if_none_match.contains(etag):
+        cache.record_not_modified()
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
+
 @app.route('/get_detections')
 def get_detections():
-    """Get current detected objects"""
+    """Get current detected objects.
+
+    The body only changes with a new detection result (or scan start/stop),
+    so it is serialized once per result and revalidated by ETag.
+    """
+    active = scan_active
     with frame_lock:
-        objects = detected_objects.copy()
+        objects, tracks = detected_objects, detected_tracks
+        seq, scan_time = detection_seq, last_scan_time
     
-    # Enrich object data with categories
-    enriched_objects = []
-    for obj in objects:
-        category = OBJECT_CATEGORIES.get(obj['class'], 'Unknown Object')
-        enriched_objects.append({
-            **obj,
-            'category': category,
-            'scan_time': datetime.now().isoformat()
-        })
+    def build():
+        # Enrich object data with categories, stamped with the result's time
+        enriched_objects = enrich_objects(objects, datetime.fromtimestamp(scan_time).isoformat())
+        return {
+            'status': 'success',
+            'count': len(enriched_objects),
+            'objects': enriched_objects,
+            'tracks': tracks if active else [],
+            'scan_active': active,
+            'last_scan': scan_time
+        }
+    
+    return cached_json(detections_cache, (seq, int(active)), build)
+
+@app.route('/events')
+def detection_events():
+    """Server-Sent Events stream of detection deltas and stats.
+
+    Browsers resume automatically by sending the Last-Event-ID header on
+    reconnect; other clients can pass ?last_event_id= instead.
+    """
+    last_event_id = (request.headers.get('Last-Event-ID')
+                     or request.args.get('last_event_id'))
+    return Response(events.stream(last_event_id),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+def stream_route(path, args, headers):
+    """Async bodies for the streaming routes under the ASGI server.
+
+    Mirrors /video_feed, /video_feed/<id> and /events; returns None for
+    anything else, including invalid arguments, so the Flask routes
+    handle (and report) it.
+    """
+    if path == '/events':
+        last_event_id = headers.get('last-event-id') or args.get('last_event_id')
+        return ('text/event-stream',
+                {'cache-control': 'no-cache', 'x-accel-buffering': 'no'},
+                events.stream_async(last_event_id))
+    
+    if path == '/video_feed':
+        stream_pipeline = pipeline
+    elif path.startswith('/video_feed/') and path[12:].isdigit() and int(path[12:]) < len(pipelines):
+        stream_pipeline = pipelines[int(path[12:])]
+    else:
+        return None
+    try:
+        tier, adaptive = stream_options(args)
+    except ValueError:
+        return None
+    return ('multipart/x-mixed-replace; boundary=frame', {},
+            generate_frames_async(stream_pipeline, tier, adaptive))
+
+def parse_time_arg(name):
+    """Read a time query arg: epoch seconds, ISO 8601, or HH:MM[:SS] for today"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    if 'T' not in value and '-' not in value:
+        value = f"{datetime.now().date().isoformat()}T{value}"
+    return datetime.fromisoformat(value).timestamp()
+
+def history_filters():
+    """Time range, class and camera filters shared by the history endpoints"""
+    classes = request.args.get('class')
+    return {
+        'start': parse_time_arg('start'),
+        'end': parse_time_arg('end'),
+        'classes': classes.split(',') if classes else None,
+        'camera': request.args.get('camera')
+    }
+
+@app.route('/history')
+def detection_history():
+    """Stored detections in a time range.
+
+    Query args: start, end (epoch, ISO 8601 or HH:MM for today), class
+    (comma separated), camera, limit, offset.
+    """
+    try:
+        filters = history_filters()
+        limit = max(1, min(int(request.args.get('limit', 1000)), 10000))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid history query: {e}'
+        }), 400
     
+    objects = history.query(limit=limit, offset=offset, **filters)
     return jsonify({
         'status': 'success',
-        'count': len(enriched_objects),
-        'objects': enriched_objects,
-        'scan_active': scan_active,
-        'last_scan': last_scan_time
+        'count': len(objects),
+        'objects': objects,
+        'limit': limit,
+        'offset': offset
+    })
+
+@app.route('/history/summary')
+def detection_history_summary():
+    """Detection counts in a time range, per class or camera.
+
+    Takes the /history filters plus group_by (class or camera) and bucket
+    (seconds, for a time series). 'objects' counts distinct tracked objects,
+    e.g. how many people were seen between 09:00 and 10:00.
+    """
+    try:
+        filters = history_filters()
+        bucket = float(request.args['bucket']) if 'bucket' in request.args else None
+        summary = history.aggregate(bucket=bucket,
+                                    group_by=request.args.get('group_by', 'class'),
+                                    **filters)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid history query: {e}'
+        }), 400
+    
+    return jsonify({
+        'status': 'success',
+        'start': filters['start'],
+        'end': filters['end'],
+        'summary': summary
     })
 
 @app.route('/scan_single')
 def scan_single():
     """Perform single frame scan"""
-    frame = camera.get_frame()
-    if frame is not None:
-        detected = detector.detect_objects(frame)
-        
-        with frame_lock:
-            detected_objects = detected
-            last_scan_time = time.time()
+    # Newest frame from the capture ring, read in place
+    ref = camera.latest_frame()
+    if ref is not None:
+        detected = tracker.update(detector.detect_objects(ref.frame, ref.pixel_format),
+                                  now=ref.timestamp)
+        publish_detections(detected)
         
         return jsonify({
             'status': 'success',
@@ -213,42 +483,132 @@ def scan_single():
 
 @app.route('/get_stats')
 def get_stats():
-    """Get system statistics"""
-    with frame_lock:
-        obj_count = len(detected_objects)
-    
-    return jsonify({
-        'objects_detected': obj_count,
-        'scan_active': scan_active,
+    """Get system statistics, rebuilt per detection result and at most every STATS_MAX_AGE"""
+    key = (detection_seq, int(scan_active), int(time.time() / STATS_MAX_AGE))
+    return cached_json(stats_cache, key, lambda: {
+        **live_stats(),
         'uptime': time.time() - start_time,
-        'fps': camera.get_fps(),
-        'camera_status': 'connected' if camera.is_connected() else 'disconnected',
-        'model': detector.get_current_model(),
-        'confidence_threshold': detector.confidence_threshold
+        'confidence_threshold': detector.confidence_threshold,
+        'camera': camera.get_stats(),
+        'pipeline': pipeline.get_stats(),
+        'events': events.get_stats(),
+        'history': history.get_stats()
     })
 
 @app.route('/change_model/<model_name>')
 def change_model(model_name):
     """Change detection model"""
     if model_name in DETECTION_MODELS:
-        success = detector.load_model(model_name)
-        if success:
+        # Never load in the request thread; the stream keeps running on
+        # the current model until the new one is warm
+        state = registry.request(model_name)
+        if inference_pool is not None:
+            inference_pool.load_model(model_name)
+        if state == 'ready':
             return jsonify({
                 'status': 'success',
                 'message': f'Model changed to {DETECTION_MODELS[model_name]}',
                 'model': model_name
             })
+        return jsonify({
+            'status': 'loading',
+            'message': f'Loading {DETECTION_MODELS[model_name]}',
+            'model': model_name
+        })
     
     return jsonify({
         'status': 'error',
         'message': 'Invalid model name'
     })
 
+@app.route('/model_status')
+def model_status():
+    """Get background model loading progress and per-model latency"""
+    return jsonify({
+        'status': 'success',
+        **registry.get_status()
+    })
+
+@app.route('/motion_gate')
+@app.route('/motion_gate/<int:camera_id>')
+def motion_gate_settings(camera_id=0):
+    """Get or tune a camera's motion-gated inference scheduler"""
+    if not 0 <= camera_id < len(pipelines):
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid camera id'
+        }), 404
+    gate = pipelines[camera_id].motion_gate
+    settings = {}
+    try:
+        if 'enabled' in request.args:
+            settings['enabled'] = request.args['enabled'].lower() in ('1', 'true', 'yes')
+        if 'keyframe_interval' in request.args:
+            settings['keyframe_interval'] = max(1, int(request.args['keyframe_interval']))
+        if 'motion_threshold' in request.args:
+            settings['motion_threshold'] = float(request.args['motion_threshold'])
+        if 'pixel_threshold' in request.args:
+            settings['pixel_threshold'] = int(request.args['pixel_threshold'])
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid motion gate setting'
+        })
+    
+    if settings:
+        gate.configure(**settings)
+    
+    return jsonify({
+        'status': 'success',
+        **gate.get_stats()
+    })
+
+@app.route('/regions/<int:camera_id>')
+def region_settings(camera_id):
+    """Get or set a camera's regions of interest and tiling.
+
+    Query args: roi=x,y,w,h (frame fractions, repeatable) replaces the
+    ROIs, clear=1 removes them, tile=1/0 and overlap=0..1.
+    """
+    if not 0 <= camera_id < len(regions):
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid camera id'
+        }), 404
+    settings = {}
+    try:
+        if request.args.get('clear', '0').lower() in ('1', 'true', 'yes'):
+            settings['rois'] = []
+        elif 'roi' in request.args:
+            settings['rois'] = [parse_roi(roi) for roi in request.args.getlist('roi')]
+        if 'tile' in request.args:
+            settings['tile'] = request.args['tile'].lower() in ('1', 'true', 'yes')
+        if 'overlap' in request.args:
+            settings['overlap'] = float(request.args['overlap'])
+        if settings:
+            regions[camera_id].configure(**settings)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Invalid region setting: {e}'
+        }), 400
+    
+    if settings:
+        # Detect right away with the new windows
+        pipelines[camera_id].motion_gate.reset()
+    
+    return jsonify({
+        'status': 'success',
+        **regions[camera_id].get_stats()
+    })
+
 @app.route('/set_confidence/<float:threshold>')
 def set_confidence(threshold):
     """Set confidence threshold"""
     if 0 <= threshold <= 1:
         detector.confidence_threshold = threshold
+        for unit_pipeline in pipelines:
+            unit_pipeline.motion_gate.reset()
         return jsonify({
             'status': 'success',
             'message': f'Confidence threshold set to {threshold:.2f}',
@@ -262,7 +622,31 @@ def set_confidence(threshold):
 
 @app.route('/export_detections')
 def export_detections():
-    """Export detection results as JSON"""
+    """Export detection results.
+
+    Without arguments this is the current frame's objects as JSON. With
+    format (json, ndjson, csv, parquet), start, end, class or camera it
+    streams stored history in that format; gzip=1 compresses on the fly.
+    """
+    if any(arg in request.args for arg in ('format', 'start', 'end', 'class', 'camera')):
+        try:
+            filters = history_filters()
+            fmt = request.args.get('format', 'ndjson')
+            compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+            body = export_chunks(history.iter_chunks(**filters), fmt, gzip=compress)
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': f'Invalid export query: {e}'
+            }), 400
+
+        mimetype, extension = EXPORT_FORMATS[fmt]
+        filename = f"detections-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+        if compress:
+            mimetype, filename = 'application/gzip', filename + '.gz'
+        return Response(body, mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment;filename={filename}'})
+
     with frame_lock:
         objects = detected_objects.copy()
     
@@ -282,6 +666,7 @@ def export_detections():
 @app.route('/capture_image')
 def capture_image():
     """Capture current frame with detections"""
+    # Private copy of the newest ring frame; we draw on it below
     frame = camera.get_frame()
     if frame is not None and scan_active:
         frame = detector.draw_detections(frame, detected_objects)
@@ -306,6 +691,186 @@ def capture_image():
         headers={'Content-Disposition': 'attachment;filename=capture.jpg'}
     )
 
+def collect_metrics():
+    """Counters and gauges read from the components at scrape time"""
+    yield ('scanner_uptime_seconds', 'gauge', 'Seconds since the server started',
+           [({}, round(time.time() - start_time, 1))])
+    yield ('scanner_scan_active', 'gauge', 'Whether detection is running',
+           [({}, int(scan_active))])
+    with frame_lock:
+        yield ('scanner_objects_detected', 'gauge', 'Objects in the latest detection result',
+               [({}, len(detected_objects))])
+
+    units = [(f'camera{index}', unit.get_stats(), unit_pipeline.get_stats())
+             for index, (unit, unit_pipeline) in enumerate(zip(cameras, pipelines))]
+    camera_counters = [
+        ('scanner_camera_connected', 'gauge', 'Whether the camera source is open', 'connected'),
+        ('scanner_camera_fps', 'gauge', 'Frames read from the camera in the last second', 'capture_fps'),
+        ('scanner_camera_frames_total', 'counter', 'Frames captured into the ring', 'frames_captured'),
+        ('scanner_camera_dropped_frames_total', 'counter',
+         'Stale frames drained from the driver buffer', 'frames_dropped'),
+        ('scanner_camera_failed_reads_total', 'counter', 'Failed camera reads', 'failed_reads'),
+        ('scanner_camera_reconnects_total', 'counter', 'Successful camera reconnects', 'reconnects')
+    ]
+    for name, kind, help_text, key in camera_counters:
+        yield (name, kind, help_text,
+               [({'camera': camera_id}, int(capture[key])) for camera_id, capture, _ in units])
+
+    yield ('scanner_queue_depth', 'gauge', 'Frames waiting in a pipeline queue',
+           [({'camera': camera_id, 'queue': queue_name}, queue_stats['depth'])
+            for camera_id, _, stats in units for queue_name, queue_stats in stats['queues'].items()])
+    yield ('scanner_queue_dropped_total', 'counter',
+           'Frames replaced in a pipeline queue before being processed',
+           [({'camera': camera_id, 'queue': queue_name}, queue_stats['dropped'])
+            for camera_id, _, stats in units for queue_name, queue_stats in stats['queues'].items()])
+    yield ('scanner_stream_clients', 'gauge', 'Connected video stream clients per tier',
+           [({'camera': camera_id, 'tier': tier}, count)
+            for camera_id, _, stats in units
+            for tier, count in stats['stream']['tier_clients'].items()])
+    yield ('scanner_stream_frames_total', 'counter', 'Encoded frames published to stream clients',
+           [({'camera': camera_id}, stats['stream']['frames_published']) for camera_id, _, stats in units])
+    yield ('scanner_stream_client_drops_total', 'counter',
+           'Frames stream clients skipped because they read too slowly',
+           [({'camera': camera_id}, stats['stream']['client_drops']) for camera_id, _, stats in units])
+    yield ('scanner_stream_step_downs_total', 'counter', 'Adaptive stream tier step-downs',
+           [({'camera': camera_id}, stats['stream']['step_downs']) for camera_id, _, stats in units])
+    yield ('scanner_motion_gate_skipped_total', 'counter', 'Frames that skipped detection as static',
+           [({'camera': camera_id}, stats['motion_gate']['skipped'])
+            for camera_id, _, stats in units if stats['motion_gate']])
+
+    event_stats = events.get_stats()
+    yield ('scanner_event_clients', 'gauge', 'Connected Server-Sent Events clients',
+           [({}, event_stats['clients'])])
+    yield ('scanner_events_published_total', 'counter', 'Detection events published',
+           [({}, event_stats['published'])])
+
+    history_stats = history.get_stats()
+    yield ('scanner_history_pending', 'gauge', 'Detection rows waiting to be written',
+           [({}, history_stats['pending'])])
+    yield ('scanner_history_written_total', 'counter', 'Detection rows written to history',
+           [({}, history_stats['written'])])
+    yield ('scanner_history_dropped_total', 'counter', 'Detection rows dropped by history',
+           [({}, history_stats['dropped'])])
+
+    if scheduler is not None:
+        yield ('scanner_batch_queue_depth', 'gauge', 'Frames waiting for a batched forward pass',
+               [({}, scheduler.get_stats()['queue_depth'])])
+    cache_stats = {endpoint: cache.get_stats()
+                   for endpoint, cache in (('get_detections', detections_cache), ('get_stats', stats_cache))}
+    for name, help_text in (('builds', 'Response bodies serialized'),
+                            ('hits', 'Responses served from the serialized cache'),
+                            ('not_modified', 'Requests answered 304 Not Modified')):
+        yield (f'scanner_response_cache_{name}_total', 'counter', help_text,
+               [({'endpoint': endpoint}, stats[name]) for endpoint, stats in cache_stats.items()])
+    yield ('scanner_threads', 'gauge', 'Live threads in the server process',
+           [({}, threading.active_count())])
+    server_stats = asgi_app.get_stats()
+    yield ('scanner_server_streams', 'gauge', 'Open streaming responses on the async server',
+           [({}, server_stats['streams'])])
+    yield ('scanner_server_pending', 'gauge', 'Requests running or queued on the async server thread pool',
+           [({}, server_stats['pending'])])
+    yield ('scanner_server_rejected_total', 'counter', 'Requests rejected with 503 by the async server',
+           [({}, server_stats['rejected'])])
+    yield ('scanner_server_aborted_total', 'counter',
+           'Streamed responses cut short because the client disconnected',
+           [({}, server_stats['aborted'])])
+    if inference_pool is not None:
+        pool_stats = inference_pool.get_stats()
+        yield ('scanner_pool_in_flight', 'gauge', 'Frames being processed by inference workers',
+               [({}, pool_stats['in_flight'])])
+        yield ('scanner_pool_completed_total', 'counter', 'Frames completed by inference workers',
+               [({}, pool_stats['completed'])])
+
+metrics.REGISTRY.register_collector(collect_metrics)
+
+def readiness():
+    """Per-component readiness; the server is ready when all are"""
+    model_status = registry.get_status()
+    target = model_status['models'].get(model_status['target'] or DEFAULT_MODEL, {})
+    components = {
+        'model': {
+            'ready': registry.is_ready(),
+            'active': model_status['active'],
+            'state': target.get('state', 'pending'),
+            'stage': target.get('stage'),
+            'progress': target.get('progress', 0.0),
+            'fingerprint': target.get('fingerprint'),
+            'error': target.get('error')
+        },
+        # Cameras that failed to open serve the fallback feed and keep
+        # reconnecting, so only the first attempt gates readiness
+        'cameras': {
+            'ready': cameras_initialized.is_set(),
+            'connected': [unit.is_connected() for unit in cameras]
+        },
+        'history': {
+            'ready': history.running
+        }
+    }
+    if INFERENCE_WORKERS > 0:
+        pool_stats = inference_pool.get_stats() if inference_pool is not None else None
+        components['inference_pool'] = {
+            'ready': pool_stats is not None and pool_stats['alive'] == pool_stats['workers'],
+            'alive': pool_stats['alive'] if pool_stats else 0,
+            'workers': INFERENCE_WORKERS
+        }
+    return all(component['ready'] for component in components.values()), components
+
+@app.route('/health')
+def health():
+    """Liveness: the process is up and serving requests"""
+    ready, components = readiness()
+    return jsonify({
+        'status': 'ok',
+        'ready': ready,
+        'uptime': time.time() - start_time,
+        'components': {name: component['ready'] for name, component in components.items()}
+    })
+
+@app.route('/ready')
+def ready():
+    """Readiness: 200 once the model, cameras and history are up, else 503"""
+    is_ready, components = readiness()
+    failed = components['model']['state'] == 'error' and not components['model']['ready']
+    return jsonify({
+        'status': 'ready' if is_ready else 'failed' if failed else 'starting',
+        'uptime': time.time() - start_time,
+        'components': components
+    }), 200 if is_ready else 503
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage latency histograms and component counters, Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiler')
+def profiler_control():
+    """Toggle the sampling profiler and read its results.
+
+    Query args: enable=1/0, reset=1, format=folded (collapsed stacks for
+    flame graph tools, as text) and limit for the JSON top list.
+    """
+    if 'enable' in request.args:
+        if request.args['enable'].lower() in ('1', 'true', 'yes'):
+            profiler.start()
+        else:
+            profiler.stop()
+    if request.args.get('reset', '0').lower() in ('1', 'true', 'yes'):
+        profiler.reset()
+    
+    if request.args.get('format') == 'folded':
+        return Response(profiler.folded(), mimetype='text/plain')
+    
+    try:
+        limit = int(request.args.get('limit', 25))
+    except ValueError:
+        limit = 25
+    return jsonify({
+        'status': 'success',
+        **profiler.get_stats(),
+        'top': profiler.top(limit)
+    })
+
 @app.route('/system_info')
 def system_info():
     """Get detailed system information"""
@@ -330,19 +895,70 @@ def system_info():
         }
     })
 
-if __name__ == '__main__':
-    start_time = time.time()
-    
-    # Try to initialize camera
-    if not camera.initialize():
-        logger.warning("Camera initialization failed. Using fallback mode.")
+def initialize_camera(unit, source):
+    """Open one camera; on failure it serves the fallback feed and keeps retrying"""
+    if not unit.initialize(source):
+        logger.warning(f"Camera {source} initialization failed. "
+                       "Using fallback mode until it reconnects.")
+
+def start_background_services():
+    """Open cameras, load the default model and start workers without blocking the server.
+
+    Cameras open in parallel while the model is read and warmed up by the
+    registry's loader thread; /ready reports progress until all are up.
+    """
+    global inference_pool
+    registry.request(DEFAULT_MODEL)
     
-    # Load default detection model
-    detector.load_model('yolov3')
+    openers = [threading.Thread(target=initialize_camera, args=(unit, source),
+                                name=f'{unit.name}-init', daemon=True)
+               for unit, source in zip(cameras, CAMERA_SOURCES)]
+    for opener in openers:
+        opener.start()
+    for opener in openers:
+        opener.join()
+    cameras_initialized.set()
     
+    if INFERENCE_WORKERS > 0:
+        # Each worker loads its own copy of the model
+        pool = ProcessPoolDetector(detector, workers=INFERENCE_WORKERS, model_name=DEFAULT_MODEL)
+        pool.start()
+        inference_pool = pool
+        for unit_pipeline in pipelines:
+            unit_pipeline.pool = pool
+
+services_started = threading.Event()
+
+def start_services():
+    """Start the writer, pipelines and background startup (idempotent)"""
+    if services_started.is_set():
+        return
+    services_started.set()
+    history.start()
+    if os.environ.get('SCANNER_PROFILE', '0') == '1':
+        profiler.start()
+    if scheduler is not None:
+        scheduler.start()
+    for unit_pipeline in pipelines:
+        unit_pipeline.start()
+    threading.Thread(target=start_background_services, name='startup', daemon=True).start()
+
+# ASGI entry point (e.g. uvicorn app:asgi_app); starts services on lifespan startup
+asgi_app = asgi_server.ScannerASGI(app, stream_route, max_threads=SERVER_THREADS,
+                                   on_startup=start_services)
+
+if __name__ == '__main__':
     logger.info("Starting AI Scanner System...")
     logger.info(f"Available models: {list(DETECTION_MODELS.keys())}")
     logger.info(f"Object categories: {len(OBJECT_CATEGORIES)}")
-    logger.info("Server running on http://localhost:5000")
+    logger.info(f"Server running on http://localhost:{SERVER_PORT}")
     
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
\ No newline at end of file
+    if SERVER_MODE == 'async' and asgi_server.available():
+        asgi_server.serve(asgi_app, host='0.0.0.0', port=SERVER_PORT)
+    else:
+        if SERVER_MODE == 'async':
+            logger.warning("uvicorn not installed, falling back to the threaded server")
+        start_services()
+        # No debug reloader: it would run a second process loading the model again
+        app.run(host='0.0.0.0', port=SERVER_PORT, threaded=True,
+                debug=os.environ.get('SCANNER_DEBUG', '0') == '1', use_reloader=False)
\ No newline at end of file
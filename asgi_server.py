@@ -0,0 +1,276 @@
+import asyncio
+import io
+import json
+import sys
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+
+logger = logging.getLogger(__name__)
+
+try:
+    # Optional: ASGI server for the async serving mode (pip install uvicorn)
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+def available():
+    """Whether the async serving mode can be used"""
+    return uvicorn is not None
+
+class ScannerASGI:
+    """ASGI front end serving long-lived streams on an event loop.
+
+    stream_route(path, args, headers) returns (content_type, headers,
+    async iterator of bytes/str) for the streaming endpoints (MJPEG feeds,
+    Server-Sent Events) or None. Those are served by coroutines, so a
+    viewer costs a socket and a small task instead of a thread, however
+    long it stays connected. Each body chunk is sent with the server's
+    flow control: a client that does not drain its socket only stalls its
+    own coroutine while the producer keeps overwriting its one-frame slot,
+    and one that stays stalled for send_timeout seconds is dropped.
+
+    Every other request runs the WSGI app on a bounded thread pool, which
+    is also where the blocking OpenCV work of those routes happens. When
+    max_pending requests are already queued for it, new ones get a 503
+    instead of piling up. A streamed WSGI body (e.g. an export) stops at
+    the next chunk once the client disconnects, and its iterator is
+    closed so the query behind it ends too.
+    """
+    def __init__(self, wsgi_app, stream_route, max_threads=32, max_pending=256,
+                 send_timeout=10.0, on_startup=None):
+        self.wsgi_app = wsgi_app
+        self.stream_route = stream_route
+        self.max_threads = max_threads
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.on_startup = on_startup
+        self.executor = None
+        self.lock = threading.Lock()
+
+        # Counters (event loop only)
+        self.pending = 0
+        self.streams = 0
+        self.requests = 0
+        self.rejected = 0
+        self.stalled = 0
+        self.aborted = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        self.requests += 1
+        args = {}
+        for pair in scope['query_string'].decode('latin-1').split('&'):
+            key, _, value = pair.partition('=')
+            if key:
+                args.setdefault(unquote_plus(key), unquote_plus(value))
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                   for name, value in scope['headers']}
+        route = self.stream_route(scope['path'], args, headers) if scope['method'] == 'GET' else None
+        if route is not None:
+            await self._stream(route, receive, send)
+        else:
+            await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        """Run the startup hook and shut the thread pool down with the server"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._start_executor()
+                if self.on_startup is not None:
+                    self.on_startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _start_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_threads,
+                                                   thread_name_prefix='wsgi')
+        return self.executor
+
+    async def _stream(self, route, receive, send):
+        """Send an async body until it ends, stalls or the client disconnects"""
+        content_type, extra_headers, body = route
+        self.streams += 1
+
+        async def pump():
+            try:
+                async for chunk in body:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    await asyncio.wait_for(send({'type': 'http.response.body', 'body': chunk,
+                                                 'more_body': True}), self.send_timeout)
+                    # Sends to a gone client return at once, and wait_for can
+                    # swallow a cancel that lands in the same step
+                    if watcher.done():
+                        return
+            finally:
+                # Run the generator's cleanup now rather than at GC
+                await body.aclose()
+
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', content_type.encode()),
+                            (b'access-control-allow-origin', b'*')] +
+                           [(name.encode(), value.encode()) for name, value in extra_headers.items()]
+            })
+            sender = asyncio.ensure_future(pump())
+            watcher = asyncio.ensure_future(self._wait_disconnect(receive))
+            done, _ = await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            for task in (sender, watcher):
+                task.cancel()
+            await asyncio.gather(sender, watcher, return_exceptions=True)
+            if sender in done and not sender.cancelled():
+                error = sender.exception()
+                if isinstance(error, asyncio.TimeoutError):
+                    self.stalled += 1
+                    logger.info(f"Dropped stream client stalled for {self.send_timeout:g}s")
+                elif error is None:
+                    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except OSError:
+            # Client went away while sending
+            pass
+        finally:
+            self.streams -= 1
+
+    async def _wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def _wsgi(self, scope, receive, send):
+        """Run the WSGI app on the thread pool, streaming its response body"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            await self._respond(send, 503, {'status': 'error', 'message': 'Server busy'})
+            return
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        executor = self._start_executor()
+        self.pending += 1
+        iterator = None
+        # Sends to a gone client do not fail, so watch for the disconnect
+        watcher = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            status, headers, iterator = await loop.run_in_executor(
+                executor, self._call_wsgi, self._environ(scope, bytes(body)))
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            while True:
+                if watcher.done():
+                    self.aborted += 1
+                    return
+                chunk = await loop.run_in_executor(executor, next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except OSError:
+            self.aborted += 1
+        finally:
+            self.pending -= 1
+            watcher.cancel()
+            if iterator is not None:
+                # Runs the app's cleanup (e.g. closes an export's cursor)
+                await loop.run_in_executor(executor, iterator.close)
+
+    def _call_wsgi(self, environ):
+        """Call the WSGI app (pool thread), returns status, headers and body iterator"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        result = self.wsgi_app(environ, start_response)
+
+        def body():
+            try:
+                yield from result
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        return response['status'], response['headers'], body()
+
+    def _environ(self, scope, body):
+        """WSGI environ for an ASGI HTTP scope"""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+            'PATH_INFO': scope['path'].encode().decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    async def _respond(self, send, status, payload):
+        body = json.dumps(payload).encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def get_stats(self):
+        """Get connection and thread pool counters"""
+        return {
+            'streams': self.streams,
+            'pending': self.pending,
+            'max_threads': self.max_threads,
+            'requests': self.requests,
+            'rejected': self.rejected,
+            'stalled': self.stalled,
+            'aborted': self.aborted,
+            'threads': threading.active_count()
+        }
+
+def serve(asgi_app, host='0.0.0.0', port=5000, log_level='info'):
+    """Serve an ASGI app with uvicorn (blocks)"""
+    if uvicorn is None:
+        raise RuntimeError("Async serving requires uvicorn (pip install uvicorn)")
+    uvicorn.run(asgi_app, host=host, port=port, log_level=log_level,
+                lifespan='on', backlog=2048)
@@ -0,0 +1,403 @@
+import argparse
+import json
+import math
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import cv2
+
+from object_detector import ObjectDetector
+from object_categories import enrich_objects
+from process_pool import ProcessPoolDetector
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.mjpeg', '.mjpg', '.m4v')
+
+# Markers passed down the pipeline after a source's last frame
+END = 'end'
+FAILED = 'failed'
+
+def find_sources(paths):
+    """Expand input paths into (name, kind, target) sources.
+
+    A video file is one source. A directory contributes its images,
+    in name order, as one source and each video in it as another.
+    """
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.listdir(path))
+            images = [os.path.join(path, name) for name in names
+                      if name.lower().endswith(IMAGE_EXTENSIONS)]
+            if images:
+                sources.append((path, 'images', images))
+            sources.extend((os.path.join(path, name), 'video', os.path.join(path, name))
+                           for name in names if name.lower().endswith(VIDEO_EXTENSIONS))
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            sources.append((path, 'images', [path]))
+        else:
+            sources.append((path, 'video', path))
+    return sources
+
+def scale_detections(detected, scale_x, scale_y):
+    """Map detections from a resized frame back to the original frame size"""
+    for obj in detected:
+        x, y, w, h = obj['bbox']
+        x, y, w, h = int(x * scale_x), int(y * scale_y), int(w * scale_x), int(h * scale_y)
+        obj['bbox'] = [x, y, w, h]
+        obj['area'] = w * h
+        obj['center'] = [int(x + w/2), int(y + h/2)]
+    return detected
+
+class BatchProcessor:
+    """Offline detection over video files and image folders.
+
+    Three stages run concurrently over bounded queues: a decode thread
+    reads frames, the calling thread runs inference (batched forward
+    passes in process, or frames spread over a ProcessPoolDetector), and
+    a writer thread appends one JSON line per frame in the /get_detections
+    schema. Results are written in input order, and after each flush the
+    checkpoint records the output size and the next frame of every
+    source, so an interrupted run resumes where its output ends. Frames
+    too large for the pool's shared-memory slots are downscaled to fit and
+    their boxes mapped back, so one 4K video cannot abort the whole run.
+    """
+    def __init__(self, detector, output, pool=None, batch_size=4, every=1,
+                 decode_threads=4, queue_size=32, checkpoint_interval=5.0, report_interval=5.0):
+        self.detector = detector
+        self.output = output
+        self.checkpoint_path = output + '.checkpoint.json'
+        self.pool = pool
+        self.batch_size = batch_size
+        self.every = max(1, every)
+        self.decode_threads = decode_threads
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue(maxsize=queue_size)
+        self.checkpoint_interval = checkpoint_interval
+        self.report_interval = report_interval
+        self.stopping = threading.Event()
+        self.progress = {}
+
+        # Counters
+        self.frames_decoded = 0
+        self.frames_written = 0
+        self.frames_resized = 0
+        self.frames_failed = 0
+        self.objects_found = 0
+        self.decode_seconds = 0.0
+        self.inference_seconds = 0.0
+        self.started_at = None
+
+    def load_checkpoint(self):
+        """Restore progress and cut the output back to its checkpointed size"""
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return False
+        self.progress = checkpoint['sources']
+        if os.path.exists(self.output):
+            with open(self.output, 'r+b') as f:
+                f.truncate(checkpoint['output_bytes'])
+        logger.info(f"Resuming from {self.checkpoint_path}: "
+                    f"{sum(1 for p in self.progress.values() if p['done'])} sources done")
+        return True
+
+    def save_checkpoint(self, out):
+        """Flush the output, then atomically record how far it goes"""
+        out.flush()
+        os.fsync(out.fileno())
+        checkpoint = {'output_bytes': out.tell(), 'sources': self.progress}
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def _put(self, target, item):
+        """Put onto a bounded queue unless the run is being stopped"""
+        while not self.stopping.is_set():
+            try:
+                target.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_video(self, path, first):
+        """Yield (index, timestamp, frame) from a video, starting at frame first"""
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise OSError(f"Cannot open video {path}")
+        try:
+            index = 0
+            if first:
+                # Seeking is not frame-exact for every codec; verify, else skip by grabbing
+                capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+                if int(capture.get(cv2.CAP_PROP_POS_FRAMES)) == first:
+                    index = first
+                else:
+                    capture.release()
+                    capture = cv2.VideoCapture(path)
+            while True:
+                if index < first or index % self.every:
+                    if not capture.grab():
+                        break
+                    index += 1
+                    continue
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                yield index, capture.get(cv2.CAP_PROP_POS_MSEC) / 1000, frame
+                index += 1
+        finally:
+            capture.release()
+
+    def _read_images(self, files, first):
+        """Yield (index, mtime, frame) from image files, decoding in parallel"""
+        selected = [(index, path) for index, path in enumerate(files)
+                    if index >= first and index % self.every == 0]
+        with ThreadPoolExecutor(self.decode_threads) as executor:
+            # map keeps input order and reads at most a window of files ahead
+            for start in range(0, len(selected), self.decode_threads * 4):
+                window = selected[start:start + self.decode_threads * 4]
+                for (index, path), frame in zip(window, executor.map(
+                        lambda item: cv2.imread(item[1], cv2.IMREAD_COLOR), window)):
+                    if frame is None:
+                        logger.warning(f"Skipping unreadable image {path}")
+                        continue
+                    yield index, os.path.getmtime(path), frame
+
+    def _decode(self, sources):
+        """Decode thread: frames of every unfinished source, then END per source"""
+        try:
+            for name, kind, target in sources:
+                progress = self.progress[name]
+                if progress['done']:
+                    continue
+                reader = (self._read_video(target, progress['next']) if kind == 'video'
+                          else self._read_images(target, progress['next']))
+                marker = END
+                try:
+                    started = time.perf_counter()
+                    for index, timestamp, frame in reader:
+                        self.decode_seconds += time.perf_counter() - started
+                        self.frames_decoded += 1
+                        item = {'source': name, 'frame': index, 'timestamp': timestamp}
+                        if kind == 'images':
+                            item['file'] = target[index]
+                        if not self._put(self.frames, (item, frame)):
+                            return
+                        started = time.perf_counter()
+                except OSError as e:
+                    logger.error(f"Cannot process {name}: {e}")
+                    marker = FAILED
+                if not self._put(self.frames, (marker, name)):
+                    return
+        finally:
+            # Let the inference stage finish (it no longer reads once stopping)
+            if not self.stopping.is_set():
+                self.frames.put(None)
+
+    def _take_batch(self):
+        """Next batch of frames, stopping early at a source marker or the end"""
+        batch = [self.frames.get()]
+        while (len(batch) < self.batch_size and batch[-1] is not None
+               and not isinstance(batch[-1][0], str)):
+            try:
+                batch.append(self.frames.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _infer(self):
+        """Inference stage: forward results (or Futures) to the writer in order"""
+        while True:
+            batch = self._take_batch()
+            tail = batch[-1] if batch[-1] is None or isinstance(batch[-1][0], str) else False
+            frames = batch[:-1] if tail is not False else batch
+
+            if frames:
+                started = time.perf_counter()
+                if self.pool is not None:
+                    detected = [self._submit(frame) for _, frame in frames]
+                else:
+                    detected = self.detector.detect_batch([frame for _, frame in frames])
+                self.inference_seconds += time.perf_counter() - started
+                for (item, _), result in zip(frames, detected):
+                    self._put(self.results, (item, result))
+
+            if tail is None:
+                return
+            if tail is not False:
+                self._put(self.results, tail)
+
+    def _submit(self, frame):
+        """Submit a frame to the pool, downscaling it if it exceeds a slot"""
+        try:
+            return self.pool.submit(frame)
+        except ValueError:
+            pass
+        height, width = frame.shape[:2]
+        factor = math.sqrt(self.pool.max_frame_bytes / frame.nbytes)
+        size = (max(1, int(width * factor)), max(1, int(height * factor)))
+        if self.frames_resized == 0:
+            logger.warning(f"Frames of {width}x{height} exceed --max-frame; "
+                           f"detecting on {size[0]}x{size[1]} copies")
+        self.frames_resized += 1
+        resized = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+        scaled = Future()
+        def done(future):
+            try:
+                scaled.set_result(scale_detections(future.result(), width / size[0], height / size[1]))
+            except Exception as e:
+                scaled.set_exception(e)
+        self.pool.submit(resized).add_done_callback(done)
+        return scaled
+
+    def _write(self):
+        """Writer thread: one JSON line per frame, periodic checkpoints"""
+        last_checkpoint = last_report = time.time()
+        reported = 0
+        with open(self.output, 'a') as out:
+            while True:
+                entry = self.results.get()
+                if entry is None:
+                    break
+                first, second = entry
+                if first in (END, FAILED):
+                    self.progress[second]['done'] = True
+                    # A source stays failed if any of its frames failed
+                    self.progress[second]['failed'] = (first == FAILED or
+                                                       self.progress[second].get('failed', False))
+                    continue
+
+                item, detected = first, second
+                if isinstance(detected, Future):
+                    try:
+                        detected = detected.result()
+                    except Exception as e:
+                        # e.g. BrokenProcessPool: record the frame as failed and go on
+                        logger.error(f"Detection failed for {item['source']} frame {item['frame']}: {e}")
+                        out.write(json.dumps({'status': 'error', **item, 'message': str(e)}) + '\n')
+                        self.progress[item['source']]['next'] = item['frame'] + 1
+                        self.progress[item['source']]['failed'] = True
+                        self.frames_failed += 1
+                        continue
+                objects = enrich_objects(detected)
+                out.write(json.dumps({
+                    'status': 'success',
+                    **item,
+                    'count': len(objects),
+                    'objects': objects
+                }) + '\n')
+                self.progress[item['source']]['next'] = item['frame'] + 1
+                self.frames_written += 1
+                self.objects_found += len(objects)
+
+                now = time.time()
+                if now - last_checkpoint >= self.checkpoint_interval:
+                    self.save_checkpoint(out)
+                    last_checkpoint = now
+                if now - last_report >= self.report_interval:
+                    logger.info(f"{self.frames_written} frames, "
+                                f"{(self.frames_written - reported) / (now - last_report):.1f} fps "
+                                f"(queued: {self.frames.qsize()} decoded, {self.results.qsize()} results)")
+                    last_report, reported = now, self.frames_written
+            self.save_checkpoint(out)
+
+    def run(self, sources, resume=True):
+        """Process all sources, returns the run summary"""
+        if not (resume and self.load_checkpoint()) and os.path.exists(self.output):
+            os.remove(self.output)
+        for name, _, _ in sources:
+            self.progress.setdefault(name, {'next': 0, 'done': False})
+        self.started_at = time.time()
+        decoder = threading.Thread(target=self._decode, args=(sources,), name='batch-decode', daemon=True)
+        writer = threading.Thread(target=self._write, name='batch-writer', daemon=True)
+        decoder.start()
+        writer.start()
+        try:
+            self._infer()
+        except KeyboardInterrupt:
+            # Frames of the interrupted batch are lost, so stop the writer
+            # at what it already has; the checkpoint stays contiguous
+            logger.info("Interrupted, saving checkpoint")
+            self.stopping.set()
+        finally:
+            self.results.put(None)
+            writer.join()
+            self.stopping.set()
+            decoder.join(timeout=5)
+        return self.get_stats()
+
+    def get_stats(self):
+        """Get run counters"""
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            'frames': self.frames_written,
+            'objects': self.objects_found,
+            'frames_resized': self.frames_resized,
+            'frames_failed': self.frames_failed,
+            'sources_done': sum(1 for p in self.progress.values() if p['done']),
+            'sources_failed': sum(1 for p in self.progress.values() if p.get('failed')),
+            'elapsed': round(elapsed, 2),
+            'fps': round(self.frames_written / elapsed, 2) if elapsed else 0.0,
+            'decode_ms_per_frame': round(self.decode_seconds / self.frames_decoded * 1000, 2)
+            if self.frames_decoded else 0.0,
+            'inference_ms_per_frame': round(self.inference_seconds / self.frames_written * 1000, 2)
+            if self.frames_written and self.pool is None else None
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Run object detection over video files and image folders')
+    parser.add_argument('inputs', nargs='+', help='video files, images or directories')
+    parser.add_argument('-o', '--output', default='detections.ndjson',
+                        help='NDJSON output, one /get_detections record per frame')
+    parser.add_argument('--model', default='yolov3', choices=sorted(ObjectDetector.MODEL_PATHS))
+    parser.add_argument('--confidence', type=float, default=0.5)
+    parser.add_argument('--batch-size', type=int, default=4,
+                        help='frames per forward pass (in-process inference)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='inference worker processes (0 = batched in this process)')
+    parser.add_argument('--max-frame', default='1920x1080',
+                        help='largest frame size WxH the worker pool accepts')
+    parser.add_argument('--every', type=int, default=1, help='process every Nth frame')
+    parser.add_argument('--decode-threads', type=int, default=4)
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sources = find_sources(args.inputs)
+    if not sources:
+        parser.error('no video or image inputs found')
+
+    detector = ObjectDetector()
+    detector.confidence_threshold = args.confidence
+    pool = None
+    if args.workers > 0:
+        width, height = (int(v) for v in args.max_frame.lower().split('x'))
+        pool = ProcessPoolDetector(detector, workers=args.workers, model_name=args.model,
+                                   max_frame_shape=(height, width, 3))
+        if not pool.start():
+            logger.warning("Not every inference worker started")
+    elif not detector.load_model(args.model):
+        parser.exit(1, f"Could not load model {args.model}\n")
+
+    processor = BatchProcessor(detector, args.output, pool=pool, batch_size=args.batch_size,
+                               every=args.every, decode_threads=args.decode_threads)
+    try:
+        stats = processor.run(sources, resume=not args.restart)
+    finally:
+        if pool is not None:
+            pool.close()
+    logger.info(f"Done: {json.dumps(stats)}")
+
+if __name__ == '__main__':
+    main()
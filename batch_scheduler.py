@@ -0,0 +1,157 @@
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future
+from frame_ring import PIXEL_FORMAT_BGR
+
+logger = logging.getLogger(__name__)
+
+class BatchScheduler:
+    """Gather frames from several sources into batched forward passes.
+
+    Callers submit frames and get a Future back. A worker thread waits for
+    the first pending frame, then keeps collecting until either
+    max_batch_size frames are queued, every recently seen source has a frame
+    waiting, or max_delay seconds have passed, and runs them through
+    ObjectDetector.detect_batch in one go.
+
+    Each source keeps at most one pending frame: submitting a newer frame
+    cancels the older Future so a slow model never builds up a backlog.
+    """
+    def __init__(self, detector, max_batch_size=4, max_delay=0.02, source_timeout=2.0):
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.source_timeout = source_timeout
+
+        self.cond = threading.Condition()
+        self.pending = deque()
+        self.sources = {}
+        self.running = False
+        self.thread = None
+
+        # Counters
+        self.batches = 0
+        self.frames = 0
+        self.superseded = 0
+        self.total_wait = 0.0
+        self.total_forward = 0.0
+
+    def start(self):
+        """Start the batching worker (idempotent)"""
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+            self.thread.start()
+        logger.info(f"Batch scheduler started (max batch {self.max_batch_size}, "
+                    f"max delay {self.max_delay * 1000:.0f} ms)")
+
+    def stop(self):
+        """Stop the worker and cancel pending frames"""
+        with self.cond:
+            if not self.running:
+                return
+            self.running = False
+            for _, _, _, future, _ in self.pending:
+                future.cancel()
+            self.pending.clear()
+            self.cond.notify_all()
+        self.thread.join(timeout=2)
+
+    def submit(self, frame, source='default', pixel_format=PIXEL_FORMAT_BGR):
+        """Queue a frame for detection, returns a Future of the detections"""
+        future = Future()
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("Batch scheduler is not running")
+
+            # Latest frame wins per source
+            for i, (pending_source, _, _, pending_future, _) in enumerate(self.pending):
+                if pending_source == source:
+                    pending_future.cancel()
+                    del self.pending[i]
+                    self.superseded += 1
+                    break
+
+            self.pending.append((source, frame, pixel_format, future, time.perf_counter()))
+            self.sources[source] = time.time()
+            self.cond.notify()
+        return future
+
+    def detect(self, frame, source='default', timeout=None, pixel_format=PIXEL_FORMAT_BGR):
+        """Submit a frame and wait for its detections"""
+        return self.submit(frame, source, pixel_format).result(timeout)
+
+    def _active_sources(self):
+        """Number of sources that submitted recently"""
+        cutoff = time.time() - self.source_timeout
+        for source in [s for s, seen in self.sources.items() if seen < cutoff]:
+            del self.sources[source]
+        return len(self.sources)
+
+    def _collect(self):
+        """Wait for a batch to fill up or its deadline to pass"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.pending or not self.running)
+            if not self.running:
+                return []
+
+            deadline = time.perf_counter() + self.max_delay
+            target = min(self.max_batch_size, max(1, self._active_sources()))
+            while self.running and len(self.pending) < target:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            batch = []
+            while self.pending and len(batch) < self.max_batch_size:
+                batch.append(self.pending.popleft())
+            return batch
+
+    def _run(self):
+        """Worker loop"""
+        while self.running:
+            batch = self._collect()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            frames = [frame for _, frame, _, _, _ in batch]
+            pixel_formats = [pixel_format for _, _, pixel_format, _, _ in batch]
+            try:
+                results = self.detector.detect_batch(frames, pixel_formats)
+            except Exception as e:
+                logger.error(f"Batch inference error: {e}")
+                results = [[] for _ in frames]
+            finished = time.perf_counter()
+
+            for (_, _, _, future, queued_at), detected in zip(batch, results):
+                self.total_wait += started - queued_at
+                if future.set_running_or_notify_cancel():
+                    future.set_result(detected)
+
+            self.batches += 1
+            self.frames += len(batch)
+            self.total_forward += finished - started
+
+    def get_stats(self):
+        """Get batching counters"""
+        with self.cond:
+            depth = len(self.pending)
+            sources = len(self.sources)
+        batches = self.batches or 1
+        frames = self.frames or 1
+        return {
+            'batches': self.batches,
+            'frames': self.frames,
+            'avg_batch_size': round(self.frames / batches, 2),
+            'avg_wait_ms': round(self.total_wait / frames * 1000, 2),
+            'avg_forward_ms': round(self.total_forward / batches * 1000, 2),
+            'superseded': self.superseded,
+            'queue_depth': depth,
+            'sources': sources
+        }
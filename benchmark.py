@@ -0,0 +1,662 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import time
+import logging
+import tracemalloc
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+from object_detector import ObjectDetector
+from process_pool import ProcessPoolDetector
+from frame_pipeline import FramePipeline
+from frame_ring import FrameRing
+from camera_handler import CameraHandler
+from camera_sources import MJPEGStreamSource
+from stream_encoder import TIER_NAMES, tier_index
+
+# YOLOv3 at 416x416: three output scales, 3 anchors each, 85 values per row
+YOLO_OUTPUT_SHAPES = [(13 * 13 * 3, 85), (26 * 26 * 3, 85), (52 * 52 * 3, 85)]
+
+def make_yolo_outputs(seed=0, shapes=YOLO_OUTPUT_SHAPES):
+    """Build deterministic synthetic YOLO output tensors"""
+    rng = np.random.default_rng(seed)
+    outputs = []
+    for rows, cols in shapes:
+        output = np.empty((rows, cols), dtype=np.float32)
+        output[:, 0:2] = rng.random((rows, 2))
+        output[:, 2:4] = rng.random((rows, 2)) * 0.3
+        output[:, 4] = rng.random(rows)
+        # Background noise everywhere, a confident class on ~2% of rows
+        output[:, 5:] = rng.random((rows, cols - 5)) * 0.05
+        hits = rng.choice(rows, rows // 50, replace=False)
+        output[hits, 5 + rng.integers(0, cols - 5, len(hits))] = rng.random(len(hits))
+        outputs.append(output)
+    return outputs
+
+class StubNet:
+    """Stand-in for cv2.dnn.Net that returns fixed synthetic YOLO outputs"""
+    def __init__(self, seed=0):
+        self.outputs = tuple(make_yolo_outputs(seed))
+        self.batch_outputs = {1: self.outputs}
+
+    def getUnconnectedOutLayersNames(self):
+        return ('yolo_82', 'yolo_94', 'yolo_106')
+
+    def setInput(self, blob):
+        self.batch_size = blob.shape[0]
+
+    def forward(self, output_layers):
+        if self.batch_size not in self.batch_outputs:
+            self.batch_outputs[self.batch_size] = tuple(
+                np.concatenate([output] * self.batch_size) for output in self.outputs)
+        return self.batch_outputs[self.batch_size]
+
+def decode_outputs_loop(outputs, width, height, confidence_threshold):
+    """Reference per-row decode loop (the original detect_objects code)"""
+    boxes = []
+    confidences = []
+    class_ids = []
+
+    for output in outputs:
+        for detection in output:
+            scores = detection[5:]
+            class_id = np.argmax(scores)
+            confidence = scores[class_id]
+
+            if confidence > confidence_threshold:
+                center_x = int(detection[0] * width)
+                center_y = int(detection[1] * height)
+                w = int(detection[2] * width)
+                h = int(detection[3] * height)
+
+                x = int(center_x - w / 2)
+                y = int(center_y - h / 2)
+
+                boxes.append([x, y, w, h])
+                confidences.append(float(confidence))
+                class_ids.append(class_id)
+
+    return boxes, confidences, class_ids
+
+def time_call(func, repeat):
+    """Return best-of-N wall time in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+def check_decode_parity(detector, outputs, width, height):
+    """Assert the vectorized decoder matches the reference loop"""
+    ref_boxes, ref_conf, ref_ids = decode_outputs_loop(
+        outputs, width, height, detector.confidence_threshold)
+    boxes, confidences, class_ids = detector.decode_outputs(outputs, width, height)
+
+    assert boxes.tolist() == ref_boxes, "box mismatch"
+    assert class_ids.tolist() == [int(c) for c in ref_ids], "class id mismatch"
+    assert np.allclose(confidences, ref_conf), "confidence mismatch"
+
+    # Same result when decoding into a model's reusable buffers
+    if detector.context is not None:
+        ctx_boxes, _, ctx_ids = detector.decode_outputs(
+            outputs, width, height, detector.context)
+        assert ctx_boxes.tolist() == ref_boxes, "buffered box mismatch"
+        assert ctx_ids.tolist() == class_ids.tolist(), "buffered class id mismatch"
+    return len(ref_boxes)
+
+def bench_decode(args):
+    """Compare loop and vectorized YOLO decoding across thresholds"""
+    detector = ObjectDetector()
+    detector.use_net(StubNet(args.seed), 'stub')
+    outputs = make_yolo_outputs(args.seed)
+    width, height = 640, 480
+    rows = sum(len(o) for o in outputs)
+
+    print(f"YOLO decode: {rows} rows, {width}x{height}, best of {args.repeat}")
+    print(f"{'threshold':>9} {'boxes':>6} {'loop ms':>9} {'numpy ms':>9} "
+          f"{'speedup':>8} {'+nms ms':>8}")
+
+    for threshold in args.thresholds:
+        detector.confidence_threshold = threshold
+        count = check_decode_parity(detector, outputs, width, height)
+
+        loop_ms = time_call(
+            lambda: decode_outputs_loop(outputs, width, height, threshold), args.repeat)
+        numpy_ms = time_call(
+            lambda: detector.decode_outputs(outputs, width, height), args.repeat)
+        total_ms = time_call(
+            lambda: detector.process_outputs(outputs, width, height), args.repeat)
+
+        print(f"{threshold:>9.2f} {count:>6} {loop_ms:>9.2f} {numpy_ms:>9.2f} "
+              f"{loop_ms / numpy_ms:>7.1f}x {total_ms:>8.2f}")
+
+def bench_alloc(args):
+    """Track Python-visible allocations per detect_objects call"""
+    detector = ObjectDetector()
+    detector.use_net(StubNet(args.seed), 'stub')
+    rng = np.random.default_rng(args.seed)
+    frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+
+    # Warm up so lazily sized decoder buffers exist
+    detector.detect_objects(frame)
+
+    print(f"detect_objects on a stub network, {args.frames} frames, 640x480")
+    print("Transient Python/NumPy heap growth per frame (tracemalloc)")
+    print(f"{'threshold':>9} {'mean KiB':>9} {'max KiB':>8}")
+    for threshold in args.thresholds:
+        detector.confidence_threshold = threshold
+        peaks = []
+        tracemalloc.start()
+        for _ in range(args.frames):
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            detector.detect_objects(frame)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - base) / 1024)
+        tracemalloc.stop()
+
+        print(f"{threshold:>9.2f} {np.mean(peaks):>9.1f} {max(peaks):>8.1f}")
+
+class PassCounter:
+    """Count OpenCV calls that read or write a full camera frame"""
+    FUNCTIONS = [
+        (cv2, 'cvtColor'),
+        (cv2, 'resize'),
+        (cv2, 'imencode'),
+        (cv2.dnn, 'blobFromImage'),
+        (cv2.dnn, 'blobFromImages')
+    ]
+
+    def __init__(self, frame_shape):
+        self.frame_shape = tuple(frame_shape[:2])
+        self.counts = Counter()
+        self.originals = []
+
+    def _wrap(self, name, func):
+        def wrapper(*args, **kwargs):
+            for arg in list(args) + list(kwargs.values()):
+                frames = arg if isinstance(arg, (list, tuple)) else [arg]
+                if any(isinstance(f, np.ndarray) and f.shape[:2] == self.frame_shape
+                       for f in frames):
+                    self.counts[name] += 1
+                    break
+            return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        for module, name in self.FUNCTIONS:
+            func = getattr(module, name)
+            self.originals.append((module, name, func))
+            setattr(module, name, self._wrap(name, func))
+        return self
+
+    def __exit__(self, *exc):
+        for module, name, func in self.originals:
+            setattr(module, name, func)
+        self.originals = []
+
+def legacy_stream_frame(detector, raw):
+    """Original per-frame path: BGR->RGB on capture, swapRB blob, encode"""
+    frame = cv2.cvtColor(raw, cv2.COLOR_BGR2RGB)
+    cv2.dnn.blobFromImage(frame, 1/255.0, (416, 416), swapRB=True, crop=False)
+    cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+
+def bench_passes(args):
+    """Count full-frame passes per streamed frame, old path vs current"""
+    detector = ObjectDetector()
+    detector.use_net(StubNet(args.seed), 'stub')
+    rng = np.random.default_rng(args.seed)
+    raw = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+
+    # Capture writes BGR into a ring slot in place (stands in for cap.read)
+    ring = FrameRing(raw.shape)
+    pipeline = FramePipeline(None, detector, is_active=lambda: True)
+
+    def current_stream_frame():
+        index, slot = ring.next_slot()
+        slot[...] = raw
+        ring.commit(index)
+        ref = ring.latest()
+        detected = detector.detect_objects(ref.frame, ref.pixel_format)
+        with pipeline.detections_lock:
+            pipeline.latest_detections = detected
+        pipeline.encode_frame(ref.frame, ref.pixel_format)
+
+    print(f"Full-frame OpenCV passes per streamed frame, {args.frames} frames, 640x480")
+    for label, step in (('legacy', lambda: legacy_stream_frame(detector, raw)),
+                        ('current', current_stream_frame)):
+        with PassCounter(raw.shape) as counter:
+            for _ in range(args.frames):
+                step()
+        total = sum(counter.counts.values()) / args.frames
+        detail = ', '.join(f"{name}={count / args.frames:g}"
+                           for name, count in sorted(counter.counts.items()))
+        print(f"{label:>8}: {total:g} passes ({detail})")
+    print("The legacy path also streamed RGB data as BGR JPEGs (swapped colours).")
+
+class FakeMJPEGServer:
+    """Local stand-in for an ESP32 unit's /stream endpoint.
+
+    Serves the given JPEG payloads in a loop as multipart/x-mixed-replace,
+    in the same wire format as esp32_camera.ino (no part Content-Length)
+    unless content_length=True. fps=0 sends as fast as the socket allows.
+    With drop_after, each connection is closed after that many parts, like
+    a unit that reboots or loses WiFi.
+    """
+    def __init__(self, jpegs, fps=0, content_length=False, drop_after=None):
+        self.jpegs = jpegs
+        self.fps = fps
+        self.content_length = content_length
+        self.drop_after = drop_after
+        self.connections = 0
+        self.server = None
+
+    def __enter__(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+                fake.connections += 1
+                index = 0
+                try:
+                    while fake.drop_after is None or index < fake.drop_after:
+                        jpeg = fake.jpegs[index % len(fake.jpegs)]
+                        header = b'--frame\r\nContent-Type: image/jpeg\r\n'
+                        if fake.content_length:
+                            header += b'Content-Length: %d\r\n' % len(jpeg)
+                        self.wfile.write(header + b'\r\n' + jpeg + b'\r\n')
+                        index += 1
+                        if fake.fps:
+                            time.sleep(1 / fake.fps)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/stream'
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def make_jpegs(count, shape=(480, 640, 3)):
+    """Encode frames whose pixel value is their index"""
+    return [cv2.imencode('.jpg', np.full(shape, index * 8 % 256, dtype=np.uint8))[1].tobytes()
+            for index in range(count)]
+
+def bench_mjpeg(args):
+    """MJPEG client parse/decode cost and decode-on-demand under load"""
+    jpegs = make_jpegs(16)
+    print(f"MJPEG client, 640x480 JPEG parts of ~{len(jpegs[0]) // 1024} KB, {args.frames} frames")
+    # Payload parity is covered by tests/test_mjpeg_source.py
+    for content_length in (False, True):
+        with FakeMJPEGServer(jpegs, content_length=content_length) as server:
+            label = 'content-length' if content_length else 'boundary scan'
+            source = MJPEGStreamSource(server.url)
+            grab = time_call(lambda: [source.grab() for _ in range(args.frames)], args.repeat)
+            decode = time_call(lambda: [source.read() for _ in range(args.frames)], args.repeat)
+            source.release()
+            print(f"{label:>15}: parse {grab / args.frames:.3f} ms/frame, "
+                  f"parse+decode {decode / args.frames:.3f} ms/frame")
+
+    # A camera unit at 30 FPS whose capture thread stalls for half a
+    # second: frames drained after the stall must never reach the decoder
+    with FakeMJPEGServer(jpegs, fps=30) as server:
+        camera = CameraHandler()
+        camera.initialize(server.url)
+        last_seq = 0
+        deadline = time.time() + 2
+        while time.time() < deadline:
+            ref = camera.wait_frame(last_seq, timeout=1.0)
+            if ref is not None:
+                last_seq = ref.seq
+        camera.stop()
+        time.sleep(0.5)
+        camera.start()
+        time.sleep(0.5)
+        stats = camera.get_stats()
+        camera.release()
+    stream = stats['stream'] or {}
+    print(f"After a 0.5s stall: received {stream.get('frames_received')}, "
+          f"decoded {stream.get('frames_decoded')}, "
+          f"skipped undecoded {stream.get('frames_skipped')}, "
+          f"camera drops {stats['frames_dropped']}")
+
+def draw_detections_legacy(detector, frame, detections):
+    """Reference overlay: per-box class lookup and text measuring"""
+    height = frame.shape[0]
+    for obj in detections:
+        x, y, w, h = obj['bbox']
+        class_id = detector.classes.index(obj['class']) if obj['class'] in detector.classes else 0
+        color = [int(c) for c in detector.colors[class_id]]
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+        label = f"{obj['class']}: {obj['confidence']:.2f}"
+        (label_width, label_height), baseline = cv2.getTextSize(
+            label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+        cv2.rectangle(frame, (x, y - label_height - baseline - 10), (x + label_width, y), color, -1)
+        cv2.putText(frame, label, (x, y - baseline - 5), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.5, (255, 255, 255), 1)
+        cv2.circle(frame, tuple(obj['center']), 3, color, -1)
+    cv2.putText(frame, f"Objects: {len(detections)} | Model: {detector.current_model}",
+                (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+    return frame
+
+def make_detections(detector, count, rng, shape=(480, 640)):
+    """Random detections spread over the frame, some touching its edges"""
+    detections = []
+    for _ in range(count):
+        w, h = (int(v) for v in rng.integers(20, 200, 2))
+        x = int(rng.integers(-20, shape[1] - w // 2))
+        y = int(rng.integers(-10, shape[0] - h // 2))
+        detections.append({
+            'class': detector.classes[int(rng.integers(0, len(detector.classes)))],
+            'confidence': float(rng.uniform(0.5, 1.0)),
+            'bbox': [x, y, w, h],
+            'center': [x + w // 2, y + h // 2]
+        })
+    return detections
+
+def bench_overlay(args):
+    """Legacy in-place drawing vs the cached-sprite overlay renderer"""
+    detector = ObjectDetector()
+    detector.current_model = 'stub'
+    rng = np.random.default_rng(args.seed)
+    frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    scenes = [make_detections(detector, 10, rng) for _ in range(args.frames)]
+
+    # Pixel parity with the legacy drawing is covered by tests/test_overlay.py
+    print(f"Overlay drawing over {args.frames} scenes x 10 boxes")
+    canvas = frame.copy()
+    legacy = time_call(lambda: [draw_detections_legacy(detector, np.copyto(canvas, frame) or canvas, d)
+                                for d in scenes], args.repeat)
+    current = time_call(lambda: [detector.draw_detections(np.copyto(canvas, frame) or canvas, d)
+                                 for d in scenes], args.repeat)
+    print(f"  legacy : {legacy / args.frames:.3f} ms/frame (copy + draw)")
+    print(f"  sprites: {current / args.frames:.3f} ms/frame (copy + cached sprites)")
+
+    # Per-tier compositing on top of resized frames, as the stream does
+    pipeline = FramePipeline(None, detector, is_active=lambda: True)
+    with pipeline.detections_lock:
+        pipeline.latest_detections = scenes[0]
+    for tiers in ([0], [0, 1, 2, 3]):
+        elapsed = time_call(lambda: pipeline.encode_tiers(frame, 'BGR', tiers), args.repeat)
+        print(f"  encode tiers {tiers}: {elapsed:.3f} ms/frame")
+    print(f"  sprite cache: {detector.overlay.get_stats()}")
+
+def make_detector(model, seed=0):
+    """Detector on the model's weights if present (CPU only), else a stub network"""
+    detector = ObjectDetector()
+    paths = ObjectDetector.MODEL_PATHS.get(model, {})
+    if paths and all(os.path.exists(path) for path in paths.values()):
+        ctx = detector.build_context(model)
+        ctx.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        ctx.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        detector.use_context(ctx)
+    else:
+        detector.use_net(StubNet(seed), 'stub')
+    return detector
+
+def memory_mb():
+    """Current and peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        current = None
+    return {'rss_mb': round(current, 1) if current is not None else None,
+            'peak_rss_mb': round(peak, 1)}
+
+def percentiles(samples):
+    """p50/p95/p99 of a list of millisecond samples"""
+    if not samples:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 2), 'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2)}
+
+class PipelineStreamServer:
+    """Serve a FramePipeline's tier as /video_feed does, on a local port"""
+    def __init__(self, pipeline, tier=0):
+        self.pipeline = pipeline
+        self.tier = tier
+        self.server = None
+
+    def __enter__(self):
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+                subscriber = owner.pipeline.subscribe(owner.tier, adaptive=False)
+                try:
+                    while True:
+                        frame_bytes = subscriber.get(timeout=1.0)
+                        if frame_bytes is None:
+                            continue
+                        self.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+                                         + frame_bytes + b'\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    owner.pipeline.unsubscribe(subscriber)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/video_feed'
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def stream_client(url, deadline, result):
+    """Receive stream parts until deadline, recording inter-frame gaps"""
+    source = MJPEGStreamSource(url)
+    gaps, received, last = [], 0, None
+    try:
+        while time.time() < deadline and source.grab():
+            now = time.perf_counter()
+            if last is not None:
+                gaps.append((now - last) * 1000)
+            last = now
+            received += len(source.jpeg)
+    finally:
+        source.release()
+    result.update(frames=len(gaps) + (last is not None), bytes=received, gaps=gaps)
+
+def compare_results(results, baseline, tolerance):
+    """Regressions of results against a baseline run, as readable lines"""
+    regressions = []
+    for name, stage in results['stages'].items():
+        before = baseline.get('stages', {}).get(name)
+        if before and before['p95_ms'] and stage['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name} p95 {before['p95_ms']} -> {stage['p95_ms']} ms")
+    for key in ('capture_fps', 'inference_fps', 'client_fps'):
+        before = baseline.get('throughput', {}).get(key)
+        now = results['throughput'][key]
+        if before and now < before * (1 - tolerance):
+            regressions.append(f"{key} {before} -> {now}")
+    return regressions
+
+def bench_pipeline(args):
+    """End-to-end capture, detection, drawing, encoding and HTTP streaming"""
+    detector = make_detector(args.model, args.seed)
+    camera = CameraHandler()
+    camera.initialize(args.source)
+    pipeline = FramePipeline(camera, detector, is_active=lambda: True)
+    tier = tier_index(args.tier)
+
+    print(f"Pipeline: {args.source}, model {detector.current_model}, "
+          f"{args.clients} {args.tier} stream clients, {args.duration:g}s after {args.warmup:g}s warm-up")
+    with PipelineStreamServer(pipeline, tier) as server:
+        pipeline.start()
+        time.sleep(args.warmup)
+        for stats in pipeline.stats.values():
+            stats.reset()
+        frames_before = camera.frames_captured
+        memory_before = memory_mb()
+
+        deadline = time.time() + args.duration
+        clients = [{} for _ in range(args.clients)]
+        threads = [threading.Thread(target=stream_client, args=(server.url, deadline, result))
+                   for result in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        captured = camera.frames_captured - frames_before
+        stages = {name: stats.snapshot() for name, stats in pipeline.stats.items()}
+        pipeline.stop()
+    camera.release()
+
+    gaps = [gap for result in clients for gap in result['gaps']]
+    results = {
+        'benchmark': 'pipeline',
+        'timestamp': time.time(),
+        'config': {key: getattr(args, key) for key in
+                   ('source', 'model', 'clients', 'tier', 'duration', 'warmup', 'seed')},
+        'detector': detector.current_model,
+        'platform': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count()
+        },
+        'stages': {name: {key: stage[key] for key in
+                          ('count', 'avg_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')}
+                   for name, stage in stages.items()},
+        'throughput': {
+            'capture_fps': round(captured / args.duration, 2),
+            'inference_fps': round(stages['inference']['count'] / args.duration, 2),
+            'encode_fps': round(stages['encode']['count'] / args.duration, 2),
+            'client_fps': round(sum(r['frames'] for r in clients) / max(1, args.clients)
+                                / args.duration, 2),
+            'client_mbps': round(sum(r['bytes'] for r in clients) * 8 / 1e6 / args.duration, 2)
+        },
+        'stream_gap': percentiles(gaps),
+        'memory': {'before': memory_before, 'after': memory_mb()}
+    }
+
+    print(f"{'stage':>10} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, stage in results['stages'].items():
+        print(f"{name:>10} {stage['count']:>6} {stage['p50_ms']:>8.2f} {stage['p95_ms']:>8.2f} "
+              f"{stage['p99_ms']:>8.2f} {stage['max_ms']:>8.2f}")
+    gap = results['stream_gap']
+    print(f"{'stream gap':>10} {len(gaps):>6} {gap['p50_ms']:>8.2f} {gap['p95_ms']:>8.2f} "
+          f"{gap['p99_ms']:>8.2f}")
+    print("Throughput: " + ', '.join(f"{key} {value}" for key, value in results['throughput'].items()))
+    print(f"Memory: {results['memory']['before']} -> {results['memory']['after']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+def use_stub_net(detector):
+    """Pool worker initializer: detect on a stub network, no weights needed"""
+    detector.use_net(StubNet(), 'stub')
+
+def bench_pool(args):
+    """Pool throughput with stub-network workers across worker counts"""
+    detector = ObjectDetector()
+    detector.use_net(StubNet(args.seed), 'stub')
+    rng = np.random.default_rng(args.seed)
+    shape = (480, 640, 3)
+    frames = [rng.integers(0, 255, shape, dtype=np.uint8) for _ in range(args.frames)]
+    counts = args.workers or sorted({1, 2, 4, os.cpu_count() or 1})
+
+    print(f"ProcessPoolDetector.map on a stub network, {args.frames} frames, 640x480, "
+          f"best of {args.repeat}, {os.cpu_count()} CPUs")
+    in_process_ms = time_call(lambda: [detector.detect_objects(frame) for frame in frames],
+                              args.repeat)
+    baseline_fps = args.frames / (in_process_ms / 1000.0)
+    print(f"{'workers':>9} {'fps':>8} {'speedup':>8}")
+    print(f"{'none':>9} {baseline_fps:>8.1f} {1.0:>7.2f}x")
+    for workers in counts:
+        pool = ProcessPoolDetector(detector, workers=workers, model_name=None,
+                                   max_frame_shape=shape, initializer=use_stub_net)
+        try:
+            if not pool.start():
+                print(f"{workers:>9} failed to start")
+                continue
+            list(pool.map(frames[:workers * 2]))
+            pool_ms = time_call(lambda: list(pool.map(frames)), args.repeat)
+        finally:
+            pool.close()
+        fps = args.frames / (pool_ms / 1000.0)
+        print(f"{workers:>9} {fps:>8.1f} {fps / baseline_fps:>7.2f}x")
+
+BENCHMARKS = {
+    'alloc': bench_alloc,
+    'decode': bench_decode,
+    'mjpeg': bench_mjpeg,
+    'overlay': bench_overlay,
+    'passes': bench_passes,
+    'pipeline': bench_pipeline,
+    'pool': bench_pool
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='AI Scanner benchmarks')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--thresholds', type=float, nargs='+',
+                        default=[0.1, 0.3, 0.5, 0.7, 0.9])
+    parser.add_argument('--source', default='synthetic:640x480@30',
+                        help="pipeline: camera source, e.g. synthetic:1280x720@30 or replay:clip.mp4")
+    parser.add_argument('--model', default='yolov3',
+                        help='pipeline: model whose weights to use if present, else a stub network')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--clients', type=int, default=2)
+    parser.add_argument('--tier', default=TIER_NAMES[0], choices=TIER_NAMES)
+    parser.add_argument('--json', help='pipeline: write results to this file')
+    parser.add_argument('--baseline', help='pipeline: fail on regressions against this results file')
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        help='pool: worker counts to compare (default 1 2 4 and the CPU count)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    BENCHMARKS[args.benchmark](args)
+
+if __name__ == '__main__':
+    main()
@@ -1,81 +1,293 @@
 import cv2
 import numpy as np
+import threading
 import time
 import logging
+from frame_ring import FrameRing, PIXEL_FORMAT_BGR
+from camera_sources import open_source
+from frame_pipeline import StageStats
+import metrics
 
 logger = logging.getLogger(__name__)
 
 class CameraHandler:
-    def __init__(self):
+    """Background camera capture into a shared frame ring.
+
+    A single capture thread owns the device: it keeps only the newest
+    frame (draining anything the driver buffered), serves a simulated feed
+    while the camera is unavailable and reopens it with exponential
+    backoff after read failures. Readers only touch the ring, so they
+    never wait on camera I/O.
+
+    The source can be a local device index, an MJPEG URL such as an
+    ESP32 unit's /stream, or anything cv2.VideoCapture opens; see
+    camera_sources.open_source. name labels the capture metrics.
+    """
+    def __init__(self, ring_slots=8, shared_ring=False, reconnect_delay=0.5,
+                 max_reconnect_delay=30.0, max_read_failures=5, max_drain=5, name='camera'):
+        self.name = name
         self.cap = None
-        self.camera_index = 0
+        self.source = 0
         self.frame_width = 640
         self.frame_height = 480
         self.fps = 0
         self.last_fps_update = time.time()
         self.frame_count = 0
         self.connected = False
+        
+        # Reconnect with exponential backoff once a device was requested
+        self.device_requested = False
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_read_failures = max_read_failures
+        self.backoff = reconnect_delay
+        self.next_reconnect = 0.0
+        self.read_failures = 0
+        
+        # Frames grabbed faster than this came from the driver buffer
+        self.max_drain = max_drain
+        self.drain_threshold = 0.004
+        
+        # Counters
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        self.reconnect_attempts = 0
+        self.failed_reads = 0
+        self.last_frame_time = None
+        
+        # Frames stay in the device's native BGR order; consumers convert
+        # only if they need another layout
+        self.pixel_format = PIXEL_FORMAT_BGR
+        
+        # Capture thread fills preallocated ring slots in place
+        self.ring = FrameRing((self.frame_height, self.frame_width, 3),
+                              slots=ring_slots, shared=shared_ring,
+                              pixel_format=self.pixel_format)
+        self.capture_stats = StageStats(histogram=metrics.histogram(
+            'scanner_capture_seconds', 'Time to grab and retrieve a camera frame', {'camera': name}))
+        self.capture_thread = None
+        self.running = False
+        self.start_lock = threading.Lock()
+        
+        # initialize() hands the open over to the capture thread
+        self.open_requested = False
+        self.open_attempted = threading.Event()
+    
+    def initialize(self, source=0, timeout=30.0):
+        """Initialize camera and start capturing.
+
+        The capture thread does the open, so the device is never touched
+        from two threads; this waits up to timeout seconds for that first
+        attempt. Returns False if the camera could not be opened (yet); the
+        capture thread then serves the simulated feed and keeps retrying in
+        the background.
+        """
+        self.source = source
+        self.open_attempted.clear()
+        self.open_requested = True
+        self.device_requested = True
+        self.start()
+        self.open_attempted.wait(timeout)
+        return self.connected
     
-    def initialize(self, camera_index=0):
-        """Initialize camera"""
+    def _open(self):
+        """Open the device and read a test frame (capture thread only)"""
         try:
-            self.cap = cv2.VideoCapture(camera_index)
+            cap = open_source(self.source)
             
             # Set camera properties
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_width)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_height)
-            self.cap.set(cv2.CAP_PROP_FPS, 30)
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_height)
+            cap.set(cv2.CAP_PROP_FPS, 30)
+            # Ask the driver to queue as little as possible; not every
+            # backend honours this, so _read_into_ring drains as well
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             
             # Test camera
-            ret, frame = self.cap.read()
-            if ret:
-                self.connected = True
-                logger.info(f"Camera initialized: {self.frame_width}x{self.frame_height}")
-                return True
-            else:
-                self.cap.release()
-                self.cap = None
+            ret, frame = cap.read()
+            if not ret:
+                cap.release()
                 logger.error("Camera test failed")
                 return False
-                
+            
+            self.frame_height, self.frame_width = frame.shape[:2]
+            self.ring.ensure_shape(frame.shape)
+            self.cap = cap
+            self.read_failures = 0
+            self.backoff = self.reconnect_delay
+            self.connected = True
+            logger.info(f"Camera initialized: {self.frame_width}x{self.frame_height}")
+            return True
+            
         except Exception as e:
             logger.error(f"Camera initialization error: {e}")
             return False
     
-    def get_frame(self):
-        """Get frame from camera"""
-        if not self.connected or self.cap is None:
-            return self.get_fallback_frame()
-        
+    def _close(self):
+        """Release the device after it failed"""
+        self.connected = False
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+    
+    def _schedule_reconnect(self):
+        """Plan the next open attempt and double the backoff"""
+        self.next_reconnect = time.time() + self.backoff
+        logger.info(f"Retrying camera {self.source} in {self.backoff:.1f}s")
+        self.backoff = min(self.backoff * 2, self.max_reconnect_delay)
+    
+    def _reconnect(self):
+        """Try to reopen the device if the backoff has elapsed"""
+        if not self.device_requested or time.time() < self.next_reconnect:
+            return False
+        self.reconnect_attempts += 1
+        if self._open():
+            self.reconnects += 1
+            logger.info(f"Camera reconnected after {self.reconnect_attempts} attempt(s)")
+            self.reconnect_attempts = 0
+            return True
+        self._schedule_reconnect()
+        return False
+    
+    def start(self):
+        """Start the background capture thread (idempotent)"""
+        with self.start_lock:
+            if self.running:
+                return
+            self.running = True
+            self.capture_thread = threading.Thread(target=self._capture_loop,
+                                                   name='camera-capture', daemon=True)
+            self.capture_thread.start()
+    
+    def stop(self):
+        """Stop the background capture thread"""
+        with self.start_lock:
+            if not self.running:
+                return
+            self.running = False
+        if self.capture_thread is not threading.current_thread():
+            self.capture_thread.join(timeout=2)
+    
+    def _capture_loop(self):
+        """Read frames into the ring; the only code touching self.cap"""
+        while self.running:
+            if self.open_requested:
+                # (Re)initialize: drop any open device and try the new source now
+                self.open_requested = False
+                self._close()
+                self.backoff = self.reconnect_delay
+                if not self._open():
+                    self._schedule_reconnect()
+                self.open_attempted.set()
+                continue
+            
+            if not self.connected or self.cap is None:
+                if self._reconnect():
+                    continue
+                # Simulated feed at ~30 FPS
+                start = time.perf_counter()
+                self.ring.ensure_shape((self.frame_height, self.frame_width, 3))
+                index, slot = self.ring.next_slot()
+                self.get_fallback_frame(out=slot)
+                self.ring.commit(index)
+                time.sleep(max(0, 0.033 - (time.perf_counter() - start)))
+                continue
+            
+            start = time.perf_counter()
+            if self._read_into_ring():
+                self.read_failures = 0
+                self.capture_stats.record(time.perf_counter() - start)
+                continue
+            
+            self.failed_reads += 1
+            self.read_failures += 1
+            if self.read_failures >= self.max_read_failures:
+                logger.warning(f"Camera lost after {self.read_failures} failed reads")
+                self._close()
+                self._schedule_reconnect()
+            else:
+                time.sleep(0.05)
+    
+    def _grab_newest(self):
+        """Grab frames until the driver buffer is empty"""
+        started = time.perf_counter()
+        if not self.cap.grab():
+            return False
+        # A grab that returns almost at once was served from the driver
+        # queue rather than the sensor; skip ahead so latency cannot build up
+        drained = 0
+        while (time.perf_counter() - started < self.drain_threshold
+               and drained < self.max_drain):
+            started = time.perf_counter()
+            if not self.cap.grab():
+                return False
+            drained += 1
+        self.frames_dropped += drained
+        return True
+    
+    def _read_into_ring(self):
+        """Read the newest camera frame straight into the next ring slot"""
         try:
-            ret, frame = self.cap.read()
+            if not self._grab_newest():
+                logger.warning("Camera read failed")
+                return False
+            
+            index, slot = self.ring.next_slot()
+            ret, frame = self.cap.retrieve(slot)
             
             if not ret:
                 logger.warning("Camera read failed")
-                self.connected = False
-                return self.get_fallback_frame()
+                return False
+            
+            if frame.shape != slot.shape or frame.ctypes.data != slot.ctypes.data:
+                # Device changed resolution; OpenCV returned its own buffer
+                self.ring.ensure_shape(frame.shape)
+                index, slot = self.ring.next_slot()
+                slot[...] = frame
             
             # Update FPS calculation
             self.frame_count += 1
+            self.frames_captured += 1
             current_time = time.time()
+            self.last_frame_time = current_time
             
             if current_time - self.last_fps_update >= 1:
                 self.fps = self.frame_count
                 self.frame_count = 0
                 self.last_fps_update = current_time
             
-            # Convert BGR to RGB
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            return frame
+            self.ring.commit(index, current_time)
+            return True
             
         except Exception as e:
             logger.error(f"Frame capture error: {e}")
-            self.connected = False
-            return self.get_fallback_frame()
+            return False
+    
+    def latest_frame(self):
+        """Get a zero-copy FrameRef to the newest frame (None until the first one)"""
+        self.start()
+        return self.ring.latest()
     
-    def get_fallback_frame(self):
+    def wait_frame(self, after_seq=0, timeout=None):
+        """Block until a frame newer than after_seq exists, returns a FrameRef"""
+        self.start()
+        return self.ring.wait_newer(after_seq, timeout)
+    
+    def get_frame(self):
+        """Get a private copy of the newest frame"""
+        ref = self.latest_frame()
+        if ref is None:
+            ref = self.wait_frame(0, timeout=1.0)
+        return ref.copy() if ref is not None else None
+    
+    def get_fallback_frame(self, out=None):
         """Generate fallback frame when camera is not available"""
-        frame = np.zeros((self.frame_height, self.frame_width, 3), dtype=np.uint8)
+        if out is None:
+            frame = np.zeros((self.frame_height, self.frame_width, 3), dtype=np.uint8)
+        else:
+            frame = out
+            frame[...] = 0
         
         # Add some visual elements
         cv2.putText(frame, "CAMERA NOT AVAILABLE", (100, 200),
@@ -106,13 +318,35 @@ class CameraHandler:
         """Check if camera is connected"""
         return self.connected
     
+    def get_stats(self):
+        """Get capture counters"""
+        now = time.time()
+        cap = self.cap
+        return {
+            'connected': self.connected,
+            'source': str(self.source) if self.connected else 'simulated',
+            'capture_fps': self.fps if self.connected else 0,
+            'frames_captured': self.frames_captured,
+            'frames_dropped': self.frames_dropped,
+            'failed_reads': self.failed_reads,
+            'reconnects': self.reconnects,
+            'reconnect_attempts': self.reconnect_attempts,
+            'next_reconnect_in': round(max(0.0, self.next_reconnect - now), 1)
+            if self.device_requested and not self.connected else None,
+            'last_frame_age': round(now - self.last_frame_time, 3)
+            if self.last_frame_time else None,
+            'stream': cap.get_stats() if hasattr(cap, 'get_stats') else None
+        }
+    
     def release(self):
         """Release camera resources"""
+        self.stop()
+        self.device_requested = False
         if self.cap is not None:
-            self.cap.release()
-            self.connected = False
+            self._close()
             logger.info("Camera released")
+        self.ring.close()
     
     def __del__(self):
         """Destructor"""
-        self.release()
\ No newline at end of file
+        self.release()
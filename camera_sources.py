@@ -0,0 +1,308 @@
+import cv2
+import numpy as np
+import http.client
+import time
+import logging
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+def open_source(source):
+    """Open a camera source.
+
+    Integers (or digit strings) are local device indices, http(s) URLs are
+    MJPEG streams such as the ESP32 /stream endpoint, and anything else is
+    handed to cv2.VideoCapture (files, RTSP, GStreamer pipelines).
+    'synthetic[:WxH[@fps]]' and 'replay:<video file>' are deterministic
+    SyntheticSource feeds for benchmarks and camera-less setups. Every
+    source has the cv2.VideoCapture subset CameraHandler uses: set, grab,
+    retrieve, read, isOpened and release.
+    """
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, str) and source.startswith(('http://', 'https://')):
+        return MJPEGStreamSource(source)
+    if isinstance(source, str) and source.split(':', 1)[0] == 'synthetic':
+        spec = source.partition(':')[2]
+        size, _, fps = spec.partition('@')
+        width, _, height = (size or '640x480').partition('x')
+        return SyntheticSource((int(width), int(height)), fps=float(fps or 30))
+    if isinstance(source, str) and source.startswith('replay:'):
+        return SyntheticSource.from_video(source[len('replay:'):])
+    return cv2.VideoCapture(source)
+
+class SyntheticSource:
+    """Deterministic, paced frame source.
+
+    Frames are rendered (or read from a recording) once up front and
+    replayed in a loop, so producing a frame costs one copy and every run
+    sees identical pixels. grab() waits for the next frame time like a
+    camera running at fps; fps=0 serves frames as fast as they are read.
+    """
+    def __init__(self, size=(640, 480), fps=30.0, count=120, seed=0, objects=4, frames=None):
+        self.fps = fps
+        self.frames = frames if frames is not None else self.render(size, count, seed, objects)
+        self.index = -1
+        self.opened = bool(self.frames)
+        self.started = None
+        self.frames_served = 0
+
+    @staticmethod
+    def render(size, count, seed=0, objects=4):
+        """Moving filled shapes over a fixed noise background"""
+        width, height = size
+        rng = np.random.default_rng(seed)
+        background = rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+        shapes = [(rng.uniform(0, width), rng.uniform(0, height),
+                   rng.uniform(-4, 4), rng.uniform(-3, 3),
+                   int(rng.integers(height // 16, height // 4)),
+                   tuple(int(c) for c in rng.integers(64, 256, 3)))
+                  for _ in range(objects)]
+        frames = []
+        for t in range(count):
+            frame = background.copy()
+            for i, (x, y, dx, dy, radius, color) in enumerate(shapes):
+                center = (int((x + dx * t) % width), int((y + dy * t) % height))
+                if i % 2:
+                    cv2.circle(frame, center, radius, color, -1)
+                else:
+                    cv2.rectangle(frame, (center[0] - radius, center[1] - radius // 2),
+                                  (center[0] + radius, center[1] + radius // 2), color, -1)
+            frames.append(frame)
+        return frames
+
+    @classmethod
+    def from_video(cls, path, max_frames=300, fps=None):
+        """Load up to max_frames of a recording to replay at its own rate"""
+        capture = cv2.VideoCapture(path)
+        frames = []
+        while len(frames) < max_frames:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            frames.append(frame)
+        fps = fps or capture.get(cv2.CAP_PROP_FPS) or 30.0
+        capture.release()
+        if not frames:
+            logger.error(f"Replay source {path} has no readable frames")
+        return cls(fps=fps, frames=frames)
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        """Size and rate are fixed when the frames are rendered"""
+        return False
+
+    def grab(self):
+        """Advance to the next frame, waiting for its time slot"""
+        if not self.opened:
+            return False
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        if self.fps:
+            wait = self.started + self.frames_served / self.fps - now
+            if wait > 0:
+                time.sleep(wait)
+        self.index = (self.index + 1) % len(self.frames)
+        self.frames_served += 1
+        return True
+
+    def retrieve(self, out=None):
+        """Copy the current frame, into out when the size matches"""
+        if self.index < 0:
+            return False, None
+        frame = self.frames[self.index]
+        if out is not None and out.shape == frame.shape:
+            np.copyto(out, frame)
+            return True, out
+        return True, frame.copy()
+
+    def read(self, out=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(out)
+
+    def release(self):
+        self.opened = False
+
+    def get_stats(self):
+        """Get replay counters"""
+        return {
+            'frames': len(self.frames),
+            'fps': self.fps,
+            'frames_served': self.frames_served
+        }
+
+class MJPEGStreamSource:
+    """HTTP multipart/x-mixed-replace client with decode on demand.
+
+    One persistent connection is kept open and read in chunks; the parser
+    works incrementally on a single buffer and never rescans bytes it has
+    already searched. grab() only cuts the next JPEG out of the stream,
+    retrieve() decodes it, so frames that CameraHandler drains are never
+    decoded. Parts with a Content-Length header are sliced directly;
+    parts without one (the ESP32 sketch sends none) end at the next
+    boundary.
+    """
+    def __init__(self, url, timeout=5.0, chunk_size=65536, max_buffer=8 * 1024 * 1024):
+        self.url = url
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.max_buffer = max_buffer
+        self.connection = None
+        self.response = None
+        self.boundary = None
+        self.buffer = bytearray()
+        self.jpeg = None
+
+        # Counters
+        self.frames_received = 0
+        self.frames_decoded = 0
+        self.bytes_received = 0
+
+        self.opened = self._connect()
+
+    def _connect(self):
+        """Open the HTTP connection and read the stream headers"""
+        parts = urlsplit(self.url)
+        connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                            else http.client.HTTPConnection)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        try:
+            self.connection = connection_class(parts.hostname, parts.port, timeout=self.timeout)
+            self.connection.request('GET', path, headers={'Connection': 'keep-alive'})
+            self.response = self.connection.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            logger.error(f"MJPEG connect to {self.url} failed: {e}")
+            self.release()
+            return False
+
+        content_type = self.response.getheader('Content-Type', '')
+        if self.response.status != 200 or 'multipart' not in content_type:
+            logger.error(f"MJPEG source {self.url} returned {self.response.status} {content_type}")
+            self.release()
+            return False
+
+        boundary = 'frame'
+        for param in content_type.split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'boundary':
+                boundary = value.strip('"')
+        # Some servers already include the leading dashes in the parameter
+        if boundary.startswith('--'):
+            boundary = boundary[2:]
+        self.boundary = b'--' + boundary.encode()
+        logger.info(f"MJPEG stream opened: {self.url}")
+        return True
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        """Capture properties are controlled on the camera unit itself"""
+        return False
+
+    def _fill(self):
+        """Read whatever the socket has (at least one byte) into the buffer"""
+        chunk = self.response.read1(self.chunk_size)
+        if not chunk:
+            raise EOFError("MJPEG stream closed")
+        self.buffer += chunk
+        self.bytes_received += len(chunk)
+        if len(self.buffer) > self.max_buffer:
+            raise ValueError("MJPEG part exceeds buffer limit")
+
+    def _find(self, token, start):
+        """Find token at or after start, reading more data as needed"""
+        scan = start
+        while True:
+            index = self.buffer.find(token, scan)
+            if index >= 0:
+                return index
+            # Only the tail could still hold the start of a split token
+            scan = max(start, len(self.buffer) - len(token) + 1)
+            self._fill()
+
+    def _next_part(self):
+        """Cut the next JPEG payload out of the stream"""
+        start = self._find(self.boundary, 0)
+        header_end = self._find(b'\r\n\r\n', start)
+        body_start = header_end + 4
+
+        length = None
+        for line in bytes(self.buffer[start:header_end]).split(b'\r\n')[1:]:
+            key, _, value = line.partition(b':')
+            if key.strip().lower() == b'content-length':
+                length = int(value.strip())
+
+        if length is not None:
+            while len(self.buffer) < body_start + length:
+                self._fill()
+            body_end = body_start + length
+            consumed = body_end
+        else:
+            body_end = self._find(b'\r\n' + self.boundary, body_start)
+            # Leave the boundary in the buffer for the next part
+            consumed = body_end + 2
+
+        payload = bytes(self.buffer[body_start:body_end])
+        del self.buffer[:consumed]
+        return payload
+
+    def grab(self):
+        """Receive the next frame without decoding it"""
+        if not self.opened:
+            return False
+        try:
+            self.jpeg = self._next_part()
+        except (OSError, EOFError, ValueError, http.client.HTTPException) as e:
+            logger.warning(f"MJPEG stream {self.url} read failed: {e}")
+            self.release()
+            return False
+        self.frames_received += 1
+        return True
+
+    def retrieve(self, out=None):
+        """Decode the last grabbed frame, into out when the size matches"""
+        if self.jpeg is None:
+            return False, None
+        image = cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        self.jpeg = None
+        if image is None:
+            return False, None
+        self.frames_decoded += 1
+        if out is not None and out.shape == image.shape:
+            out[...] = image
+            return True, out
+        return True, image
+
+    def read(self, out=None):
+        """Grab and decode the next frame"""
+        if not self.grab():
+            return False, None
+        return self.retrieve(out)
+
+    def release(self):
+        """Close the connection"""
+        self.opened = False
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        self.buffer = bytearray()
+
+    def get_stats(self):
+        """Get stream counters"""
+        return {
+            'url': self.url,
+            'frames_received': self.frames_received,
+            'frames_decoded': self.frames_decoded,
+            'frames_skipped': self.frames_received - self.frames_decoded,
+            'bytes_received': self.bytes_received
+        }
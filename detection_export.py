@@ -0,0 +1,142 @@
+import csv
+import io
+import json
+import zlib
+import logging
+
+from detection_store import COLUMNS, DetectionStore
+
+logger = logging.getLogger(__name__)
+
+try:
+    # Optional: Parquet export (pip install pyarrow)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Export formats: name -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+def available_formats():
+    """Export formats usable with the installed packages"""
+    return [name for name in EXPORT_FORMATS if name != 'parquet' or pa is not None]
+
+def ndjson_chunks(chunks):
+    """One detection dict per line"""
+    for rows in chunks:
+        yield ''.join(json.dumps(DetectionStore.row_to_dict(row)) + '\n' for row in rows)
+
+def json_chunks(chunks):
+    """A single JSON array, written element by element"""
+    yield '['
+    first = True
+    for rows in chunks:
+        items = ', '.join(json.dumps(DetectionStore.row_to_dict(row)) for row in rows)
+        if items:
+            yield items if first else ', ' + items
+            first = False
+    yield ']'
+
+def csv_chunks(chunks):
+    """Header row, then the stored columns as CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue()
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+class _ParquetSink:
+    """Write-only file object that hands written bytes to the caller.
+
+    ParquetWriter records absolute offsets in the footer, so tell() must
+    keep counting after the buffered bytes have been taken away.
+    """
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def parquet_chunks(chunks):
+    """One Parquet row group per chunk of rows"""
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow")
+    schema = pa.schema([
+        ('ts', pa.float64()), ('camera', pa.string()), ('class', pa.string()),
+        ('confidence', pa.float64()), ('x', pa.int32()), ('y', pa.int32()),
+        ('w', pa.int32()), ('h', pa.int32()), ('track_id', pa.int64()),
+        ('model', pa.string())
+    ])
+    sink = _ParquetSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema))
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a stream of str/bytes chunks on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_chunks(chunks, fmt='ndjson', gzip=False):
+    """Encode chunks of stored rows (from DetectionStore.iter_chunks) as fmt.
+
+    Returns a generator, so a response body can be streamed from it with
+    memory bounded by one chunk of rows.
+    """
+    encoders = {
+        'json': json_chunks,
+        'ndjson': ndjson_chunks,
+        'csv': csv_chunks,
+        'parquet': parquet_chunks
+    }
+    if fmt not in encoders:
+        raise ValueError(f"Unknown export format {fmt}")
+    if fmt == 'parquet' and pa is None:
+        raise ValueError("Parquet export requires pyarrow")
+    stream = encoders[fmt](chunks)
+    return gzip_chunks(stream) if gzip else stream
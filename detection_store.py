@@ -0,0 +1,292 @@
+import sqlite3
+import threading
+import queue
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    camera TEXT NOT NULL,
+    class TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    x INTEGER, y INTEGER, w INTEGER, h INTEGER,
+    track_id INTEGER,
+    model TEXT,
+    session TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_detections_ts ON detections (ts);
+CREATE INDEX IF NOT EXISTS idx_detections_class_ts ON detections (class, ts);
+CREATE INDEX IF NOT EXISTS idx_detections_camera_ts ON detections (camera, ts);
+"""
+
+COLUMNS = ('ts', 'camera', 'class', 'confidence', 'x', 'y', 'w', 'h', 'track_id', 'model')
+
+# Track IDs restart with every tracker, so rows also carry the writing
+# process's session; (camera, session, track_id) identifies one object
+INSERT_COLUMNS = COLUMNS + ('session',)
+
+class DetectionStore:
+    """Append-only detection log in SQLite (WAL mode).
+
+    record() only puts rows on a bounded queue, so the frame loop never
+    touches the database; a writer thread inserts them in batches of up
+    to batch_size rows or every flush_interval seconds, one transaction
+    per batch. Rows older than retention_days are deleted hourly and the
+    freed pages are returned to the file system. Queries open their own
+    read connections, which WAL lets run alongside the writer.
+
+    Every row is stamped with a random session ID chosen when the store is
+    opened, so object counts stay correct across cameras and restarts.
+    """
+    def __init__(self, path='detections.db', batch_size=500, flush_interval=1.0,
+                 retention_days=7, max_pending=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.session = uuid.uuid4().hex[:16]
+        self.running = False
+        self.thread = None
+        self.start_lock = threading.Lock()
+
+        # Counters
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.deleted = 0
+        self.last_flush_ms = 0.0
+        self.last_retention = 0.0
+
+        connection = self._connect()
+        # Must be set before the first table is created to take effect
+        connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        connection.executescript(SCHEMA)
+        columns = [row[1] for row in connection.execute('PRAGMA table_info(detections)')]
+        if 'session' not in columns:
+            # History written before sessions were recorded
+            connection.execute('ALTER TABLE detections ADD COLUMN session TEXT')
+        connection.close()
+
+    def _connect(self):
+        """Open a connection with the store's pragmas"""
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        return connection
+
+    def start(self):
+        """Start the background writer (idempotent)"""
+        with self.start_lock:
+            if self.running:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+            self.thread.start()
+            logger.info(f"Detection history at {self.path} "
+                        f"(retention {self.retention_days} days)")
+
+    def stop(self):
+        """Flush pending rows and stop the writer"""
+        with self.start_lock:
+            if not self.running:
+                return
+            self.running = False
+        self.thread.join(timeout=5)
+
+    def record(self, detections, camera='camera0', model=None, timestamp=None):
+        """Queue one detection result for writing; never blocks"""
+        ts = time.time() if timestamp is None else timestamp
+        for obj in detections:
+            x, y, w, h = obj['bbox']
+            row = (ts, camera, obj['class'], float(obj['confidence']),
+                   int(x), int(y), int(w), int(h), obj.get('track_id'), model, self.session)
+            try:
+                self.pending.put_nowait(row)
+            except queue.Full:
+                self.dropped += 1
+
+    def _take_batch(self):
+        """Collect up to batch_size rows, waiting at most flush_interval"""
+        batch = []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """Writer thread: batch inserts and periodic retention"""
+        connection = self._connect()
+        try:
+            while self.running or not self.pending.empty():
+                batch = self._take_batch()
+                if batch:
+                    start = time.perf_counter()
+                    try:
+                        with connection:
+                            connection.executemany(
+                                f"INSERT INTO detections ({', '.join(INSERT_COLUMNS)}) "
+                                f"VALUES ({', '.join('?' * len(INSERT_COLUMNS))})", batch)
+                    except sqlite3.Error as e:
+                        logger.error(f"History write of {len(batch)} rows failed: {e}")
+                        self.dropped += len(batch)
+                    else:
+                        self.written += len(batch)
+                        self.batches += 1
+                    self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+                if time.time() - self.last_retention >= 3600:
+                    self._apply_retention(connection)
+        finally:
+            connection.close()
+
+    def _apply_retention(self, connection):
+        """Delete expired rows and compact the file"""
+        self.last_retention = time.time()
+        if not self.retention_days:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        try:
+            with connection:
+                deleted = connection.execute(
+                    "DELETE FROM detections WHERE ts < ?", (cutoff,)).rowcount
+            if deleted:
+                connection.execute('PRAGMA incremental_vacuum')
+                connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                self.deleted += deleted
+                logger.info(f"History retention removed {deleted} rows")
+        except sqlite3.Error as e:
+            logger.error(f"History retention failed: {e}")
+
+    def _where(self, start=None, end=None, classes=None, camera=None):
+        """Build a WHERE clause that can use the (class|camera, ts) indexes"""
+        clauses, params = [], []
+        if start is not None:
+            clauses.append('ts >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('ts < ?')
+            params.append(end)
+        if classes:
+            clauses.append(f"class IN ({', '.join('?' * len(classes))})")
+            params.extend(classes)
+        if camera:
+            clauses.append('camera = ?')
+            params.append(camera)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query(self, start=None, end=None, classes=None, camera=None, limit=1000, offset=0):
+        """Detections in a time range, oldest first"""
+        where, params = self._where(start, end, classes, camera)
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM detections{where} "
+                f"ORDER BY ts LIMIT ? OFFSET ?", params + [limit, offset]).fetchall()
+        finally:
+            connection.close()
+        return [self.row_to_dict(row) for row in rows]
+
+    def iter_chunks(self, start=None, end=None, classes=None, camera=None, chunk_size=1000):
+        """Yield matching rows as lists of raw tuples (COLUMNS order), oldest first.
+
+        Rows are streamed from one cursor, so memory stays at one chunk
+        however large the range is.
+        """
+        where, params = self._where(start, end, classes, camera)
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM detections{where} ORDER BY ts", params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            connection.close()
+
+    def aggregate(self, start=None, end=None, classes=None, camera=None,
+                  bucket=None, group_by='class'):
+        """Counts per class (or camera), optionally per time bucket in seconds.
+
+        'detections' counts every detection row; 'objects' counts distinct
+        (camera, session, track ID) triples, i.e. how many different objects
+        were seen.
+        """
+        if group_by not in ('class', 'camera'):
+            raise ValueError(f"Cannot group by {group_by}")
+        where, params = self._where(start, end, classes, camera)
+        keys = [group_by]
+        if bucket:
+            keys.insert(0, f"CAST(ts / {float(bucket)} AS INTEGER) * {float(bucket)}")
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f"SELECT {', '.join(keys)}, COUNT(*), "
+                f"COUNT(DISTINCT camera || '/' || IFNULL(session, '') || '/' || track_id), "
+                f"AVG(confidence), MIN(ts), MAX(ts) FROM detections{where} "
+                f"GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}", params).fetchall()
+        finally:
+            connection.close()
+
+        results = []
+        for row in rows:
+            if bucket:
+                bucket_start, row = row[0], row[1:]
+            result = {
+                group_by: row[0],
+                'detections': row[1],
+                'objects': row[2],
+                'avg_confidence': round(row[3], 3),
+                'first_seen': row[4],
+                'last_seen': row[5]
+            }
+            if bucket:
+                result = {'bucket_start': bucket_start, **result}
+            results.append(result)
+        return results
+
+    @staticmethod
+    def row_to_dict(row):
+        """Convert a stored row to the detection dict schema"""
+        ts, camera, class_name, confidence, x, y, w, h, track_id, model = row
+        detection = {
+            'class': class_name,
+            'confidence': confidence,
+            'bbox': [x, y, w, h],
+            'area': w * h,
+            'center': [int(x + w/2), int(y + h/2)],
+            'timestamp': ts,
+            'camera': camera,
+            'model': model
+        }
+        if track_id is not None:
+            detection['track_id'] = track_id
+        return detection
+
+    def get_stats(self):
+        """Get writer counters"""
+        return {
+            'path': self.path,
+            'session': self.session,
+            'running': self.running,
+            'pending': self.pending.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'deleted': self.deleted,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+            'retention_days': self.retention_days
+        }
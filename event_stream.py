@@ -0,0 +1,203 @@
+import asyncio
+import functools
+import json
+import threading
+import time
+import logging
+from collections import deque
+from frame_pipeline import LoopWaker
+
+logger = logging.getLogger(__name__)
+
+def detection_key(detection, index):
+    """Stable key for a detection: its track ID, else class and position in the list"""
+    track_id = detection.get('track_id')
+    if track_id is not None:
+        return str(track_id)
+    return f"{detection['class']}:{index}"
+
+class DetectionEventHub:
+    """Server-Sent Events fan-out of detection results.
+
+    publish() is called once per detection result. It diffs the result
+    against the previous one, serializes a single delta event and appends
+    it to a short replay buffer; every connected client is sent the same
+    bytes, so the cost of a result does not grow with the number of
+    dashboards. Event IDs are "<epoch>:<seq>": a client reconnecting with
+    Last-Event-ID gets the events it missed replayed from the buffer, or a
+    full snapshot if the buffer no longer covers the gap or the server was
+    restarted in between.
+
+    Fields in volatile (per-pass timestamps, track age) are ignored when
+    deciding whether an object changed, so a still object is not re-sent
+    on every detection pass.
+    """
+    def __init__(self, history=256, keepalive=15.0,
+                 volatile=('timestamp', 'scan_time', 'track_age')):
+        self.keepalive = keepalive
+        self.volatile = frozenset(volatile)
+        self.epoch = str(int(time.time()))
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.events = deque(maxlen=history)
+        self.objects = {}
+        self.stats = {}
+        self.clients = 0
+        self.listeners = set()
+        self.published = 0
+        self.snapshots_sent = 0
+        self.replayed = 0
+
+    def event_id(self, seq):
+        return f"{self.epoch}:{seq}"
+
+    def publish(self, detections, stats=None):
+        """Publish a detection result as a delta against the previous one"""
+        objects = {detection_key(d, i): d for i, d in enumerate(detections)}
+        with self.cond:
+            changed = {key: obj for key, obj in objects.items()
+                       if not self._same(self.objects.get(key), obj)}
+            removed = [key for key in self.objects if key not in objects]
+            self.seq += 1
+            # Keep what clients hold for unchanged objects
+            self.objects = {key: changed.get(key, self.objects.get(key)) for key in objects}
+            self.stats = stats or {}
+            payload = json.dumps({
+                'seq': self.seq,
+                'count': len(objects),
+                'changed': changed,
+                'removed': removed,
+                'stats': self.stats
+            })
+            self.events.append((self.seq, self._format('detections', self.seq, payload)))
+            self.published += 1
+            self.cond.notify_all()
+            listeners = list(self.listeners)
+        for notify in listeners:
+            notify()
+
+    def _same(self, old, new):
+        """Compare two detections ignoring volatile fields"""
+        if old is None or old.keys() != new.keys():
+            return False
+        return all(old[field] == new[field] for field in new if field not in self.volatile)
+
+    def _format(self, event, seq, payload):
+        """Encode one SSE message"""
+        return f"id: {self.event_id(seq)}\nevent: {event}\ndata: {payload}\n\n"
+
+    def _snapshot(self):
+        """Full state as an SSE message (caller holds lock)"""
+        self.snapshots_sent += 1
+        payload = json.dumps({
+            'seq': self.seq,
+            'count': len(self.objects),
+            'objects': self.objects,
+            'stats': self.stats
+        })
+        return self._format('snapshot', self.seq, payload)
+
+    def _resume_point(self, last_event_id):
+        """Sequence number a client has seen, or None if it needs a snapshot"""
+        if not last_event_id:
+            return None
+        epoch, _, seq = last_event_id.partition(':')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self.seq:
+            return None
+        # The buffer must still hold the event right after the client's one
+        oldest = self.events[0][0] if self.events else self.seq + 1
+        if seq < oldest - 1:
+            return None
+        return seq
+
+    def _connect(self, last_event_id):
+        """Register a client, returns its initial messages and sequence number"""
+        with self.cond:
+            self.clients += 1
+            sent = self._resume_point(last_event_id)
+            if sent is None:
+                initial = [self._snapshot()]
+                sent = self.seq
+            else:
+                initial = [text for seq, text in self.events if seq > sent]
+                self.replayed += len(initial)
+        # Tell EventSource how long to wait before reconnecting
+        return ['retry: 2000\n\n'] + initial, sent
+
+    def _pending(self, sent):
+        """Messages after sent and the new sequence number (caller holds lock)"""
+        if self.seq <= sent:
+            return [], sent
+        if self.events and self.events[0][0] > sent + 1:
+            # Fell behind the replay buffer: start over from a snapshot
+            return [self._snapshot()], self.seq
+        return [text for seq, text in self.events if seq > sent], self.seq
+
+    def stream(self, last_event_id=None):
+        """Generate SSE messages for one client until it disconnects"""
+        initial, sent = self._connect(last_event_id)
+        try:
+            for text in initial:
+                yield text
+            while True:
+                with self.cond:
+                    if self.cond.wait_for(lambda: self.seq > sent, self.keepalive):
+                        pending, sent = self._pending(sent)
+                    else:
+                        pending = None
+                if pending is None:
+                    yield ': keepalive\n\n'
+                    continue
+                for text in pending:
+                    yield text
+        finally:
+            with self.cond:
+                self.clients -= 1
+
+    async def stream_async(self, last_event_id=None):
+        """stream() as an async generator, woken by publish() instead of holding a thread.
+
+        Wakeups go through the loop's shared LoopWaker, so one publish
+        costs one loop wakeup however many clients are connected.
+        """
+        wakeup = asyncio.Event()
+        notify = functools.partial(LoopWaker.for_loop(asyncio.get_running_loop()).wake, wakeup)
+
+        initial, sent = self._connect(last_event_id)
+        with self.cond:
+            self.listeners.add(notify)
+        try:
+            for text in initial:
+                yield text
+            while True:
+                # Clear before checking so a publish in between is not missed
+                wakeup.clear()
+                with self.cond:
+                    pending, sent = self._pending(sent)
+                if not pending:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), self.keepalive)
+                    except asyncio.TimeoutError:
+                        yield ': keepalive\n\n'
+                    continue
+                for text in pending:
+                    yield text
+        finally:
+            with self.cond:
+                self.listeners.discard(notify)
+                self.clients -= 1
+
+    def get_stats(self):
+        """Get push channel counters"""
+        with self.cond:
+            return {
+                'clients': self.clients,
+                'last_event_id': self.event_id(self.seq),
+                'published': self.published,
+                'buffered': len(self.events),
+                'snapshots_sent': self.snapshots_sent,
+                'replayed': self.replayed
+            }
@@ -0,0 +1,671 @@
+import asyncio
+import cv2
+import numpy as np
+import threading
+import time
+import weakref
+import logging
+from collections import deque
+from concurrent.futures import CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from frame_ring import to_bgr
+from stream_encoder import STREAM_TIERS, JpegEncoder, TierEncoder
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class LatestQueue:
+    """Bounded queue where a new item evicts the oldest one when full"""
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+        # Optional callable run after every put and close, e.g. to wake an event loop
+        self.notify = None
+
+    def put(self, item):
+        """Add item, dropping the oldest queued item if the queue is full"""
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+        if self.notify is not None:
+            self.notify()
+
+    def get(self, timeout=None):
+        """Pop the oldest item, or return None on timeout/close"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.items or self.closed, timeout)
+            if not self.items:
+                return None
+            return self.items.popleft()
+
+    def close(self):
+        """Wake up all waiting consumers"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.notify is not None:
+            self.notify()
+
+    def qsize(self):
+        """Get number of queued items"""
+        with self.cond:
+            return len(self.items)
+
+class LoopWaker:
+    """Set asyncio events from other threads with one loop wakeup per batch.
+
+    call_soon_threadsafe writes to the loop's self-pipe on every call;
+    publishing a frame to hundreds of async subscribers would do that
+    hundreds of times. Events woken while a wakeup is already scheduled
+    ride along with it.
+    """
+    _instances = weakref.WeakKeyDictionary()
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.lock = threading.Lock()
+        self.pending = []
+        self.scheduled = False
+
+    @classmethod
+    def for_loop(cls, loop):
+        """Shared waker of an event loop (call from the loop's thread)"""
+        waker = cls._instances.get(loop)
+        if waker is None:
+            waker = cls._instances[loop] = cls(loop)
+        return waker
+
+    def wake(self, event):
+        """Set event on the loop soon; safe from any thread"""
+        with self.lock:
+            self.pending.append(event)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self._run)
+        except RuntimeError:
+            # Event loop already closed
+            pass
+
+    def _run(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+            self.scheduled = False
+        for event in pending:
+            event.set()
+
+class FrameSubscriber:
+    """Per-client slot holding the newest encoded frame.
+
+    tier is the stream tier (index into STREAM_TIERS) the client receives.
+    With adaptive set, a client whose slot keeps being overwritten before
+    it reads it, i.e. whose socket drains slower than frames are made,
+    steps down one tier per window; once it keeps up again it climbs back
+    towards the tier it asked for.
+    """
+    def __init__(self, tier=0, adaptive=True, lowest_tier=0, window=2.0,
+                 step_down_ratio=0.3, step_up_after=10.0):
+        self.queue = LatestQueue(1)
+        self.delivered = 0
+        self.requested_tier = tier
+        self.tier = tier
+        self.adaptive = adaptive
+        self.lowest_tier = max(lowest_tier, tier)
+        self.window = window
+        self.step_down_ratio = step_down_ratio
+        self.step_up_after = step_up_after
+        self.window_start = time.time()
+        self.window_delivered = 0
+        self.window_dropped = 0
+        self.last_change = self.window_start
+        self.step_downs = 0
+        self.step_ups = 0
+        self.wakeup = None
+
+    def get(self, timeout=None):
+        """Wait for the next frame published after the last one read"""
+        item = self.queue.get(timeout)
+        if item is None:
+            return None
+        self.delivered += 1
+        if self.adaptive:
+            self._adapt()
+        return item[1]
+
+    async def get_async(self, timeout=None):
+        """get() for coroutines: waits on the event loop instead of blocking a thread.
+
+        The publishing thread wakes the loop through the queue's notify
+        hook; a subscriber must be read from one event loop only.
+        """
+        if self.wakeup is None:
+            waker = LoopWaker.for_loop(asyncio.get_running_loop())
+            self.wakeup = wakeup = asyncio.Event()
+            self.queue.notify = lambda: waker.wake(wakeup)
+
+        while True:
+            # Clear before checking so a put in between is not missed
+            self.wakeup.clear()
+            frame = self.get(0)
+            if frame is not None or self.queue.closed:
+                return frame
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    def _adapt(self):
+        """Move between tiers based on this window's drop ratio"""
+        now = time.time()
+        if now - self.window_start < self.window:
+            return
+        dropped = self.queue.dropped - self.window_dropped
+        delivered = self.delivered - self.window_delivered
+        self.window_start = now
+        self.window_dropped = self.queue.dropped
+        self.window_delivered = self.delivered
+
+        ratio = dropped / (dropped + delivered) if dropped + delivered else 0.0
+        if ratio >= self.step_down_ratio and self.tier < self.lowest_tier:
+            self.tier += 1
+            self.step_downs += 1
+            self.last_change = now
+            logger.info(f"Stream client stepped down to {STREAM_TIERS[self.tier][0]} "
+                        f"({ratio:.0%} frames dropped)")
+        elif (dropped == 0 and self.tier > self.requested_tier
+              and now - self.last_change >= self.step_up_after):
+            self.tier -= 1
+            self.step_ups += 1
+            self.last_change = now
+            logger.info(f"Stream client stepped up to {STREAM_TIERS[self.tier][0]}")
+
+    @property
+    def dropped(self):
+        return self.queue.dropped
+
+class FrameBroadcaster:
+    """Fan encoded frames out to any number of stream clients.
+
+    Publishing never blocks: each subscriber owns a one-slot queue, so a
+    slow client just skips frames instead of stalling the producer or the
+    other clients. Frames are published as one encoding per stream tier
+    and each subscriber gets the bytes of its current tier.
+    """
+    def __init__(self, tiers=STREAM_TIERS):
+        self.tiers = tiers
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.published = 0
+        self.total_clients = 0
+        self.closed_drops = 0
+        self.closed_step_downs = 0
+
+    def subscribe(self, tier=0, adaptive=True):
+        """Register a new client on a stream tier"""
+        subscriber = FrameSubscriber(tier, adaptive, lowest_tier=len(self.tiers) - 1)
+        with self.lock:
+            self.subscribers.add(subscriber)
+            self.total_clients += 1
+        logger.info(f"Stream client connected ({self.client_count()} active)")
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Remove a client"""
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.discard(subscriber)
+                self.closed_drops += subscriber.dropped
+                self.closed_step_downs += subscriber.step_downs
+        subscriber.queue.close()
+        logger.info(f"Stream client disconnected ({self.client_count()} active)")
+
+    def publish(self, seq, encoded):
+        """Hand one frame, as {tier: bytes}, to every subscriber"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+            self.published += 1
+        for subscriber in subscribers:
+            frame_bytes = encoded.get(subscriber.tier)
+            # A client that just changed tier picks up the next frame
+            if frame_bytes is not None:
+                subscriber.queue.put((seq, frame_bytes))
+
+    def client_count(self):
+        """Get number of connected clients"""
+        with self.lock:
+            return len(self.subscribers)
+
+    def active_tiers(self):
+        """Tiers at least one client is currently on"""
+        with self.lock:
+            return {subscriber.tier for subscriber in self.subscribers}
+
+    def get_stats(self):
+        """Get client counters"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+            published = self.published
+            total_clients = self.total_clients
+            closed_drops = self.closed_drops
+            closed_step_downs = self.closed_step_downs
+        return {
+            'clients': len(subscribers),
+            'total_clients': total_clients,
+            'frames_published': published,
+            'client_drops': closed_drops + sum(s.dropped for s in subscribers),
+            'tier_clients': {name: sum(1 for s in subscribers if s.tier == i)
+                             for i, (name, _, _) in enumerate(self.tiers)},
+            'step_downs': closed_step_downs + sum(s.step_downs for s in subscribers)
+        }
+
+class StageStats:
+    """Rolling timing statistics for one pipeline stage.
+
+    Percentiles are taken over the last window executions. With a
+    metrics histogram every execution is also recorded there.
+    """
+    def __init__(self, alpha=0.1, window=1024, histogram=None):
+        self.alpha = alpha
+        self.histogram = histogram
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=window)
+        self.reset()
+
+    def reset(self):
+        """Clear all counters"""
+        with self.lock:
+            self.count = 0
+            self.last_ms = 0.0
+            self.avg_ms = 0.0
+            self.max_ms = 0.0
+            self.fps = 0
+            self.window_count = 0
+            self.window_start = time.time()
+            self.errors = 0
+            self.samples.clear()
+
+    def record_error(self):
+        """Count one failed stage execution"""
+        with self.lock:
+            self.errors += 1
+
+    def record(self, seconds):
+        """Record one stage execution"""
+        ms = seconds * 1000.0
+        if self.histogram is not None:
+            self.histogram.observe(seconds)
+        with self.lock:
+            self.count += 1
+            self.last_ms = ms
+            self.avg_ms = ms if self.count == 1 else (
+                self.alpha * ms + (1 - self.alpha) * self.avg_ms)
+            self.max_ms = max(self.max_ms, ms)
+            self.samples.append(ms)
+
+            # Update FPS calculation
+            self.window_count += 1
+            now = time.time()
+            if now - self.window_start >= 1:
+                self.fps = self.window_count / (now - self.window_start)
+                self.window_count = 0
+                self.window_start = now
+
+    def snapshot(self):
+        """Get stats as a dict"""
+        with self.lock:
+            p50, p95, p99 = (np.percentile(self.samples, [50, 95, 99])
+                             if self.samples else (0.0, 0.0, 0.0))
+            return {
+                'count': self.count,
+                'last_ms': round(self.last_ms, 2),
+                'avg_ms': round(self.avg_ms, 2),
+                'p50_ms': round(float(p50), 2),
+                'p95_ms': round(float(p95), 2),
+                'p99_ms': round(float(p99), 2),
+                'max_ms': round(self.max_ms, 2),
+                'fps': round(self.fps, 1),
+                'errors': self.errors
+            }
+
+class FramePipeline:
+    """Capture, inference and encoding stages running on separate threads.
+
+    The capture stage takes each new frame from the camera's FrameRing
+    and feeds two latest-frame-wins queues with zero-copy FrameRefs: one
+    for the inference worker and one for the encoder. Both read the ring
+    slot in place and check the ref afterwards; a result computed from a
+    slot the camera overwrote meanwhile is dropped, never published. Inference publishes its
+    results asynchronously, and the encoder overlays the most recent
+    detections on every captured frame, so the stream runs at capture rate
+    no matter how slow the detector is. Encoded frames are fanned out
+    through a single FrameBroadcaster, so each frame is captured, detected
+    and encoded once regardless of how many clients are watching.
+
+    When a BatchScheduler is given, inference frames are submitted to it
+    under the pipeline's source name so several pipelines share batched
+    forward passes. When a MotionGate is given, frames where the scene has
+    not changed skip detection and keep the previous results. When a
+    MultiObjectTracker is given, detections get stable track IDs and the
+    encoder draws track boxes predicted forward to each captured frame;
+    both use frame capture times, and with a MotionGate the tracker's
+    expiry follows the gate's keyframe period at the measured frame rate.
+    When a ProcessPoolDetector is given, frames are submitted without
+    waiting so every worker process stays busy; results are published in
+    capture order as they complete. When a RegionDetector with ROIs or
+    tiling configured is given, it runs detection instead, in process.
+
+    Each frame is encoded once for each stream tier that has clients
+    (jpeg_quality sets the top tier), with the overlay composited at that
+    tier's resolution.
+    """
+    def __init__(self, camera, detector, is_active=None, on_detections=None,
+                 jpeg_quality=85, scheduler=None, source='camera',
+                 motion_gate=None, tracker=None, pool=None, jpeg_backend='auto',
+                 regions=None):
+        self.camera = camera
+        self.detector = detector
+        self.scheduler = scheduler
+        self.source = source
+        self.motion_gate = motion_gate
+        self.tracker = tracker
+        self.pool = pool
+        self.regions = regions
+        self.is_active = is_active or (lambda: True)
+        self.on_detections = on_detections
+        self.jpeg_quality = jpeg_quality
+
+        tiers = [(name, scale, jpeg_quality if i == 0 else quality)
+                 for i, (name, scale, quality) in enumerate(STREAM_TIERS)]
+        self.encoder = TierEncoder(JpegEncoder(jpeg_backend), tiers)
+
+        self.inference_queue = LatestQueue(1)
+        self.encode_queue = LatestQueue(1)
+        self.broadcaster = FrameBroadcaster(tiers)
+
+        # Frames whose ring slot was reused before a stage finished with them
+        self.overwritten = {'inference': 0, 'encode': 0}
+
+        self.stats = {
+            'capture': getattr(camera, 'capture_stats', StageStats()),
+            'inference': StageStats(histogram=metrics.histogram(
+                'scanner_inference_seconds', 'Frame detection time including scheduling',
+                {'source': source})),
+            'draw': StageStats(histogram=metrics.histogram(
+                'scanner_draw_seconds', 'Overlay drawing time per stream tier', {'source': source})),
+            'encode': StageStats(histogram=metrics.histogram(
+                'scanner_encode_seconds', 'Resize, overlay and JPEG encoding time for all tiers',
+                {'source': source}))
+        }
+
+        self.latest_detections = []
+        self.detections_lock = threading.Lock()
+        self.running = False
+        self.threads = []
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        """Start pipeline threads (idempotent)"""
+        with self.start_lock:
+            if self.running:
+                return
+            self.running = True
+            self.threads = [
+                threading.Thread(target=self._capture_loop, name='pipeline-capture', daemon=True),
+                threading.Thread(target=self._inference_loop, name='pipeline-inference', daemon=True),
+                threading.Thread(target=self._encode_loop, name='pipeline-encode', daemon=True)
+            ]
+            for thread in self.threads:
+                thread.start()
+            logger.info("Frame pipeline started")
+
+    def stop(self):
+        """Stop pipeline threads"""
+        with self.start_lock:
+            if not self.running:
+                return
+            self.running = False
+            for queue in (self.inference_queue, self.encode_queue):
+                queue.close()
+            for thread in self.threads:
+                thread.join(timeout=2)
+            self.threads = []
+            logger.info("Frame pipeline stopped")
+
+    def subscribe(self, tier=0, adaptive=True):
+        """Subscribe a stream client to encoded frames of a tier"""
+        self.start()
+        return self.broadcaster.subscribe(tier, adaptive)
+
+    def unsubscribe(self, subscriber):
+        """Unsubscribe a stream client"""
+        self.broadcaster.unsubscribe(subscriber)
+
+    def _capture_loop(self):
+        """Take each new frame from the camera ring and hand it to both consumers"""
+        last_seq = 0
+        while self.running:
+            try:
+                ref = self.camera.wait_frame(last_seq, timeout=1.0)
+            except Exception as e:
+                logger.error(f"Capture stage error: {e}")
+                time.sleep(1)
+                continue
+            if ref is None:
+                # No new frame within a second: show the no-feed frame
+                self.encode_queue.put((last_seq, None))
+                continue
+            last_seq = ref.seq
+
+            # Zero-copy: consumers read the ring slot in place
+            item = (ref.seq, ref)
+            self.inference_queue.put(item)
+            self.encode_queue.put(item)
+
+    def _inference_loop(self):
+        """Run detection on the newest captured frame"""
+        last_timestamp = None
+        frame_interval = 0.0
+        while self.running:
+            item = self.inference_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            if not self.is_active():
+                with self.detections_lock:
+                    self.latest_detections = []
+                if self.motion_gate is not None:
+                    self.motion_gate.reset()
+                if self.tracker is not None:
+                    self.tracker.reset()
+                continue
+
+            _, ref = item
+            frame, pixel_format = ref.frame, ref.pixel_format
+            if self.motion_gate is not None and self.tracker is not None:
+                # Keyframes are counted in frames this stage sees; keep tracks
+                # alive across that many at the current rate
+                if last_timestamp is not None and ref.timestamp > last_timestamp:
+                    interval = ref.timestamp - last_timestamp
+                    frame_interval = interval if not frame_interval else (
+                        0.1 * interval + 0.9 * frame_interval)
+                    self.tracker.set_keyframe_period(
+                        self.motion_gate.keyframe_interval * frame_interval)
+                last_timestamp = ref.timestamp
+            if self.motion_gate is not None:
+                run_detection, _ = self.motion_gate.should_detect(frame)
+                if not run_detection:
+                    # Static scene: keep overlaying the last detections
+                    continue
+
+            start = time.perf_counter()
+            try:
+                if self.regions is not None and self.regions.active:
+                    # ROI windows are batched into their own forward passes
+                    detected = self.regions.detect_objects(frame, pixel_format)
+                elif self.pool is not None:
+                    # Keep several frames in flight; the pool resolves them in order.
+                    # submit() copies the frame into shared memory before returning
+                    future = self.pool.submit(frame, pixel_format=pixel_format)
+                    if not ref.is_valid():
+                        future.cancel()
+                        self.overwritten['inference'] += 1
+                        self._detection_dropped()
+                        continue
+                    future.add_done_callback(
+                        lambda future, start=start, captured=ref.timestamp:
+                        self._publish_future(future, start, captured))
+                    continue
+                elif self.scheduler is not None:
+                    detected = self.scheduler.detect(frame, source=self.source,
+                                                     pixel_format=pixel_format)
+                else:
+                    detected = self.detector.detect_objects(frame, pixel_format)
+            except CancelledError:
+                # Superseded by a newer frame from this source
+                self._detection_dropped()
+                continue
+            except Exception as e:
+                self._inference_failed(e)
+                continue
+            if not ref.is_valid():
+                # The camera reused the slot while the detector was reading it
+                self.overwritten['inference'] += 1
+                self._detection_dropped()
+                continue
+            self._publish(detected, start, ref.timestamp)
+
+    def _publish_future(self, future, start, captured):
+        """Publish a pool result once its Future resolves"""
+        if future.cancelled():
+            self._detection_dropped()
+            return
+        try:
+            detected = future.result()
+        except Exception as e:
+            self._inference_failed(e)
+            return
+        self._publish(detected, start, captured)
+
+    def _inference_failed(self, error):
+        """Log and count a failed detection; respawn pool workers that died"""
+        logger.error(f"Inference stage error: {error}")
+        self.stats['inference'].record_error()
+        self._detection_dropped()
+        if isinstance(error, BrokenProcessPool) and self.pool is not None:
+            self.pool.restart_workers()
+
+    def _detection_dropped(self):
+        """A gated frame produced no result; don't let the gate treat it as seen"""
+        if self.motion_gate is not None:
+            # The gate took this frame as its reference when it passed it;
+            # without a reset the motion in it would never be detected
+            self.motion_gate.reset()
+
+    def _publish(self, detected, start, captured=None):
+        """Record timings, track and hand out one detection result.
+
+        captured is the frame's capture time, where tracks are corrected.
+        """
+        elapsed = time.perf_counter() - start
+        self.stats['inference'].record(elapsed)
+        if self.motion_gate is not None:
+            self.motion_gate.record_detection(elapsed)
+        if self.tracker is not None:
+            detected = self.tracker.update(detected, now=captured)
+
+        with self.detections_lock:
+            self.latest_detections = detected
+        if self.on_detections is not None:
+            self.on_detections(detected)
+
+    def _encode_loop(self):
+        """Overlay latest detections and JPEG-encode captured frames"""
+        while self.running:
+            item = self.encode_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            seq, ref = item
+
+            # Nobody is watching: skip the draw/encode work entirely
+            tiers = self.broadcaster.active_tiers()
+            if not tiers:
+                continue
+
+            try:
+                if ref is None:
+                    encoded = self.encode_tiers(None, None, tiers)
+                else:
+                    encoded = self.encode_tiers(ref.frame, ref.pixel_format, tiers,
+                                                timestamp=ref.timestamp)
+                    if not ref.is_valid():
+                        # Torn frame: the camera reused the slot mid-encode
+                        self.overwritten['encode'] += 1
+                        continue
+                if encoded:
+                    self.broadcaster.publish(seq, encoded)
+            except Exception as e:
+                logger.error(f"Encode stage error: {e}")
+
+    def encode_frame(self, frame, pixel_format):
+        """Draw the current overlay on a frame and JPEG-encode it at the top tier"""
+        return self.encode_tiers(frame, pixel_format, [0]).get(0)
+
+    def encode_tiers(self, frame, pixel_format, tiers, timestamp=None):
+        """Composite the current overlay and encode once per tier, returns {tier: bytes}"""
+        if frame is None:
+            frame = np.zeros((480, 640, 3), dtype=np.uint8)
+            cv2.putText(frame, "NO CAMERA FEED", (200, 240),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            detected = None
+        else:
+            # imencode and the overlay colours expect BGR
+            frame = to_bgr(frame, pixel_format)
+            detected = None
+            if self.is_active():
+                if self.tracker is not None:
+                    # Tracks carried forward to this frame's capture time
+                    detected = self.tracker.predict(frame, now=timestamp)
+                else:
+                    with self.detections_lock:
+                        detected = self.latest_detections
+
+        overlay = None
+        if detected:
+            # Drawn on each tier's own buffer, never on the ring slot
+            # other consumers are reading
+            def overlay(image, scale):
+                start = time.perf_counter()
+                self.detector.draw_detections(image, detected, scale)
+                self.stats['draw'].record(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        encoded = self.encoder.encode(frame, tiers, overlay)
+        self.stats['encode'].record(time.perf_counter() - start)
+        return encoded
+
+    def get_stats(self):
+        """Get per-stage timings and queue counters"""
+        return {
+            'stages': {name: stats.snapshot() for name, stats in self.stats.items()},
+            'queues': {
+                'inference': {'depth': self.inference_queue.qsize(),
+                              'dropped': self.inference_queue.dropped},
+                'encode': {'depth': self.encode_queue.qsize(),
+                           'dropped': self.encode_queue.dropped}
+            },
+            'overwritten': dict(self.overwritten),
+            'stream': self.broadcaster.get_stats(),
+            'encoder': self.encoder.get_stats(),
+            'overlay': self.detector.overlay.get_stats(),
+            'motion_gate': self.motion_gate.get_stats() if self.motion_gate else None,
+            'tracker': self.tracker.get_stats() if self.tracker else None,
+            'pool': self.pool.get_stats() if self.pool else None,
+            'regions': self.regions.get_stats() if self.regions else None,
+            'running': self.running
+        }
@@ -0,0 +1,191 @@
+import cv2
+import numpy as np
+import threading
+import time
+import logging
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+# Pixel formats carried alongside frames. OpenCV capture, drawing and
+# JPEG encoding all work in BGR, so BGR is the native format end to end;
+# conversions happen only in the consumer that needs something else.
+PIXEL_FORMAT_BGR = 'BGR'
+PIXEL_FORMAT_RGB = 'RGB'
+
+def to_bgr(frame, pixel_format):
+    """Get a frame in BGR order, converting only if it is not already"""
+    if pixel_format == PIXEL_FORMAT_RGB:
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    return frame
+
+class FrameRef:
+    """Zero-copy handle to one frame stored in a FrameRing.
+
+    The pixel data is a view into the ring slot and stays valid until the
+    writer wraps around to that slot again; is_valid() tells whether that
+    has happened, copy() detaches the frame for long-lived use.
+    """
+    def __init__(self, ring, index, seq, timestamp, frame):
+        self.ring = ring
+        self.index = index
+        self.seq = seq
+        self.timestamp = timestamp
+        self.frame = frame
+        self.pixel_format = ring.pixel_format
+
+    def is_valid(self):
+        """Check the slot has not been overwritten since this ref was taken"""
+        return self.ring.slot_seq(self.index) == self.seq
+
+    def copy(self):
+        """Get a private copy of the pixels"""
+        return self.frame.copy()
+
+class FrameRing:
+    """Fixed-size ring of preallocated frame slots.
+
+    A single writer fills slots in place (next_slot/commit); any number of
+    readers get the newest frame or a specific sequence number as
+    zero-copy FrameRefs. With shared=True the slots and their metadata
+    live in multiprocessing.shared_memory, so other processes can attach
+    by name with FrameRing.attach().
+    """
+    def __init__(self, shape=(480, 640, 3), slots=8, shared=False, dtype=np.uint8,
+                 pixel_format=PIXEL_FORMAT_BGR):
+        self.slots = slots
+        self.pixel_format = pixel_format
+        self.shared = shared
+        self.dtype = np.dtype(dtype)
+        self.cond = threading.Condition()
+        self.write_index = -1
+        self.write_seq = 0
+        self.shm = None
+        self.retired = []
+        self.owner = True
+        self._allocate(tuple(shape))
+
+    def _allocate(self, shape):
+        """Allocate slot storage for a frame shape"""
+        self.shape = shape
+        frame_bytes = int(np.prod(shape)) * self.dtype.itemsize
+        meta_bytes = self.slots * 16
+
+        if self.shared:
+            if self.shm is not None:
+                # Readers may still hold views of the old block; free it on close()
+                self.retired.append(self.shm)
+            self.shm = shared_memory.SharedMemory(create=True, size=meta_bytes + frame_bytes * self.slots)
+            self._map(self.shm.buf, shape)
+        else:
+            self.seqs = np.zeros(self.slots, dtype=np.int64)
+            self.timestamps = np.zeros(self.slots, dtype=np.float64)
+            self.frames = np.zeros((self.slots,) + shape, dtype=self.dtype)
+        self.seqs[:] = 0
+
+    def _map(self, buffer, shape):
+        """Lay out metadata and frame arrays over a shared buffer"""
+        self.seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=buffer)
+        self.timestamps = np.ndarray((self.slots,), dtype=np.float64, buffer=buffer,
+                                     offset=self.slots * 8)
+        self.frames = np.ndarray((self.slots,) + shape, dtype=self.dtype, buffer=buffer,
+                                 offset=self.slots * 16)
+
+    @classmethod
+    def attach(cls, name, shape, slots=8, dtype=np.uint8, pixel_format=PIXEL_FORMAT_BGR):
+        """Open a read-only view of a shared ring created in another process"""
+        ring = cls.__new__(cls)
+        ring.slots = slots
+        ring.pixel_format = pixel_format
+        ring.shared = True
+        ring.dtype = np.dtype(dtype)
+        ring.cond = threading.Condition()
+        ring.retired = []
+        ring.shape = tuple(shape)
+        ring.shm = shared_memory.SharedMemory(name=name)
+        ring.owner = False
+        ring._map(ring.shm.buf, ring.shape)
+        ring.write_seq = int(ring.seqs.max())
+        ring.write_index = int(ring.seqs.argmax()) if ring.write_seq else -1
+        return ring
+
+    @property
+    def name(self):
+        """Shared memory block name (shared rings only)"""
+        return self.shm.name if self.shm is not None else None
+
+    def ensure_shape(self, shape):
+        """Reallocate slots if the source frame size changed"""
+        shape = tuple(shape)
+        if shape == self.shape:
+            return
+        with self.cond:
+            logger.info(f"Frame ring resized {self.shape} -> {shape}")
+            self._allocate(shape)
+            self.write_index = -1
+
+    def next_slot(self):
+        """Get (index, view) of the slot the writer should fill next"""
+        index = (self.write_index + 1) % self.slots
+        # Invalidate outstanding refs to this slot before it is overwritten
+        self.seqs[index] = 0
+        return index, self.frames[index]
+
+    def commit(self, index, timestamp=None):
+        """Publish a filled slot as the newest frame"""
+        with self.cond:
+            self.write_seq += 1
+            self.timestamps[index] = time.time() if timestamp is None else timestamp
+            self.seqs[index] = self.write_seq
+            self.write_index = index
+            self.cond.notify_all()
+            return self.write_seq
+
+    def slot_seq(self, index):
+        """Sequence number currently stored in a slot"""
+        return int(self.seqs[index])
+
+    def _ref(self, index):
+        """Build a ref for a slot (caller holds lock)"""
+        return FrameRef(self, index, int(self.seqs[index]),
+                        float(self.timestamps[index]), self.frames[index])
+
+    def latest(self):
+        """Newest frame, or None if nothing was written yet"""
+        with self.cond:
+            if not self.owner:
+                # Attached readers find the newest slot from shared metadata
+                self.write_index = int(self.seqs.argmax())
+                self.write_seq = int(self.seqs[self.write_index])
+            if self.write_index < 0 or self.seqs[self.write_index] == 0:
+                return None
+            return self._ref(self.write_index)
+
+    def get(self, seq):
+        """Frame with a specific sequence number, or None if overwritten"""
+        with self.cond:
+            matches = np.flatnonzero(self.seqs == seq)
+            if len(matches) == 0:
+                return None
+            return self._ref(int(matches[0]))
+
+    def wait_newer(self, after_seq, timeout=None):
+        """Block until a frame newer than after_seq is available"""
+        with self.cond:
+            if not self.cond.wait_for(
+                    lambda: self.write_seq > after_seq and self.write_index >= 0, timeout):
+                return None
+            return self._ref(self.write_index)
+
+    def close(self):
+        """Release shared memory"""
+        for shm in self.retired + ([self.shm] if self.shm is not None else []):
+            try:
+                shm.close()
+            except BufferError:
+                # Views are still alive in this process; the OS frees it at exit
+                pass
+            if self.owner:
+                shm.unlink()
+        self.retired = []
+        self.shm = None
@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import json
+import resource
+import time
+from urllib.parse import urlsplit
+
+BOUNDARY = b'--frame\r\n'
+
+def percentiles(samples):
+    """p50/p95/p99 of a list of millisecond samples"""
+    if not samples:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+    return {'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99)}
+
+async def read_head(reader):
+    """Status code and lower-cased headers of a response"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+async def read_body(reader, headers):
+    """Body by Content-Length, chunked encoding or until close"""
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length']))
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await reader.readline()
+                return bytes(body)
+            body += await reader.readexactly(size)
+            await reader.readline()
+    return await reader.read()
+
+class LoadTest:
+    """Concurrent MJPEG viewers and API pollers against a running server.
+
+    Everything runs on one event loop with raw sockets, so the client can
+    hold hundreds of connections without becoming the bottleneck itself.
+    Viewers count multipart parts; pollers reuse a keep-alive connection
+    and record each request's latency.
+    """
+    def __init__(self, url, deadline, tier='medium', poll_paths=('/get_detections', '/get_stats'),
+                 poll_interval=1.0, revalidate=False):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.deadline = deadline
+        self.tier = tier
+        self.poll_paths = poll_paths
+        self.poll_interval = poll_interval
+        self.revalidate = revalidate
+
+        # Results
+        self.viewer_fps = []
+        self.viewer_bytes = 0
+        self.first_frame_ms = []
+        self.max_gap_ms = []
+        self.viewer_errors = 0
+        self.latencies = []
+        self.statuses = {}
+        self.poll_errors = 0
+
+    async def request(self, reader, writer, path, etag=None):
+        """One keep-alive GET, returns (status, body, headers)"""
+        extra = f'If-None-Match: {etag}\r\n' if etag else ''
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n{extra}\r\n'.encode())
+        await writer.drain()
+        status, headers = await read_head(reader)
+        body = b'' if status == 304 else await read_body(reader, headers)
+        return status, body, headers
+
+    async def viewer(self, path):
+        """Read one video stream until the deadline"""
+        frames, gap, last = 0, 0.0, None
+        started = time.perf_counter()
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            writer.write(f'GET {path}?tier={self.tier} HTTP/1.1\r\nHost: {self.host}\r\n\r\n'.encode())
+            await writer.drain()
+            status, _ = await read_head(reader)
+            if status != 200:
+                raise ConnectionError(f'status {status}')
+            tail = b''
+            while time.time() < self.deadline:
+                timeout = max(0.1, self.deadline - time.time())
+                data = await asyncio.wait_for(reader.read(65536), timeout)
+                if not data:
+                    raise ConnectionError('stream closed')
+                self.viewer_bytes += len(data)
+                # Boundaries may straddle reads; keep the end of the last one
+                found = (tail + data).count(BOUNDARY)
+                tail = (tail + data)[-(len(BOUNDARY) - 1):]
+                if found:
+                    now = time.perf_counter()
+                    if last is None:
+                        self.first_frame_ms.append((now - started) * 1000)
+                    else:
+                        gap = max(gap, now - last)
+                    last = now
+                    frames += found
+        except asyncio.TimeoutError:
+            pass
+        except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+            self.viewer_errors += 1
+        finally:
+            if writer is not None:
+                writer.close()
+        self.viewer_fps.append(frames / (time.perf_counter() - started))
+        self.max_gap_ms.append(gap * 1000)
+
+    async def poller(self, offset):
+        """Poll the API paths in turn until the deadline"""
+        reader = writer = None
+        index = offset
+        # Like a browser cache: revalidate with the last ETag per path
+        etags = {}
+        while time.time() < self.deadline:
+            path = self.poll_paths[index % len(self.poll_paths)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(self.host, self.port)
+                status, _, headers = await asyncio.wait_for(
+                    self.request(reader, writer, path, etags.get(path)), 30)
+                self.latencies.append((time.perf_counter() - started) * 1000)
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+                if self.revalidate and 'etag' in headers:
+                    etags[path] = headers['etag']
+                if headers.get('connection', '').lower() == 'close':
+                    writer.close()
+                    writer = None
+            except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError):
+                self.poll_errors += 1
+                if writer is not None:
+                    writer.close()
+                writer = None
+            await asyncio.sleep(self.poll_interval)
+        if writer is not None:
+            writer.close()
+
+    async def server_threads(self):
+        """scanner_threads from /metrics, or None"""
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                status, body, _ = await asyncio.wait_for(self.request(reader, writer, '/metrics'), 30)
+            finally:
+                writer.close()
+        except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError,
+                asyncio.TimeoutError):
+            return None
+        for line in body.decode().splitlines():
+            if line.startswith('scanner_threads '):
+                return int(float(line.split()[1]))
+        return None
+
+async def run(args):
+    duration = args.ramp + args.duration
+    test = LoadTest(args.url, time.time() + duration, tier=args.tier,
+                    poll_paths=args.paths, poll_interval=args.interval, revalidate=args.etag)
+    threads_before = await test.server_threads()
+
+    tasks = []
+    # Spread connections over the ramp-up instead of opening them all at once
+    total = args.viewers + args.pollers
+    for index in range(total):
+        if index < args.viewers:
+            tasks.append(asyncio.ensure_future(test.viewer(args.stream)))
+        else:
+            tasks.append(asyncio.ensure_future(test.poller(index)))
+        if args.ramp:
+            await asyncio.sleep(args.ramp / total)
+
+    # Sample server threads while everything is connected
+    await asyncio.sleep(max(0.0, test.deadline - time.time() - 1))
+    threads_loaded = await test.server_threads()
+    await asyncio.gather(*tasks)
+
+    fps = sorted(test.viewer_fps)
+    requests = len(test.latencies)
+    return {
+        'viewers': {
+            'clients': args.viewers,
+            'errors': test.viewer_errors,
+            'fps_min': round(fps[0], 2) if fps else None,
+            'fps_median': round(fps[len(fps) // 2], 2) if fps else None,
+            'mb_per_s': round(test.viewer_bytes / duration / 1e6, 2),
+            'first_frame': percentiles(test.first_frame_ms),
+            'max_gap_ms': round(max(test.max_gap_ms), 1) if test.max_gap_ms else None
+        },
+        'pollers': {
+            'clients': args.pollers,
+            'requests': requests,
+            'requests_per_s': round(requests / duration, 1),
+            'errors': test.poll_errors,
+            'statuses': {str(code): count for code, count in sorted(test.statuses.items())},
+            'latency': percentiles(test.latencies)
+        },
+        'server_threads': {'idle': threads_before, 'loaded': threads_loaded}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a running scanner server with '
+                                                 'concurrent video viewers and API pollers')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--viewers', type=int, default=200)
+    parser.add_argument('--pollers', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds at full load')
+    parser.add_argument('--ramp', type=float, default=5.0, help='seconds to open all connections')
+    parser.add_argument('--stream', default='/video_feed')
+    parser.add_argument('--tier', default='low')
+    parser.add_argument('--paths', nargs='+', default=['/get_detections', '/get_stats'],
+                        help='API paths the pollers cycle through')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between polls per poller')
+    parser.add_argument('--etag', action='store_true',
+                        help='pollers send If-None-Match with the last ETag, like a browser')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--max-p95-ms', type=float, help='fail if poll p95 latency exceeds this')
+    parser.add_argument('--min-fps', type=float, help='fail if the slowest viewer gets fewer frames/s')
+    args = parser.parse_args()
+
+    # One socket per client
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = args.viewers + args.pollers + 64
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, needed), hard))
+
+    print(f"Load test {args.url}: {args.viewers} viewers on {args.stream} ({args.tier}), "
+          f"{args.pollers} pollers every {args.interval:g}s, {args.duration:g}s after {args.ramp:g}s ramp-up")
+    results = asyncio.run(run(args))
+
+    viewers, pollers = results['viewers'], results['pollers']
+    print(f"Viewers: {viewers['clients']} ({viewers['errors']} errors), "
+          f"fps min {viewers['fps_min']} median {viewers['fps_median']}, "
+          f"{viewers['mb_per_s']} MB/s, first frame p95 {viewers['first_frame']['p95_ms']} ms, "
+          f"max gap {viewers['max_gap_ms']} ms")
+    print(f"Pollers: {pollers['requests']} requests ({pollers['requests_per_s']}/s), "
+          f"{pollers['errors']} errors, statuses {pollers['statuses']}, latency "
+          f"p50 {pollers['latency']['p50_ms']} p95 {pollers['latency']['p95_ms']} "
+          f"p99 {pollers['latency']['p99_ms']} ms")
+    print(f"Server threads: {results['server_threads']['idle']} idle, "
+          f"{results['server_threads']['loaded']} under load")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    if viewers['errors'] or pollers['errors']:
+        failures.append(f"{viewers['errors'] + pollers['errors']} client errors")
+    p95 = pollers['latency']['p95_ms']
+    if args.max_p95_ms is not None and p95 is not None and p95 > args.max_p95_ms:
+        failures.append(f"poll p95 {p95} ms > {args.max_p95_ms:g} ms")
+    if args.min_fps is not None and (viewers['fps_min'] or 0) < args.min_fps:
+        failures.append(f"slowest viewer {viewers['fps_min']} fps < {args.min_fps:g}")
+    if failures:
+        parser.exit(1, 'FAILED: ' + '; '.join(failures) + '\n')
+
+if __name__ == '__main__':
+    main()
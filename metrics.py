@@ -0,0 +1,232 @@
+import bisect
+import os
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, 0.5 ms to 2.5 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                                      .replace('"', '\\"').replace('\n', '\\n'))
+                     for key, value in labels.items())
+    return '{' + pairs + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Cumulative latency histogram with fixed buckets.
+
+    observe() is a bisect and two additions under a lock, cheap enough
+    for per-frame use on every stage.
+    """
+    def __init__(self, name, help_text, labels=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = dict(labels or {})
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Record one duration in seconds"""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+
+    def samples(self):
+        """Exposition lines for this histogram"""
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels({**self.labels, 'le': _format_value(bound)})
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labels)
+        lines.append(f'{self.name}_sum{labels} {total!r}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+class MetricsRegistry:
+    """Histograms recorded on the hot path plus collectors read at scrape time.
+
+    Counters and gauges that components already keep (queue depths,
+    drops, clients) are not duplicated: collectors read them from the
+    components' get_stats() when /metrics is scraped, so they cost
+    nothing per frame.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.collectors = []
+
+    def histogram(self, name, help_text, labels=None, buckets=LATENCY_BUCKETS):
+        """Get or create the histogram for a name and label set"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(name, help_text, labels, buckets)
+            return histogram
+
+    def register_collector(self, collect):
+        """Add a callable returning (name, type, help, [(labels, value), ...]) tuples"""
+        with self.lock:
+            self.collectors.append(collect)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            histograms = sorted(self.histograms.values(), key=lambda h: h.name)
+            collectors = list(self.collectors)
+
+        lines = []
+        seen = set()
+        for histogram in histograms:
+            if histogram.name not in seen:
+                seen.add(histogram.name)
+                lines.append(f'# HELP {histogram.name} {histogram.help}')
+                lines.append(f'# TYPE {histogram.name} histogram')
+            lines.extend(histogram.samples())
+
+        for collect in collectors:
+            try:
+                families = list(collect())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# HELP {name} {help_text}')
+                    lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+# Process-wide registry the components record into
+REGISTRY = MetricsRegistry()
+
+def histogram(name, help_text, labels=None, buckets=LATENCY_BUCKETS):
+    """Get or create a histogram in the process-wide registry"""
+    return REGISTRY.histogram(name, help_text, labels, buckets)
+
+class SamplingProfiler:
+    """Statistical profiler sampling every thread's stack at an interval.
+
+    Off by default; while running, a background thread reads
+    sys._current_frames() every interval seconds, so the profiled code
+    is not instrumented and the overhead is set by the interval. Stacks
+    are aggregated as folded lines (flame graph input) and per-function
+    self/total sample counts.
+    """
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.samples = 0
+        self.running = False
+        self.thread = None
+        self.started_at = None
+        self.elapsed = 0.0
+
+    def start(self):
+        """Start sampling (idempotent)"""
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            self.started_at = time.time()
+            self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self.thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:g} ms interval)")
+
+    def stop(self):
+        """Stop sampling, keeping the collected samples"""
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            self.elapsed += time.time() - self.started_at
+        self.thread.join(timeout=1)
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+
+    def reset(self):
+        """Drop collected samples"""
+        with self.lock:
+            self.stacks.clear()
+            self.samples = 0
+            self.elapsed = 0.0
+            if self.running:
+                self.started_at = time.time()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while self.running:
+            time.sleep(self.interval)
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                sampled.append(';'.join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+
+    def folded(self):
+        """Collapsed stacks, one 'frame;frame;... count' line each"""
+        with self.lock:
+            return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit=25):
+        """Functions most often on top of a stack (self), with their samples anywhere in one (total)"""
+        own, total = Counter(), Counter()
+        with self.lock:
+            stacks = list(self.stacks.items())
+        for stack, count in stacks:
+            frames = stack.split(';')[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [{'function': frame, 'self': count, 'total': total[frame]}
+                for frame, count in own.most_common(limit)]
+
+    def get_stats(self):
+        """Get profiler state"""
+        with self.lock:
+            elapsed = self.elapsed + (time.time() - self.started_at if self.running else 0.0)
+            return {
+                'running': self.running,
+                'interval_ms': self.interval * 1000,
+                'samples': self.samples,
+                'seconds': round(elapsed, 1),
+                'stacks': len(self.stacks)
+            }
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class FingerprintCache:
+    """SHA-256 fingerprints of model files, remembered across restarts.
+
+    Hashing 240 MB of weights takes a while, so each file's digest is
+    stored in a small JSON manifest keyed by its path, size and mtime and
+    only recomputed when the file changes. A model's fingerprint combines
+    the digests of its config and weights, identifying exactly which
+    network is being served. Model loads use cached() and leave anything
+    missing to fingerprint_later(), which hashes on a background thread.
+    """
+    def __init__(self, path='.model_cache.json', chunk_size=4 * 1024 * 1024):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def _lookup(self, path):
+        """Manifest digest of a file if it is unchanged, else None"""
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.manifest.get(os.path.abspath(path))
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                return entry['sha256']
+        return None
+
+    def file_digest(self, path):
+        """SHA-256 of one file, from the manifest while the file is unchanged"""
+        sha256 = self._lookup(path)
+        if sha256 is not None:
+            return sha256
+
+        stat = os.stat(path)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+
+        after = os.stat(path)
+        if (after.st_size, after.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            raise OSError(f"{path} changed while it was being hashed")
+        with self.lock:
+            self.manifest[os.path.abspath(path)] = {
+                'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+            self._save()
+        return sha256
+
+    @staticmethod
+    def _combine(digests):
+        """One fingerprint from per-file digests"""
+        if len(digests) == 1:
+            return digests[0]
+        combined = hashlib.sha256()
+        for digest in digests:
+            combined.update(digest.encode())
+        return combined.hexdigest()
+
+    def fingerprint(self, *paths):
+        """Combined fingerprint of several files, e.g. config and weights"""
+        return self._combine([self.file_digest(path) for path in paths])
+
+    def cached(self, *paths):
+        """Combined fingerprint if every file is in the manifest, else None (no hashing)"""
+        digests = [self._lookup(path) for path in paths]
+        return None if None in digests else self._combine(digests)
+
+    def fingerprint_later(self, files, callback):
+        """Hash files on a background thread and pass the fingerprint to callback.
+
+        files are (path, size, mtime_ns) as recorded at load time; if any
+        file changed since, the callback is not called, as the result would
+        describe a different model.
+        """
+        def run():
+            try:
+                for path, size, mtime_ns in files:
+                    stat = os.stat(path)
+                    if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                        return
+                fingerprint = self.fingerprint(*(path for path, _, _ in files))
+            except OSError as e:
+                logger.warning(f"Could not fingerprint model files: {e}")
+                return
+            callback(fingerprint)
+
+        thread = threading.Thread(target=run, name='model-fingerprint', daemon=True)
+        thread.start()
+        return thread
+
+    def _save(self):
+        """Write the manifest atomically (caller holds lock)"""
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(self.manifest, f, indent=1)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write model cache {self.path}: {e}")
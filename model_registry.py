@@ -0,0 +1,159 @@
+import numpy as np
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """Background model loader with an LRU pool of warm networks.
+
+    request() never blocks on disk I/O: a model that is already warm is
+    activated immediately, otherwise it is read and warmed up on a loader
+    thread while the current model keeps serving frames. Once ready, the
+    most recently requested model is swapped in through
+    ObjectDetector.use_context, which takes effect at the next frame.
+    """
+    def __init__(self, detector, max_warm=2):
+        self.detector = detector
+        self.max_warm = max_warm
+        self.lock = threading.Lock()
+        self.warm = OrderedDict()
+        self.status = {}
+        self.target = None
+
+    def register(self, ctx):
+        """Add an already loaded context to the warm pool"""
+        with self.lock:
+            self.warm[ctx.model_name] = ctx
+            self.warm.move_to_end(ctx.model_name)
+            self.status[ctx.model_name] = {
+                'state': 'ready',
+                'stage': 'ready',
+                'progress': 1.0,
+                'load_seconds': None,
+                'error': None
+            }
+            self._evict()
+
+    def request(self, model_name):
+        """Switch to a model, loading it in the background if needed.
+
+        Returns 'ready' if the model was warm and is now active, or
+        'loading' if a background load is in progress.
+        """
+        if model_name not in self.detector.MODEL_PATHS:
+            raise ValueError(f"Model {model_name} not supported")
+
+        with self.lock:
+            self.target = model_name
+            ctx = self.warm.get(model_name)
+            if ctx is not None and self.detector.files_changed(ctx):
+                # Weights were replaced on disk; reload rather than serve stale ones
+                logger.info(f"Model files for {model_name} changed, reloading")
+                del self.warm[model_name]
+                ctx = None
+            if ctx is not None:
+                self.warm.move_to_end(model_name)
+            elif self.status.get(model_name, {}).get('state') == 'loading':
+                return 'loading'
+            else:
+                self.status[model_name] = {
+                    'state': 'loading',
+                    'stage': 'queued',
+                    'progress': 0.0,
+                    'load_seconds': None,
+                    'error': None
+                }
+                threading.Thread(target=self._load, args=(model_name,),
+                                 name=f'model-loader-{model_name}', daemon=True).start()
+                return 'loading'
+
+        self.detector.use_context(ctx)
+        logger.info(f"Switched to warm model {model_name}")
+        return 'ready'
+
+    def _set_stage(self, model_name, stage, progress):
+        """Update load progress"""
+        with self.lock:
+            self.status[model_name].update({'stage': stage, 'progress': progress})
+
+    def _load(self, model_name):
+        """Load and warm up a model on a background thread"""
+        started = time.time()
+        try:
+            self._set_stage(model_name, 'reading weights', 0.1)
+            ctx = self.detector.build_context(model_name)
+
+            # The first forward pass allocates backend buffers; do it here
+            # instead of on the stream's first frame after the swap
+            self._set_stage(model_name, 'warming up', 0.7)
+            width, height = ctx.input_size
+            with ctx.lock:
+                ctx.prepare_blob(np.zeros((height, width, 3), dtype=np.uint8))
+                ctx.net.setInput(ctx.blob)
+                ctx.net.forward(ctx.output_layers)
+        except Exception as e:
+            logger.error(f"Background load of {model_name} failed: {e}")
+            with self.lock:
+                self.status[model_name].update({
+                    'state': 'error',
+                    'stage': 'failed',
+                    'error': str(e)
+                })
+            return
+
+        load_seconds = time.time() - started
+        with self.lock:
+            self.warm[model_name] = ctx
+            self.warm.move_to_end(model_name)
+            self.status[model_name].update({
+                'state': 'ready',
+                'stage': 'ready',
+                'progress': 1.0,
+                'load_seconds': round(load_seconds, 2)
+            })
+            activate = self.target == model_name
+            self._evict()
+
+        logger.info(f"Model {model_name} loaded in {load_seconds:.1f}s")
+        if activate:
+            self.detector.use_context(ctx)
+            logger.info(f"Switched to model {model_name}")
+
+    def _evict(self):
+        """Drop least recently used warm models (caller holds lock)"""
+        active = self.detector.context
+        for model_name in list(self.warm):
+            if len(self.warm) <= self.max_warm:
+                break
+            if self.warm[model_name] is active or model_name == self.target:
+                continue
+            del self.warm[model_name]
+            self.status[model_name].update({'state': 'evicted', 'stage': 'evicted', 'progress': 0.0})
+            logger.info(f"Evicted warm model {model_name}")
+
+    def get_status(self):
+        """Get load state and latency for every known model"""
+        with self.lock:
+            models = {}
+            for model_name, status in self.status.items():
+                ctx = self.warm.get(model_name)
+                models[model_name] = {
+                    **status,
+                    'warm': ctx is not None,
+                    'fingerprint': ctx.fingerprint if ctx is not None else None,
+                    'frames': ctx.frames if ctx is not None else 0,
+                    'avg_latency_ms': round(ctx.avg_latency_ms, 2) if ctx is not None else None
+                }
+        return {
+            'active': self.detector.get_current_model(),
+            'target': self.target,
+            'max_warm': self.max_warm,
+            'models': models
+        }
+
+    def is_ready(self):
+        """Whether a model is active and serving frames"""
+        return self.detector.context is not None
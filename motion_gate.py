@@ -0,0 +1,131 @@
+import cv2
+import numpy as np
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MotionGate:
+    """Adaptive inference scheduler based on cheap frame differencing.
+
+    Each frame is shrunk to a small grayscale thumbnail and compared with
+    the thumbnail of the last frame that went through the detector. A full
+    detection pass runs on the first frame, every keyframe_interval frames,
+    or when the fraction of changed pixels reaches motion_threshold; in
+    between, callers reuse the previous detections.
+    """
+    def __init__(self, keyframe_interval=15, motion_threshold=0.01,
+                 pixel_threshold=25, thumbnail_size=(64, 48), enabled=True):
+        self.keyframe_interval = keyframe_interval
+        self.motion_threshold = motion_threshold
+        self.pixel_threshold = pixel_threshold
+        self.thumbnail_size = thumbnail_size
+        self.enabled = enabled
+        self.lock = threading.Lock()
+
+        # Reusable thumbnail buffers
+        width, height = thumbnail_size
+        self.small = np.empty((height, width, 3), dtype=np.uint8)
+        self.gray = np.empty((height, width), dtype=np.uint8)
+        self.reference = np.empty((height, width), dtype=np.uint8)
+        self.diff = np.empty((height, width), dtype=np.uint8)
+        self.has_reference = False
+        self.frames_since_detection = 0
+
+        # Counters
+        self.frames = 0
+        self.detections = 0
+        self.skipped = 0
+        self.keyframes = 0
+        self.motion_triggers = 0
+        self.last_motion = 0.0
+        self.gate_seconds = 0.0
+        self.detection_seconds = 0.0
+
+    def reset(self):
+        """Force a detection on the next frame"""
+        with self.lock:
+            self.has_reference = False
+
+    def configure(self, **settings):
+        """Update tuning parameters"""
+        with self.lock:
+            for key in ('keyframe_interval', 'motion_threshold', 'pixel_threshold', 'enabled'):
+                if key in settings:
+                    setattr(self, key, settings[key])
+            self.has_reference = False
+
+    def should_detect(self, frame):
+        """Return (run_detection, reason) for a frame"""
+        started = time.perf_counter()
+        with self.lock:
+            self.frames += 1
+
+            if not self.enabled:
+                reason = 'disabled'
+            else:
+                cv2.resize(frame, self.thumbnail_size, dst=self.small,
+                           interpolation=cv2.INTER_AREA)
+                cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+
+                if not self.has_reference:
+                    reason = 'first'
+                else:
+                    self.frames_since_detection += 1
+                    cv2.absdiff(self.gray, self.reference, dst=self.diff)
+                    changed = cv2.countNonZero(
+                        cv2.threshold(self.diff, self.pixel_threshold, 255,
+                                      cv2.THRESH_BINARY, dst=self.diff)[1])
+                    self.last_motion = changed / self.diff.size
+
+                    if self.last_motion >= self.motion_threshold:
+                        reason = 'motion'
+                        self.motion_triggers += 1
+                    elif self.frames_since_detection >= self.keyframe_interval:
+                        reason = 'keyframe'
+                        self.keyframes += 1
+                    else:
+                        reason = None
+
+                if reason is not None:
+                    # Compare future frames with the scene the detector last saw
+                    self.reference[...] = self.gray
+                    self.has_reference = True
+                    self.frames_since_detection = 0
+
+            if reason is None:
+                self.skipped += 1
+            self.gate_seconds += time.perf_counter() - started
+            return reason is not None, reason
+
+    def record_detection(self, seconds):
+        """Account for one full detection pass"""
+        with self.lock:
+            self.detections += 1
+            self.detection_seconds += seconds
+
+    def get_stats(self):
+        """Get skip rate and estimated CPU time saved"""
+        with self.lock:
+            frames = self.frames or 1
+            avg_detection_ms = (self.detection_seconds / self.detections * 1000
+                                if self.detections else 0.0)
+            gate_ms = self.gate_seconds / frames * 1000
+            saved_ms = self.skipped * avg_detection_ms - self.gate_seconds * 1000
+            return {
+                'enabled': self.enabled,
+                'keyframe_interval': self.keyframe_interval,
+                'motion_threshold': self.motion_threshold,
+                'pixel_threshold': self.pixel_threshold,
+                'frames': self.frames,
+                'detections': self.detections,
+                'skipped': self.skipped,
+                'skip_rate': round(self.skipped / frames, 3),
+                'keyframes': self.keyframes,
+                'motion_triggers': self.motion_triggers,
+                'last_motion': round(self.last_motion, 4),
+                'avg_gate_ms': round(gate_ms, 3),
+                'avg_detection_ms': round(avg_detection_ms, 2),
+                'cpu_saved_seconds': round(max(saved_ms, 0) / 1000, 2)
+            }
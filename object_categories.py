@@ -0,0 +1,59 @@
+from datetime import datetime
+
+# Object categories with descriptions
+OBJECT_CATEGORIES = {
+    'person': 'Human Being',
+    'car': 'Vehicle - Car',
+    'motorcycle': 'Vehicle - Motorcycle',
+    'bus': 'Vehicle - Bus',
+    'truck': 'Vehicle - Truck',
+    'bicycle': 'Vehicle - Bicycle',
+    'traffic light': 'Traffic Signal',
+    'stop sign': 'Road Sign - Stop',
+    'chair': 'Furniture - Chair',
+    'sofa': 'Furniture - Sofa',
+    'bed': 'Furniture - Bed',
+    'dining table': 'Furniture - Table',
+    'tv': 'Electronics - Television',
+    'laptop': 'Electronics - Laptop',
+    'mouse': 'Electronics - Computer Mouse',
+    'keyboard': 'Electronics - Keyboard',
+    'cell phone': 'Electronics - Mobile Phone',
+    'book': 'Stationery - Book',
+    'clock': 'Decor - Clock',
+    'vase': 'Decor - Vase',
+    'scissors': 'Tool - Scissors',
+    'teddy bear': 'Toy - Teddy Bear',
+    'hair drier': 'Appliance - Hair Dryer',
+    'toothbrush': 'Personal Care - Toothbrush',
+    'cup': 'Kitchenware - Cup',
+    'fork': 'Kitchenware - Fork',
+    'knife': 'Kitchenware - Knife',
+    'spoon': 'Kitchenware - Spoon',
+    'bowl': 'Kitchenware - Bowl',
+    'banana': 'Food - Banana',
+    'apple': 'Food - Apple',
+    'sandwich': 'Food - Sandwich',
+    'orange': 'Food - Orange',
+    'broccoli': 'Food - Broccoli',
+    'carrot': 'Food - Carrot',
+    'hot dog': 'Food - Hot Dog',
+    'pizza': 'Food - Pizza',
+    'donut': 'Food - Donut',
+    'cake': 'Food - Cake',
+    'bottle': 'Container - Bottle',
+    'wine glass': 'Container - Wine Glass',
+    'cup': 'Container - Cup',
+    'fork': 'Utensil - Fork',
+    'knife': 'Utensil - Knife',
+    'spoon': 'Utensil - Spoon'
+}
+
+def enrich_objects(objects, scan_time=None):
+    """Add category descriptions and the scan time to detections"""
+    scan_time = scan_time or datetime.now().isoformat()
+    return [{
+        **obj,
+        'category': OBJECT_CATEGORIES.get(obj['class'], 'Unknown Object'),
+        'scan_time': scan_time
+    } for obj in objects]
@@ -1,25 +1,147 @@
 import cv2
 import numpy as np
+import os
 from datetime import datetime
+import threading
+import time
 import logging
+from frame_ring import PIXEL_FORMAT_BGR
+from overlay_renderer import OverlayRenderer
+import metrics
 
 logger = logging.getLogger(__name__)
 
+class InferenceContext:
+    """Per-model inference state computed once when a model is loaded.
+
+    Holds the network, its output layer names, the input size and the
+    reusable resize/blob buffers, so the per-frame path does no layer
+    lookups and no full-frame allocations. The lock serializes use of the
+    network and the shared buffers. Stage timings go to per-model metrics
+    histograms.
+    """
+    def __init__(self, net, model_name, input_size=(416, 416), num_classes=80):
+        self.net = net
+        self.model_name = model_name
+        self.input_size = input_size
+        self.num_classes = num_classes
+        self.lock = threading.Lock()
+        
+        # Model files as (path, size, mtime_ns) and their combined SHA-256,
+        # None until it was hashed in the background
+        self.files = []
+        self.fingerprint = None
+        
+        # getUnconnectedOutLayersNames works on every OpenCV 4.x/5.x layout
+        self.output_layers = list(net.getUnconnectedOutLayersNames())
+        
+        # Reusable input buffers
+        width, height = input_size
+        self.resize_buffer = np.empty((height, width, 3), dtype=np.uint8)
+        self.blob = np.empty((1, 3, height, width), dtype=np.float32)
+        self.batch_blob = self.blob
+        
+        # Decoder layout: x, y, w, h, objectness, then one score per class
+        self.row_size = 5 + num_classes
+        self.detections_buffer = None
+        self.confidences_buffer = None
+        self.mask_buffer = None
+        
+        # Inference latency
+        self.frames = 0
+        self.avg_latency_ms = 0.0
+        labels = {'model': model_name}
+        self.blob_hist = metrics.histogram(
+            'scanner_blob_seconds', 'Resize and blob preparation time per forward pass', labels)
+        self.forward_hist = metrics.histogram(
+            'scanner_forward_seconds', 'Network forward pass time', labels)
+        self.decode_hist = metrics.histogram(
+            'scanner_decode_seconds', 'YOLO output decoding time per frame', labels)
+        self.nms_hist = metrics.histogram(
+            'scanner_nms_seconds', 'Non-maximum suppression time per frame', labels)
+    
+    def record_latency(self, seconds, frames=1):
+        """Update the running average inference latency (caller holds lock)"""
+        ms = seconds * 1000.0
+        self.avg_latency_ms = ms if self.frames == 0 else (
+            0.1 * ms + 0.9 * self.avg_latency_ms)
+        self.frames += frames
+    
+    def prepare_blob(self, frame, out=None, pixel_format=PIXEL_FORMAT_BGR):
+        """Resize and convert a frame into an NCHW RGB blob in place.
+
+        The channel reorder is folded into the HWC -> CHW copy, so BGR
+        input costs no extra pass; RGB input is copied straight through.
+        """
+        if out is None:
+            out = self.blob[0]
+        cv2.resize(frame, self.input_size, dst=self.resize_buffer)
+        
+        # HWC -> CHW in RGB order, scaled to [0, 1]
+        chw = self.resize_buffer.transpose(2, 0, 1)
+        if pixel_format == PIXEL_FORMAT_BGR:
+            chw = chw[::-1]
+        np.multiply(chw, np.float32(1/255.0), out=out)
+        return out
+    
+    def prepare_batch_blob(self, frames, pixel_formats):
+        """Fill the reusable batch blob with several frames"""
+        if self.batch_blob.shape[0] < len(frames):
+            width, height = self.input_size
+            self.batch_blob = np.empty((len(frames), 3, height, width), dtype=np.float32)
+        
+        for index, (frame, pixel_format) in enumerate(zip(frames, pixel_formats)):
+            self.prepare_blob(frame, out=self.batch_blob[index], pixel_format=pixel_format)
+        return self.batch_blob[:len(frames)]
+    
+    def decode_buffers(self, rows):
+        """Get decoder scratch buffers sized for one frame's output rows"""
+        if self.detections_buffer is None or len(self.detections_buffer) != rows:
+            self.detections_buffer = np.empty((rows, self.row_size), dtype=np.float32)
+            self.confidences_buffer = np.empty(rows, dtype=np.float32)
+            self.mask_buffer = np.empty(rows, dtype=bool)
+        return self.detections_buffer, self.confidences_buffer, self.mask_buffer
+
 class ObjectDetector:
+    MODEL_PATHS = {
+        'yolov3': {
+            'config': 'yolov3.cfg',
+            'weights': 'yolov3.weights'
+        },
+        'yolov3-tiny': {
+            'config': 'yolov3-tiny.cfg',
+            'weights': 'yolov3-tiny.weights'
+        },
+        'yolov4': {
+            'config': 'yolov4.cfg',
+            'weights': 'yolov4.weights'
+        },
+        'yolov4-tiny': {
+            'config': 'yolov4-tiny.cfg',
+            'weights': 'yolov4-tiny.weights'
+        }
+    }
+    
     def __init__(self):
-        self.net = None
+        self.context = None
         self.classes = []
         self.confidence_threshold = 0.5
         self.nms_threshold = 0.4
         self.current_model = None
         self.colors = None
         
+        # Optional FingerprintCache for model files
+        self.fingerprints = None
+        
         # Load COCO class names
         self.load_coco_classes()
         
         # Generate random colors for each class
         np.random.seed(42)
         self.colors = np.random.randint(0, 255, size=(len(self.classes), 3), dtype="uint8")
+        
+        # Class colour map and label sprite cache for overlays
+        self.overlay = OverlayRenderer(self.classes, self.colors)
     
     def load_coco_classes(self):
         """Load COCO dataset class names"""
@@ -47,202 +169,279 @@ class ObjectDetector:
             logger.info(f"Using default {len(self.classes)} classes")
     
     def load_model(self, model_name='yolov3'):
-        """Load YOLO model"""
+        """Load YOLO model.
+
+        Returns False if it cannot be loaded; there is no silent fallback
+        to another model, whose outputs the YOLO decoder could not parse.
+        """
         try:
-            model_paths = {
-                'yolov3': {
-                    'config': 'yolov3.cfg',
-                    'weights': 'yolov3.weights'
-                },
-                'yolov3-tiny': {
-                    'config': 'yolov3-tiny.cfg',
-                    'weights': 'yolov3-tiny.weights'
-                },
-                'yolov4': {
-                    'config': 'yolov4.cfg',
-                    'weights': 'yolov4.weights'
-                },
-                'yolov4-tiny': {
-                    'config': 'yolov4-tiny.cfg',
-                    'weights': 'yolov4-tiny.weights'
-                }
-            }
-            
-            if model_name not in model_paths:
-                logger.error(f"Model {model_name} not supported")
-                return False
-            
-            config = model_paths[model_name]['config']
-            weights = model_paths[model_name]['weights']
-            
-            # Try to load from local files
-            self.net = cv2.dnn.readNet(weights, config)
-            
-            # Try to use GPU if available
-            try:
-                self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
-                self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
-                logger.info(f"Using GPU acceleration for {model_name}")
-            except:
-                logger.info(f"Using CPU for {model_name}")
-            
-            self.current_model = model_name
+            self.use_context(self.build_context(model_name))
             logger.info(f"Model {model_name} loaded successfully")
             return True
             
         except Exception as e:
             logger.error(f"Error loading model {model_name}: {e}")
-            
-            # Fallback to MobileNet SSD
-            try:
-                prototxt = 'MobileNetSSD_deploy.prototxt'
-                model = 'MobileNetSSD_deploy.caffemodel'
-                self.net = cv2.dnn.readNetFromCaffe(prototxt, model)
-                self.current_model = 'ssd_mobilenet'
-                logger.info("Loaded MobileNet SSD as fallback")
-                return True
-            except:
-                logger.error("Could not load any detection model")
-                return False
-    
-    def detect_objects(self, frame):
+            return False
+    
+    def build_context(self, model_name):
+        """Read a model from disk and build its InferenceContext.
+
+        Does not touch the active model, so it can run on a background
+        thread while detection continues. Raises on failure.
+        """
+        if model_name not in self.MODEL_PATHS:
+            raise ValueError(f"Model {model_name} not supported")
+        
+        config = self.MODEL_PATHS[model_name]['config']
+        weights = self.MODEL_PATHS[model_name]['weights']
+        for path in (config, weights):
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"Model file {path} not found")
+        
+        # Identity of what gets loaded; hashing waits for the background
+        files = [(path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in (config, weights)]
+        fingerprint = self.fingerprints.cached(config, weights) if self.fingerprints else None
+        
+        # Try to load from local files
+        net = cv2.dnn.readNet(weights, config)
+        
+        # Try to use GPU if available
+        try:
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+            logger.info(f"Using GPU acceleration for {model_name}")
+        except:
+            logger.info(f"Using CPU for {model_name}")
+        
+        ctx = InferenceContext(net, model_name, self.read_input_size(config), len(self.classes))
+        ctx.files = files
+        ctx.fingerprint = fingerprint
+        if fingerprint is None and self.fingerprints is not None:
+            # First load of these files: hash them without delaying the model
+            self.fingerprints.fingerprint_later(
+                files, lambda fingerprint: setattr(ctx, 'fingerprint', fingerprint))
+        return ctx
+    
+    @staticmethod
+    def files_changed(ctx):
+        """Whether a context's model files were replaced since it was built"""
+        try:
+            return any(os.stat(path).st_size != size or os.stat(path).st_mtime_ns != mtime_ns
+                       for path, size, mtime_ns in ctx.files)
+        except OSError:
+            return False
+    
+    def use_context(self, ctx):
+        """Make a context the active model.
+
+        detect_objects and detect_batch read self.context once per call, so
+        frames already in flight finish on the previous model and the swap
+        takes effect at the next frame boundary.
+        """
+        self.context = ctx
+        self.current_model = ctx.model_name
+    
+    @property
+    def net(self):
+        """Currently loaded network"""
+        return self.context.net if self.context is not None else None
+    
+    def use_net(self, net, model_name, input_size=(416, 416)):
+        """Build the inference context for a loaded network and activate it"""
+        self.use_context(InferenceContext(net, model_name, input_size, len(self.classes)))
+    
+    def read_input_size(self, config):
+        """Read network input size from a darknet .cfg file"""
+        size = {'width': 416, 'height': 416}
+        try:
+            with open(config, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith('[') and line != '[net]':
+                        break
+                    key, _, value = line.partition('=')
+                    if key.strip() in size:
+                        size[key.strip()] = int(value)
+        except (OSError, ValueError):
+            pass
+        return (size['width'], size['height'])
+    
+    def detect_objects(self, frame, pixel_format=PIXEL_FORMAT_BGR):
         """Detect objects in frame"""
-        if self.net is None:
+        ctx = self.context
+        if ctx is None:
             return []
         
         height, width = frame.shape[:2]
         
         try:
-            # Prepare blob for neural network
-            blob = cv2.dnn.blobFromImage(
-                frame, 1/255.0, (416, 416),
-                swapRB=True, crop=False
-            )
-            
-            self.net.setInput(blob)
-            
-            # Get output layer names
-            layer_names = self.net.getLayerNames()
-            output_layers = [layer_names[i[0] - 1] for i in self.net.getUnconnectedOutLayers()]
-            
-            # Forward pass
-            outputs = self.net.forward(output_layers)
-            
-            # Process detections
-            boxes = []
-            confidences = []
-            class_ids = []
-            
-            for output in outputs:
-                for detection in output:
-                    scores = detection[5:]
-                    class_id = np.argmax(scores)
-                    confidence = scores[class_id]
-                    
-                    if confidence > self.confidence_threshold:
-                        # Object detected
-                        center_x = int(detection[0] * width)
-                        center_y = int(detection[1] * height)
-                        w = int(detection[2] * width)
-                        h = int(detection[3] * height)
-                        
-                        # Rectangle coordinates
-                        x = int(center_x - w / 2)
-                        y = int(center_y - h / 2)
-                        
-                        boxes.append([x, y, w, h])
-                        confidences.append(float(confidence))
-                        class_ids.append(class_id)
-            
-            # Apply Non-Maximum Suppression
-            indexes = cv2.dnn.NMSBoxes(boxes, confidences, 
-                                      self.confidence_threshold, 
-                                      self.nms_threshold)
-            
-            # Prepare results
-            results = []
-            if len(indexes) > 0:
-                for i in indexes.flatten():
-                    x, y, w, h = boxes[i]
-                    class_id = class_ids[i]
-                    
-                    result = {
-                        'class': self.classes[class_id],
-                        'confidence': float(confidences[i]),
-                        'bbox': [int(x), int(y), int(w), int(h)],
-                        'area': int(w * h),
-                        'center': [int(x + w/2), int(y + h/2)],
-                        'timestamp': datetime.now().isoformat()
-                    }
-                    results.append(result)
-            
-            return results
+            with ctx.lock:
+                started = time.perf_counter()
+                
+                # Prepare blob for neural network
+                ctx.prepare_blob(frame, pixel_format=pixel_format)
+                ctx.net.setInput(ctx.blob)
+                prepared = time.perf_counter()
+                ctx.blob_hist.observe(prepared - started)
+                
+                # Forward pass
+                outputs = ctx.net.forward(ctx.output_layers)
+                ctx.forward_hist.observe(time.perf_counter() - prepared)
+                
+                results = self.process_outputs(outputs, width, height, ctx)
+                ctx.record_latency(time.perf_counter() - started)
+                return results
             
         except Exception as e:
             logger.error(f"Detection error: {e}")
             return []
     
-    def draw_detections(self, frame, detections):
-        """Draw detection results on frame"""
+    def detect_batch(self, frames, pixel_format=PIXEL_FORMAT_BGR):
+        """Detect objects in several frames with one forward pass.
+
+        Frames may come from different cameras and have different sizes;
+        each one is resized into the shared batch blob and its
+        detections are scaled back to its own resolution. pixel_format is
+        one format for all frames or a list with one per frame. Returns one
+        detection list per input frame.
+        """
+        if not frames:
+            return []
+        ctx = self.context
+        if ctx is None:
+            return [[] for _ in frames]
+        
+        try:
+            with ctx.lock:
+                started = time.perf_counter()
+                
+                # Stack all frames into one NCHW blob
+                if isinstance(pixel_format, str):
+                    pixel_format = [pixel_format] * len(frames)
+                blob = ctx.prepare_batch_blob(frames, pixel_format)
+                ctx.net.setInput(blob)
+                prepared = time.perf_counter()
+                ctx.blob_hist.observe(prepared - started)
+                
+                # Forward pass
+                outputs = ctx.net.forward(ctx.output_layers)
+                ctx.forward_hist.observe(time.perf_counter() - prepared)
+                
+                results = []
+                for index, frame in enumerate(frames):
+                    height, width = frame.shape[:2]
+                    frame_outputs = self.split_batch_outputs(outputs, len(frames), index)
+                    results.append(self.process_outputs(frame_outputs, width, height, ctx))
+                ctx.record_latency(time.perf_counter() - started, len(frames))
+                return results
+            
+        except Exception as e:
+            logger.error(f"Batch detection error: {e}")
+            return [[] for _ in frames]
+    
+    def split_batch_outputs(self, outputs, batch_size, index):
+        """Get the output rows belonging to one frame of a batch"""
+        frame_outputs = []
+        for output in outputs:
+            if output.ndim == 3 and output.shape[0] == batch_size:
+                frame_outputs.append(output[index])
+            else:
+                # Region layers stack the batch along the row axis
+                rows = output.reshape(batch_size, -1, output.shape[-1])
+                frame_outputs.append(rows[index])
+        return frame_outputs
+    
+    def decode_outputs(self, outputs, width, height, ctx=None):
+        """Decode raw YOLO output tensors into candidate boxes.
+
+        All output layers are concatenated into one (N, 5 + classes) array
+        and decoded with array operations instead of a per-row Python loop.
+        Returns (boxes, confidences, class_ids) as NumPy arrays, boxes in
+        integer [x, y, w, h] pixel coordinates. With an InferenceContext the
+        full-size intermediate arrays are written into its reusable buffers.
+        """
+        outputs = [np.asarray(output).reshape(-1, output.shape[-1]) for output in outputs]
+        rows = sum(len(output) for output in outputs)
+        
+        if ctx is not None and outputs and outputs[0].shape[1] == ctx.row_size:
+            detections, confidences, mask = ctx.decode_buffers(rows)
+            np.concatenate(outputs, out=detections)
+            detections[:, 5:].max(axis=1, out=confidences)
+            np.greater(confidences, self.confidence_threshold, out=mask)
+        else:
+            detections = np.concatenate(outputs)
+            confidences = detections[:, 5:].max(axis=1)
+            mask = confidences > self.confidence_threshold
+        
+        # Drop everything under the confidence threshold before box math;
+        # argmax copies its input, so only run it on the surviving rows
+        detections = detections[mask]
+        confidences = confidences[mask]
+        class_ids = detections[:, 5:].argmax(axis=1)
+        
+        # Center/size to top-left rectangle, same truncation as int()
+        center_x = (detections[:, 0] * width).astype(np.int64)
+        center_y = (detections[:, 1] * height).astype(np.int64)
+        w = (detections[:, 2] * width).astype(np.int64)
+        h = (detections[:, 3] * height).astype(np.int64)
+        x = (center_x - w / 2).astype(np.int64)
+        y = (center_y - h / 2).astype(np.int64)
+        
+        boxes = np.stack([x, y, w, h], axis=1)
+        return boxes, confidences.astype(np.float32), class_ids
+    
+    def non_max_suppression(self, boxes, confidences, class_ids):
+        """Class-wise NMS, returns indexes of the boxes to keep"""
+        if len(boxes) == 0:
+            return np.empty(0, dtype=np.int64)
+        
+        # Shift each class into its own coordinate range so one NMSBoxes
+        # call never suppresses boxes of different classes
+        offset = int((boxes[:, 0] + boxes[:, 2]).max() - boxes[:, 0].min()) + 1
+        shifted = boxes.astype(np.float64)
+        shifted[:, :2] += (class_ids * offset)[:, None]
+        
+        indexes = cv2.dnn.NMSBoxes(shifted.tolist(), confidences.tolist(),
+                                   self.confidence_threshold,
+                                   self.nms_threshold)
+        return np.asarray(indexes, dtype=np.int64).reshape(-1)
+    
+    def process_outputs(self, outputs, width, height, ctx=None):
+        """Decode, suppress and format raw network outputs"""
+        started = time.perf_counter()
+        boxes, confidences, class_ids = self.decode_outputs(outputs, width, height, ctx)
+        decoded = time.perf_counter()
+        keep = self.non_max_suppression(boxes, confidences, class_ids)
+        if ctx is not None:
+            ctx.decode_hist.observe(decoded - started)
+            ctx.nms_hist.observe(time.perf_counter() - decoded)
+        
+        # Prepare results
+        results = []
+        timestamp = datetime.now().isoformat()
+        for i in keep:
+            x, y, w, h = (int(v) for v in boxes[i])
+            results.append({
+                'class': self.classes[int(class_ids[i])],
+                'confidence': float(confidences[i]),
+                'bbox': [x, y, w, h],
+                'area': int(w * h),
+                'center': [int(x + w/2), int(y + h/2)],
+                'timestamp': timestamp
+            })
+        
+        return results
+    
+    def draw_detections(self, frame, detections, scale=1.0):
+        """Draw detection results on frame (in place, returns frame).
+
+        scale maps full-resolution boxes onto a resized frame.
+        """
         if not detections:
             return frame
         
-        height, width = frame.shape[:2]
-        
-        for obj in detections:
-            class_name = obj['class']
-            confidence = obj['confidence']
-            x, y, w, h = obj['bbox']
-            
-            # Get color for this class
-            class_id = self.classes.index(class_name) if class_name in self.classes else 0
-            color = [int(c) for c in self.colors[class_id]]
-            
-            # Draw bounding box
-            cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
-            
-            # Draw label background
-            label = f"{class_name}: {confidence:.2f}"
-            (label_width, label_height), baseline = cv2.getTextSize(
-                label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1
-            )
-            
-            cv2.rectangle(
-                frame, 
-                (x, y - label_height - baseline - 10),
-                (x + label_width, y),
-                color,
-                -1
-            )
-            
-            # Draw label text
-            cv2.putText(
-                frame, 
-                label,
-                (x, y - baseline - 5),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                (255, 255, 255),
-                1
-            )
-            
-            # Draw center point
-            center_x, center_y = obj['center']
-            cv2.circle(frame, (center_x, center_y), 3, color, -1)
-        
-        # Draw detection info
-        info_text = f"Objects: {len(detections)} | Model: {self.current_model}"
-        cv2.putText(
-            frame,
-            info_text,
-            (10, height - 10),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.5,
-            (0, 255, 0),
-            1
-        )
-        
-        return frame
+        info = f"Objects: {len(detections)} | Model: {self.current_model}"
+        return self.overlay.draw(frame, detections, scale, info)
     
     def get_current_model(self):
         """Get current model name"""
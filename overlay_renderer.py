@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+INFO_COLOR = (0, 255, 0)
+
+class OverlayRenderer:
+    """Detection overlay with precomputed colours and cached label sprites.
+
+    Class colours are looked up in a dict built once. Labels are rendered
+    once per (class, displayed confidence, font size) into small sprites
+    kept in an LRU cache, so drawing a box is one rectangle, one array copy
+    and one dot. The overlay is always drawn onto a caller-owned frame:
+    the stream encoder composites it at each tier's resolution onto that
+    tier's resized (or copied) buffer, never onto the captured frame.
+    """
+    def __init__(self, classes, colors, max_sprites=2048):
+        self.class_colors = {name: tuple(int(c) for c in colors[i])
+                             for i, name in enumerate(classes)}
+        self.default_color = tuple(int(c) for c in colors[0]) if len(colors) else (0, 255, 0)
+        self.max_sprites = max_sprites
+        self.sprites = OrderedDict()
+        self.lock = threading.Lock()
+        self.sprite_hits = 0
+        self.sprite_misses = 0
+
+    def color(self, class_name):
+        """Colour for a class"""
+        return self.class_colors.get(class_name, self.default_color)
+
+    def _sprite(self, key, render):
+        """Get a cached sprite, rendering it on a miss (caller holds lock)"""
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key)
+            self.sprite_hits += 1
+            return sprite
+        self.sprite_misses += 1
+        sprite = self.sprites[key] = render()
+        if len(self.sprites) > self.max_sprites:
+            self.sprites.popitem(last=False)
+        return sprite
+
+    def label_sprite(self, class_name, confidence, font_scale):
+        """Filled label box with the class name and confidence"""
+        label = f"{class_name}: {confidence:.2f}"
+
+        def render():
+            (label_width, label_height), baseline = cv2.getTextSize(label, FONT, font_scale, 1)
+            # Filled box spans both corner pixels, its bottom row is on the box edge
+            height = label_height + baseline + 10
+            sprite = np.empty((height + 1, label_width + 1, 3), dtype=np.uint8)
+            sprite[...] = self.color(class_name)
+            cv2.putText(sprite, label, (0, height - baseline - 5), FONT, font_scale,
+                        (255, 255, 255), 1)
+            return sprite
+
+        # The label shows two decimals, so the text itself is the bucket
+        return self._sprite((label, font_scale), render)
+
+    def render(self, frame, detections, scale=1.0, info=None):
+        """Draw detections onto a caller-owned frame (caller holds lock).
+
+        Boxes are given in full-resolution coordinates and scaled here.
+        """
+        height, width = frame.shape[:2]
+        font_scale = round(0.5 * max(scale, 0.6), 2)
+        thickness = 2 if scale >= 0.5 else 1
+
+        for obj in detections:
+            color = self.color(obj['class'])
+            x, y, w, h = (int(v * scale) for v in obj['bbox'])
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, thickness)
+
+            # Label sits on top of the box; clip it at the frame edges
+            sprite = self.label_sprite(obj['class'], obj['confidence'], font_scale)
+            top = y - sprite.shape[0] + 1
+            x0, y0 = max(0, x), max(0, top)
+            x1, y1 = min(width, x + sprite.shape[1]), min(height, top + sprite.shape[0])
+            if x0 < x1 and y0 < y1:
+                frame[y0:y1, x0:x1] = sprite[y0 - top:y1 - top, x0 - x:x1 - x]
+
+            center_x, center_y = obj['center']
+            cv2.circle(frame, (int(center_x * scale), int(center_y * scale)),
+                       3 if scale >= 0.5 else 2, color, -1)
+
+        if info:
+            cv2.putText(frame, info, (10, height - 10), FONT, font_scale, INFO_COLOR, 1)
+        return frame
+
+    def draw(self, frame, detections, scale=1.0, info=None):
+        """Draw the overlay for detections onto frame in place"""
+        if not detections and not info:
+            return frame
+        with self.lock:
+            return self.render(frame, detections, scale, info)
+
+    def get_stats(self):
+        """Get sprite cache counters"""
+        with self.lock:
+            return {
+                'sprites': len(self.sprites),
+                'sprite_hits': self.sprite_hits,
+                'sprite_misses': self.sprite_misses
+            }
@@ -0,0 +1,383 @@
+import cv2
+import numpy as np
+import multiprocessing
+import threading
+import queue
+import time
+import logging
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+from object_detector import ObjectDetector
+from frame_ring import PIXEL_FORMAT_BGR
+
+logger = logging.getLogger(__name__)
+
+def _worker_main(worker_id, model_name, slot_names, threads, task_queue, result_conn,
+                 initializer=None):
+    """Inference worker process: owns one ObjectDetector"""
+    logging.basicConfig(level=logging.INFO)
+    cv2.setNumThreads(threads)
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+
+    detector = ObjectDetector()
+    if initializer is not None:
+        initializer(detector)
+        loaded = True
+    else:
+        loaded = detector.load_model(model_name) if model_name else False
+    result_conn.send(('ready', worker_id, loaded))
+
+    try:
+        while True:
+            message = task_queue.get()
+            if message is None:
+                break
+
+            if message[0] == 'load':
+                result_conn.send(('loaded', worker_id, detector.load_model(message[1])))
+
+            elif message[0] == 'detect':
+                _, seq, slot, shape, pixel_format, confidence, nms = message
+                detector.confidence_threshold = confidence
+                detector.nms_threshold = nms
+
+                # Zero-copy view of the frame the parent wrote into shared memory
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=slots[slot].buf)
+                started = time.perf_counter()
+                try:
+                    detected = detector.detect_objects(frame, pixel_format)
+                except Exception as e:
+                    logger.error(f"Worker {worker_id} detection error: {e}")
+                    detected = []
+                del frame
+                result_conn.send(('result', worker_id, seq, slot, detected,
+                                  time.perf_counter() - started))
+    finally:
+        for shm in slots:
+            shm.close()
+
+class ProcessPoolDetector:
+    """Run ObjectDetector instances in a pool of worker processes.
+
+    Frames are copied once into preallocated shared-memory slots and the
+    workers read them in place, so only a small task tuple is pickled per
+    frame. submit() returns a Future and Futures are resolved strictly in
+    submission order, even when workers finish out of order. Confidence
+    and NMS thresholds are read from the parent's detector per frame, so
+    /set_confidence keeps working.
+
+    When a worker dies, its pending Futures fail with BrokenProcessPool
+    (as does submit() once no worker is left); restart_workers() spawns
+    replacements, at most once every restart_interval seconds. Each
+    worker answers on its own pipe, so one killed mid-send cannot leave a
+    shared queue lock held and stall the others.
+
+    initializer, if given, is called with each worker's ObjectDetector
+    instead of loading model_name (e.g. to install a stand-in network). It
+    must be picklable, i.e. a module-level function.
+    """
+    def __init__(self, detector, workers=4, model_name='yolov3',
+                 max_frame_shape=(1080, 1920, 3), slots_per_worker=2, threads_per_worker=None,
+                 restart_interval=5.0, initializer=None):
+        self.detector = detector
+        self.num_workers = workers
+        self.model_name = model_name
+        self.initializer = initializer
+        self.max_frame_bytes = int(np.prod(max_frame_shape))
+        if threads_per_worker is None:
+            threads_per_worker = max(1, multiprocessing.cpu_count() // workers)
+        self.threads_per_worker = threads_per_worker
+
+        # Shared frame slots
+        self.slots = [shared_memory.SharedMemory(create=True, size=self.max_frame_bytes)
+                      for _ in range(workers * slots_per_worker)]
+        self.free_slots = queue.Queue()
+        for index in range(len(self.slots)):
+            self.free_slots.put(index)
+
+        self.lock = threading.Lock()
+        self.next_seq = 0
+        self.next_result = 0
+        self.futures = {}
+        self.done = {}
+        self.in_flight = [{} for _ in range(workers)]
+        self.alive = [False] * workers
+        self.running = False
+        self.restart_interval = restart_interval
+        self.last_restart = 0.0
+
+        # Counters
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.restarts = 0
+        self.started_at = None
+
+        self.context = multiprocessing.get_context('spawn')
+        self.task_queues = [self.context.Queue() for _ in range(workers)]
+        self.result_readers = [None] * workers
+        self.result_writers = [None] * workers
+        self.processes = [self._spawn(index) for index in range(workers)]
+        self.collector = threading.Thread(target=self._collect, name='pool-collector', daemon=True)
+
+    def _spawn(self, worker_id):
+        """Create (not start) the process for one worker and its result pipe"""
+        reader, writer = self.context.Pipe(duplex=False)
+        self.result_readers[worker_id] = reader
+        self.result_writers[worker_id] = writer
+        return self.context.Process(
+            target=_worker_main,
+            args=(worker_id, self.model_name, [shm.name for shm in self.slots],
+                  self.threads_per_worker, self.task_queues[worker_id], writer, self.initializer),
+            name=f'inference-worker-{worker_id}',
+            daemon=True)
+
+    def _launch(self, worker_id):
+        """Start a worker; the parent drops its pipe end so a dead worker reads as EOF"""
+        self.processes[worker_id].start()
+        self.result_writers[worker_id].close()
+        self.result_writers[worker_id] = None
+
+    def _drop_reader(self, conn):
+        """Stop polling the pipe of a worker that exited"""
+        with self.lock:
+            if conn in self.result_readers:
+                self.result_readers[self.result_readers.index(conn)] = None
+        conn.close()
+
+    def restart_workers(self):
+        """Respawn workers that died, returns how many were started"""
+        restarted = 0
+        with self.lock:
+            if not self.running or time.time() - self.last_restart < self.restart_interval:
+                return 0
+            for worker_id, process in enumerate(self.processes):
+                if self.alive[worker_id] or process.is_alive():
+                    continue
+                # Fresh queue: the dead worker may have left it half-read
+                self.task_queues[worker_id] = self.context.Queue()
+                old_reader = self.result_readers[worker_id]
+                if old_reader is not None:
+                    old_reader.close()
+                self.processes[worker_id] = self._spawn(worker_id)
+                self._launch(worker_id)
+                restarted += 1
+            if restarted:
+                self.last_restart = time.time()
+                self.restarts += restarted
+        if restarted:
+            logger.warning(f"Restarting {restarted} inference worker(s)")
+        return restarted
+
+    def start(self, timeout=120):
+        """Start worker processes and wait until each has loaded its model"""
+        self.running = True
+        self.started_at = time.time()
+        for worker_id in range(self.num_workers):
+            self._launch(worker_id)
+
+        ready = 0
+        deadline = time.time() + timeout
+        waiting = list(self.result_readers)
+        while waiting and time.time() < deadline:
+            for conn in wait(waiting, timeout=1):
+                waiting.remove(conn)
+                try:
+                    kind, worker_id, loaded = conn.recv()
+                except (EOFError, OSError):
+                    # Died while loading; the collector notices
+                    continue
+                self.alive[worker_id] = True
+                ready += 1
+                if not loaded:
+                    logger.warning(f"Inference worker {worker_id} has no model loaded")
+
+        self.collector.start()
+        logger.info(f"Inference pool started: {ready}/{self.num_workers} workers, "
+                    f"{self.threads_per_worker} OpenCV threads each")
+        return ready == self.num_workers
+
+    def close(self):
+        """Stop workers and release shared memory"""
+        if not self.running:
+            return
+        self.running = False
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.collector.join(timeout=2)
+        for conn in self.result_readers:
+            if conn is not None:
+                conn.close()
+        with self.lock:
+            for future in self.futures.values():
+                future.cancel()
+            self.futures.clear()
+        for shm in self.slots:
+            shm.close()
+            shm.unlink()
+        logger.info("Inference pool stopped")
+
+    def load_model(self, model_name):
+        """Ask every worker to switch model"""
+        self.model_name = model_name
+        for task_queue in self.task_queues:
+            task_queue.put(('load', model_name))
+
+    def submit(self, frame, timeout=None, pixel_format=PIXEL_FORMAT_BGR):
+        """Queue a frame for detection, returns a Future of the detections"""
+        if not self.running:
+            raise RuntimeError("Inference pool is not running")
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.nbytes > self.max_frame_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes exceeds pool slot size")
+
+        # Backpressure: wait for a free shared-memory slot
+        slot = self.free_slots.get(timeout=timeout)
+        target = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.slots[slot].buf)
+        target[...] = frame
+        del target
+
+        future = Future()
+        with self.lock:
+            # Least-loaded live worker
+            candidates = [i for i in range(self.num_workers) if self.alive[i]]
+            if not candidates:
+                self.free_slots.put(slot)
+                raise BrokenProcessPool("No live inference workers")
+            worker_id = min(candidates, key=lambda i: len(self.in_flight[i]))
+
+            seq = self.next_seq
+            self.next_seq += 1
+            self.futures[seq] = future
+            self.in_flight[worker_id][seq] = slot
+
+        self.task_queues[worker_id].put((
+            'detect', seq, slot, frame.shape, pixel_format,
+            self.detector.confidence_threshold, self.detector.nms_threshold
+        ))
+        return future
+
+    def detect_objects(self, frame, pixel_format=PIXEL_FORMAT_BGR):
+        """Blocking drop-in for ObjectDetector.detect_objects"""
+        return self.submit(frame, pixel_format=pixel_format).result()
+
+    def map(self, frames):
+        """Detect objects in an iterable of frames, yielding results in order"""
+        pending = []
+        for frame in frames:
+            pending.append(self.submit(frame))
+            while pending and (pending[0].done() or len(pending) >= len(self.slots)):
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+    def _finish(self, seq, detected):
+        """Store a result (or exception) and collect futures to resolve in order (caller holds lock)"""
+        self.done[seq] = detected
+        ready = []
+        while self.next_result in self.done:
+            future = self.futures.pop(self.next_result, None)
+            detected = self.done.pop(self.next_result)
+            if future is not None:
+                ready.append((future, detected))
+            self.next_result += 1
+        return ready
+
+    def _collect(self):
+        """Collect worker results and check worker liveness"""
+        last_check = time.time()
+        while self.running:
+            with self.lock:
+                readers = [conn for conn in self.result_readers if conn is not None]
+            try:
+                incoming = wait(readers, timeout=0.5)
+            except OSError:
+                # A pipe was closed by restart_workers while polling
+                incoming = []
+            if not incoming or time.time() - last_check >= 1.0:
+                self._check_workers()
+                last_check = time.time()
+            for conn in incoming:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    # The worker exited; _check_workers fails its work
+                    self._drop_reader(conn)
+                    continue
+                self._handle(message)
+
+    def _handle(self, message):
+        """Process one message from a worker"""
+        ready = []
+        kind = message[0]
+        if kind == 'result':
+            _, worker_id, seq, slot, detected, seconds = message
+            self.free_slots.put(slot)
+            with self.lock:
+                self.in_flight[worker_id].pop(seq, None)
+                self.completed += 1
+                self.busy_seconds += seconds
+                ready = self._finish(seq, detected)
+        elif kind == 'loaded':
+            _, worker_id, loaded = message
+            if not loaded:
+                logger.error(f"Inference worker {worker_id} failed to load {self.model_name}")
+        elif kind == 'ready':
+            # A restarted worker
+            _, worker_id, loaded = message
+            with self.lock:
+                self.alive[worker_id] = True
+            logger.info(f"Inference worker {worker_id} restarted"
+                        f"{'' if loaded else ' without a model'}")
+
+        # Resolve outside the lock; callbacks run in submission order
+        self._resolve(ready)
+
+    @staticmethod
+    def _resolve(ready):
+        """Complete futures with their results or exceptions"""
+        for future, detected in ready:
+            if future.set_running_or_notify_cancel():
+                if isinstance(detected, BaseException):
+                    future.set_exception(detected)
+                else:
+                    future.set_result(detected)
+
+    def _check_workers(self):
+        """Fail work assigned to workers that died"""
+        ready = []
+        with self.lock:
+            for worker_id, process in enumerate(self.processes):
+                if self.alive[worker_id] and not process.is_alive():
+                    logger.error(f"Inference worker {worker_id} died "
+                                 f"(exit code {process.exitcode})")
+                    self.alive[worker_id] = False
+                    for seq, slot in self.in_flight[worker_id].items():
+                        self.free_slots.put(slot)
+                        ready.extend(self._finish(seq, BrokenProcessPool(
+                            f"Inference worker {worker_id} died")))
+                    self.in_flight[worker_id].clear()
+        self._resolve(ready)
+
+    def get_stats(self):
+        """Get pool counters"""
+        with self.lock:
+            in_flight = sum(len(jobs) for jobs in self.in_flight)
+            alive = sum(self.alive)
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        return {
+            'workers': self.num_workers,
+            'alive': alive,
+            'threads_per_worker': self.threads_per_worker,
+            'in_flight': in_flight,
+            'completed': self.completed,
+            'restarts': self.restarts,
+            'throughput_fps': round(self.completed / elapsed, 2) if elapsed else 0,
+            'avg_worker_ms': round(self.busy_seconds / self.completed * 1000, 2)
+            if self.completed else 0.0
+        }
@@ -0,0 +1,217 @@
+import math
+import threading
+import time
+import logging
+from frame_ring import PIXEL_FORMAT_BGR
+
+logger = logging.getLogger(__name__)
+
+def parse_roi(text):
+    """Parse an 'x,y,w,h' ROI given as fractions of the frame size"""
+    values = [float(v) for v in text.split(',')]
+    if len(values) != 4:
+        raise ValueError(f"ROI needs x,y,w,h, got {text!r}")
+    x, y, w, h = values
+    if not (0 <= x < 1 and 0 <= y < 1 and w > 0 and h > 0):
+        raise ValueError(f"ROI {text!r} is outside the frame")
+    # Clip to the frame
+    return (x, y, min(w, 1 - x), min(h, 1 - y))
+
+class RegionDetector:
+    """Detection restricted to regions of interest, optionally tiled.
+
+    ROIs are (x, y, w, h) fractions of the frame, so they survive a
+    resolution change. Without tiling each ROI is cropped (a view, no
+    copy) and resized to the network input, which already gives small
+    objects in a small ROI more pixels. With tiling each ROI (or the whole
+    frame) is cut into overlapping windows of the network input size at
+    native resolution, so objects are never downscaled and the number of
+    windows, and with it the compute, follows the ROI area. All windows go
+    through detect_batch in as few forward passes as max_batch allows;
+    their boxes are mapped back to frame coordinates and duplicates from
+    overlapping windows are merged. Boxes from the same window are never
+    merged: the detector's own NMS already decided those are different
+    objects.
+    """
+    def __init__(self, detector, rois=None, tile=False, overlap=0.2,
+                 merge_threshold=0.6, max_batch=16):
+        self.detector = detector
+        self.rois = list(rois or [])
+        self.tile = tile
+        self.overlap = overlap
+        self.merge_threshold = merge_threshold
+        self.max_batch = max_batch
+        self.lock = threading.Lock()
+        self.cached_windows = {}
+
+        # Counters
+        self.frames = 0
+        self.windows_run = 0
+        self.merged = 0
+        self.last_windows = 0
+        self.last_area_ratio = 0.0
+        self.detect_seconds = 0.0
+
+    @property
+    def active(self):
+        """Whether detection should go through this detector"""
+        return bool(self.rois) or self.tile
+
+    def configure(self, rois=None, tile=None, overlap=None):
+        """Replace ROIs and tiling settings"""
+        with self.lock:
+            if rois is not None:
+                self.rois = list(rois)
+            if tile is not None:
+                self.tile = tile
+            if overlap is not None:
+                if not 0 <= overlap < 1:
+                    raise ValueError("Overlap must be in [0, 1)")
+                self.overlap = overlap
+            self.cached_windows = {}
+
+    def _spans(self, start, length, size):
+        """Evenly spaced [start, end) windows of size covering a span"""
+        if length <= size:
+            return [(start, start + length)]
+        step = size * (1 - self.overlap)
+        count = math.ceil((length - size) / step) + 1
+        stride = (length - size) / (count - 1)
+        return [(start + round(i * stride), start + round(i * stride) + size) for i in range(count)]
+
+    def windows(self, width, height):
+        """Crop windows (x0, y0, x1, y1) for a frame size (caller holds lock)"""
+        input_size = self.detector.context.input_size if self.detector.context else (416, 416)
+        key = (width, height, input_size)
+        windows = self.cached_windows.get(key)
+        if windows is not None:
+            return windows
+
+        regions = [(0, 0, width, height)]
+        if self.rois:
+            regions = []
+            for x, y, w, h in self.rois:
+                x0, y0 = min(round(x * width), width - 1), min(round(y * height), height - 1)
+                regions.append((x0, y0, max(1, min(round(w * width), width - x0)),
+                                max(1, min(round(h * height), height - y0))))
+        windows = []
+        for x, y, w, h in regions:
+            if not self.tile:
+                windows.append((x, y, x + w, y + h))
+                continue
+            for y0, y1 in self._spans(y, h, input_size[1]):
+                for x0, x1 in self._spans(x, w, input_size[0]):
+                    windows.append((x0, y0, x1, y1))
+        self.cached_windows[key] = windows
+        return windows
+
+    @staticmethod
+    def _touches(bbox, region):
+        """Whether a box reaches into an (x0, y0, x1, y1) region, edges included"""
+        x, y, w, h = bbox
+        x0, y0, x1, y1 = region
+        return x <= x1 and x + w >= x0 and y <= y1 and y + h >= y0
+
+    def _seam(self, bbox, other_bbox, window, other_window):
+        """Whether both boxes reach the area two different windows share"""
+        if window == other_window:
+            return False
+        # Overlap of the two windows; a shared edge for windows that only abut
+        shared = (max(window[0], other_window[0]), max(window[1], other_window[1]),
+                  min(window[2], other_window[2]), min(window[3], other_window[3]))
+        if shared[0] > shared[2] or shared[1] > shared[3]:
+            return False
+        return self._touches(bbox, shared) and self._touches(other_bbox, shared)
+
+    def _merge(self, detections):
+        """Merge boxes of one object seen by several windows.
+
+        detections are (detection, window) pairs. Two boxes of the same
+        class are merged only when they come from different windows, both
+        reach the area those windows share, and their intersection covers
+        merge_threshold of the smaller one, which also catches an object
+        cut at a window edge; the merged box is their union with the higher
+        confidence.
+        """
+        detections.sort(key=lambda pair: pair[0]['confidence'], reverse=True)
+        kept = []
+        for obj, window in detections:
+            x, y, w, h = obj['bbox']
+            for other, other_windows in kept:
+                if other['class'] != obj['class'] or window in other_windows:
+                    continue
+                ox, oy, ow, oh = other['bbox']
+                iw = min(x + w, ox + ow) - max(x, ox)
+                ih = min(y + h, oy + oh) - max(y, oy)
+                if iw <= 0 or ih <= 0:
+                    continue
+                if iw * ih < self.merge_threshold * max(1, min(w * h, ow * oh)):
+                    continue
+                if not any(self._seam(obj['bbox'], other['bbox'], window, other_window)
+                           for other_window in other_windows):
+                    continue
+                x0, y0 = min(x, ox), min(y, oy)
+                x1, y1 = max(x + w, ox + ow), max(y + h, oy + oh)
+                other['bbox'] = [x0, y0, x1 - x0, y1 - y0]
+                other_windows.append(window)
+                self.merged += 1
+                break
+            else:
+                kept.append((obj, [window]))
+
+        results = []
+        for obj, _ in kept:
+            x, y, w, h = obj['bbox']
+            obj['area'] = w * h
+            obj['center'] = [int(x + w/2), int(y + h/2)]
+            results.append(obj)
+        return results
+
+    def detect_objects(self, frame, pixel_format=PIXEL_FORMAT_BGR):
+        """Detect objects in the frame's ROIs, boxes in frame coordinates"""
+        started = time.perf_counter()
+        height, width = frame.shape[:2]
+        with self.lock:
+            windows = self.windows(width, height)
+
+        detections = []
+        for first in range(0, len(windows), self.max_batch):
+            chunk = windows[first:first + self.max_batch]
+            crops = [frame[y0:y1, x0:x1] for x0, y0, x1, y1 in chunk]
+            for window, detected in zip(chunk, self.detector.detect_batch(crops, pixel_format)):
+                x0, y0 = window[:2]
+                for obj in detected:
+                    x, y, w, h = obj['bbox']
+                    obj['bbox'] = [x + x0, y + y0, w, h]
+                    detections.append((obj, window))
+
+        with self.lock:
+            if len(windows) > 1:
+                detections = self._merge(detections)
+            else:
+                detections = [obj for obj, _ in detections]
+                for obj in detections:
+                    x, y, w, h = obj['bbox']
+                    obj['center'] = [int(x + w/2), int(y + h/2)]
+            self.frames += 1
+            self.windows_run += len(windows)
+            self.last_windows = len(windows)
+            # Pixels run through the network per frame pixel (> 1 with overlap)
+            self.last_area_ratio = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in windows) / (width * height)
+            self.detect_seconds += time.perf_counter() - started
+        return detections
+
+    def get_stats(self):
+        """Get ROI settings and window counters"""
+        with self.lock:
+            return {
+                'rois': [list(roi) for roi in self.rois],
+                'tile': self.tile,
+                'overlap': self.overlap,
+                'active': self.active,
+                'frames': self.frames,
+                'windows_per_frame': self.last_windows,
+                'area_ratio': round(self.last_area_ratio, 3),
+                'merged': self.merged,
+                'avg_ms': round(self.detect_seconds / self.frames * 1000, 2) if self.frames else 0.0
+            }
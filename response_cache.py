@@ -0,0 +1,50 @@
+import threading
+import time
+
+class ResponseCache:
+    """Serialized response body for the latest version key.
+
+    get(key, build) returns the body built for key, calling build() only
+    when the key changed, so any number of pollers cost one serialization
+    per new version. The build runs under a lock, so concurrent misses
+    wait for the first build instead of repeating it. The ETag is derived
+    from the key and the cache's creation time, so a restarted server
+    (whose sequence numbers start over) never matches an old one.
+    """
+    def __init__(self):
+        self.epoch = str(int(time.time()))
+        self.lock = threading.Lock()
+        self.key = None
+        self.body = None
+        self.etag = None
+
+        # Counters
+        self.builds = 0
+        self.hits = 0
+        self.not_modified = 0
+
+    def get(self, key, build):
+        """(body, etag) for key, building the body if key changed"""
+        with self.lock:
+            if key != self.key or self.body is None:
+                self.body = build()
+                self.key = key
+                self.etag = '-'.join([self.epoch] + [str(part) for part in key])
+                self.builds += 1
+            else:
+                self.hits += 1
+            return self.body, self.etag
+
+    def record_not_modified(self):
+        """Count a request answered with 304"""
+        with self.lock:
+            self.not_modified += 1
+
+    def get_stats(self):
+        """Get build and hit counters"""
+        with self.lock:
+            return {
+                'builds': self.builds,
+                'hits': self.hits,
+                'not_modified': self.not_modified
+            }
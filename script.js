@@ -9,6 +9,9 @@ let ctx = null;
 let lastUpdateTime = 0;
 let fps = 0;
 let frameCount = 0;
+let detectionEvents = null;
+let eventsConnected = false;
+let detectionMap = new Map();
 
 // API Configuration
 const API_BASE = 'http://localhost:5000';
@@ -79,6 +82,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Start system timers
     startSystemTimers();
     
+    // Subscribe to pushed detections and stats
+    connectDetectionEvents();
+    
     // Connect to backend
     checkBackendConnection();
     
@@ -283,22 +289,69 @@ async function getDetections() {
             detectedObjects = data.objects || [];
             updateDetectionUI();
             drawDetections(detectedObjects);
-            
-            // Update FPS
-            frameCount++;
-            const now = Date.now();
-            if (now - lastUpdateTime >= 1000) {
-                fps = frameCount;
-                frameCount = 0;
-                lastUpdateTime = now;
-                updateFPSDisplay();
-            }
+            countDetectionUpdate();
         }
     } catch (error) {
         console.error('Get detections error:', error);
     }
 }
 
+function countDetectionUpdate() {
+    frameCount++;
+    const now = Date.now();
+    if (now - lastUpdateTime >= 1000) {
+        fps = frameCount;
+        frameCount = 0;
+        lastUpdateTime = now;
+        updateFPSDisplay();
+    }
+}
+
+// ===== PUSH UPDATES =====
+function connectDetectionEvents() {
+    if (!window.EventSource) return false;
+    if (detectionEvents) return true;
+    
+    // EventSource reconnects by itself and resumes from Last-Event-ID
+    detectionEvents = new EventSource(`${API_BASE}/events`);
+    
+    detectionEvents.onopen = () => {
+        eventsConnected = true;
+    };
+    
+    detectionEvents.onerror = () => {
+        eventsConnected = false;
+    };
+    
+    // Full state on first connect or when the server cannot replay
+    detectionEvents.addEventListener('snapshot', (event) => {
+        const data = JSON.parse(event.data);
+        detectionMap = new Map(Object.entries(data.objects));
+        applyDetectionEvent(data);
+    });
+    
+    // Only objects that changed or disappeared since the previous event
+    detectionEvents.addEventListener('detections', (event) => {
+        const data = JSON.parse(event.data);
+        data.removed.forEach(key => detectionMap.delete(key));
+        Object.entries(data.changed).forEach(([key, obj]) => detectionMap.set(key, obj));
+        applyDetectionEvent(data);
+    });
+    
+    return true;
+}
+
+function applyDetectionEvent(data) {
+    if (data.stats) {
+        updateSystemStats(data.stats);
+    }
+    
+    detectedObjects = Array.from(detectionMap.values());
+    updateDetectionUI();
+    drawDetections(detectedObjects);
+    countDetectionUpdate();
+}
+
 async function getSystemStats() {
     try {
         const response = await fetch(`${API_BASE}/get_stats`);
@@ -318,6 +371,10 @@ async function changeModel(modelName) {
         if (data.status === 'success') {
             updateStatus(`Model changed to ${data.model}`, 'success');
             document.getElementById('aiModel').textContent = data.model.toUpperCase();
+        } else if (data.status === 'loading') {
+            // Model loads in the background; the feed keeps running meanwhile
+            updateStatus(`Loading ${data.model}...`, 'warning');
+            waitForModel(data.model);
         }
     } catch (error) {
         console.error('Change model error:', error);
@@ -325,6 +382,27 @@ async function changeModel(modelName) {
     }
 }
 
+async function waitForModel(modelName) {
+    try {
+        const response = await fetch(`${API_BASE}/model_status`);
+        const data = await response.json();
+        const model = (data.models || {})[modelName] || {};
+        
+        if (data.active === modelName) {
+            updateStatus(`Model changed to ${modelName}`, 'success');
+            document.getElementById('aiModel').textContent = modelName.toUpperCase();
+        } else if (model.state === 'error') {
+            updateStatus('Model Change Failed', 'error');
+        } else if (data.target === modelName) {
+            const progress = Math.round((model.progress || 0) * 100);
+            updateStatus(`Loading ${modelName} (${progress}%)...`, 'warning');
+            setTimeout(() => waitForModel(modelName), 500);
+        }
+    } catch (error) {
+        console.error('Model status error:', error);
+    }
+}
+
 async function updateConfidence(value) {
     const threshold = value / 100;
     try {
@@ -622,8 +700,13 @@ function startSystemTimers() {
             formatUptime(Math.floor(performance.now() / 1000));
     }, 1000);
     
-    // Update system stats every 2 seconds
-    setInterval(getSystemStats, 2000);
+    // Stats are pushed with every detection event while scanning;
+    // poll every 2 seconds only when idle or without a push channel
+    setInterval(() => {
+        if (!eventsConnected || !scanActive) {
+            getSystemStats();
+        }
+    }, 2000);
 }
 
 function startDetectionUpdates() {
@@ -632,6 +715,9 @@ function startDetectionUpdates() {
         clearInterval(window.detectionInterval);
     }
     
+    // Detections are pushed; fall back to polling without EventSource
+    if (connectDetectionEvents()) return;
+    
     // Start new interval
     window.detectionInterval = setInterval(getDetections, DETECTION_INTERVAL);
 }
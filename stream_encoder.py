@@ -0,0 +1,130 @@
+import cv2
+import numpy as np
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    # Optional: libjpeg-turbo bindings (pip install PyTurboJPEG)
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
+# Stream tiers from best to cheapest: (name, scale of the camera frame, JPEG quality)
+STREAM_TIERS = [
+    ('high', 1.0, 85),
+    ('medium', 0.75, 70),
+    ('low', 0.5, 55),
+    ('minimal', 0.25, 40)
+]
+TIER_NAMES = [name for name, _, _ in STREAM_TIERS]
+
+def tier_index(name):
+    """Index of a tier name in STREAM_TIERS, ValueError if unknown"""
+    return TIER_NAMES.index(name)
+
+class JpegEncoder:
+    """JPEG encoding through TurboJPEG when installed, OpenCV otherwise.
+
+    backend is 'auto', 'turbojpeg' or 'opencv'. Frames are expected in
+    BGR order, which both backends take without a conversion.
+    """
+    def __init__(self, backend='auto'):
+        self.turbo = None
+        if backend in ('auto', 'turbojpeg') and TurboJPEG is not None:
+            try:
+                self.turbo = TurboJPEG()
+            except (OSError, RuntimeError) as e:
+                # Python bindings present but the shared library is missing
+                logger.warning(f"TurboJPEG unavailable, using OpenCV: {e}")
+        elif backend == 'turbojpeg':
+            logger.warning("TurboJPEG requested but not installed, using OpenCV")
+        self.backend = 'turbojpeg' if self.turbo is not None else 'opencv'
+
+    def encode(self, frame, quality):
+        """Encode a BGR frame, returns JPEG bytes or None"""
+        if self.turbo is not None:
+            return self.turbo.encode(frame, quality=quality, pixel_format=TJPF_BGR,
+                                     jpeg_subsample=TJSAMP_420)
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes() if ret else None
+
+class TierEncoder:
+    """Encode one frame for several stream tiers.
+
+    Each requested tier is resized (into a reusable buffer) and encoded
+    exactly once per frame; the caller shares the bytes with every
+    client on that tier. An optional overlay callback is composited onto
+    each tier's private buffer at that tier's resolution, so the source
+    frame is never written to.
+    """
+    def __init__(self, encoder=None, tiers=STREAM_TIERS):
+        self.encoder = encoder or JpegEncoder()
+        self.tiers = tiers
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.frames = [0] * len(tiers)
+        self.bytes = [0] * len(tiers)
+        self.seconds = [0.0] * len(tiers)
+
+    def _scaled(self, frame, tier, private=False):
+        """Frame resized for a tier, reusing the tier's buffer.
+
+        At full scale the frame itself is returned unless private is set,
+        in which case it is copied into the tier buffer.
+        """
+        scale = self.tiers[tier][1]
+        if scale == 1.0 and not private:
+            return frame
+        height, width = frame.shape[:2]
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        buffer = self.buffers.get(tier)
+        if buffer is None or buffer.shape[:2] != (size[1], size[0]):
+            buffer = self.buffers[tier] = np.empty((size[1], size[0]) + frame.shape[2:],
+                                                   dtype=frame.dtype)
+        if scale == 1.0:
+            np.copyto(buffer, frame)
+            return buffer
+        return cv2.resize(frame, size, dst=buffer, interpolation=cv2.INTER_AREA)
+
+    def encode(self, frame, tiers, overlay=None):
+        """Encode frame for each tier index, returns {tier: bytes}.
+
+        overlay(image, scale) draws onto the tier image in place.
+        """
+        encoded = {}
+        with self.lock:
+            for tier in sorted(set(tiers)):
+                start = time.perf_counter()
+                image = self._scaled(frame, tier, private=overlay is not None)
+                if overlay is not None:
+                    overlay(image, self.tiers[tier][1])
+                data = self.encoder.encode(image, self.tiers[tier][2])
+                if data is None:
+                    continue
+                encoded[tier] = data
+                self.frames[tier] += 1
+                self.bytes[tier] += len(data)
+                self.seconds[tier] += time.perf_counter() - start
+        return encoded
+
+    def get_stats(self):
+        """Get per-tier encode counters"""
+        with self.lock:
+            return {
+                'backend': self.encoder.backend,
+                'tiers': {
+                    name: {
+                        'scale': scale,
+                        'quality': quality,
+                        'frames': self.frames[i],
+                        'avg_kb': round(self.bytes[i] / self.frames[i] / 1024, 1)
+                        if self.frames[i] else 0.0,
+                        'avg_ms': round(self.seconds[i] / self.frames[i] * 1000, 2)
+                        if self.frames[i] else 0.0
+                    }
+                    for i, (name, scale, quality) in enumerate(self.tiers)
+                }
+            }
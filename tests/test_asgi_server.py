@@ -0,0 +1,123 @@
+import asyncio
+import threading
+
+from asgi_server import ScannerASGI
+from event_stream import DetectionEventHub
+
+def http_scope(path='/export'):
+    return {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+            'headers': [(b'host', b'test')], 'http_version': '1.1'}
+
+def test_streamed_wsgi_body_stops_on_disconnect():
+    closed = threading.Event()
+    produced = []
+
+    class Export:
+        """Endless WSGI body that records being closed"""
+        def __iter__(self):
+            while True:
+                produced.append(1)
+                yield b'row\n'
+
+        def close(self):
+            closed.set()
+
+    def wsgi_app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return Export()
+
+    async def run():
+        disconnected = asyncio.Event()
+        messages = []
+
+        async def receive():
+            if not messages:
+                messages.append('request')
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        chunks = []
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and message.get('body'):
+                chunks.append(message['body'])
+                if len(chunks) == 5:
+                    disconnected.set()
+
+        server = ScannerASGI(wsgi_app, lambda path, args, headers: None, max_threads=2)
+        await asyncio.wait_for(server(http_scope(), receive, send), 10)
+        return server, chunks
+
+    server, chunks = asyncio.run(run())
+    assert closed.is_set()
+    assert 5 <= len(chunks) < 10
+    assert len(produced) < 10
+    assert server.get_stats()['aborted'] == 1
+    assert server.get_stats()['pending'] == 0
+    server.executor.shutdown()
+
+def test_complete_wsgi_response():
+    def wsgi_app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'hello ', b'world']
+
+    async def run():
+        sent = []
+        requests = []
+
+        async def receive():
+            if not requests:
+                requests.append('request')
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Nothing more until the client goes away
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        server = ScannerASGI(wsgi_app, lambda path, args, headers: None, max_threads=2)
+        await server(http_scope('/get_stats'), receive, send)
+        server.executor.shutdown()
+        return server, sent
+
+    server, sent = asyncio.run(run())
+    assert sent[0]['status'] == 200
+    assert b''.join(message.get('body', b'') for message in sent[1:]) == b'hello world'
+    assert sent[-1]['more_body'] is False
+    assert server.get_stats()['aborted'] == 0
+
+def test_sse_clients_share_one_loop_wakeup():
+    hub = DetectionEventHub(keepalive=5.0)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        wakeups = []
+        original = loop.call_soon_threadsafe
+
+        def counting(callback, *args):
+            wakeups.append(callback)
+            return original(callback, *args)
+        loop.call_soon_threadsafe = counting
+
+        streams = [hub.stream_async() for _ in range(20)]
+        for stream in streams:
+            # retry hint, then the initial snapshot
+            await stream.__anext__()
+            await stream.__anext__()
+        nexts = [asyncio.ensure_future(stream.__anext__()) for stream in streams]
+        await asyncio.sleep(0.05)
+
+        thread = threading.Thread(target=hub.publish,
+                                  args=([{'class': 'person', 'confidence': 0.9, 'bbox': [0, 0, 5, 5]}],))
+        thread.start()
+        thread.join()
+        texts = await asyncio.wait_for(asyncio.gather(*nexts), 5)
+        for stream in streams:
+            await stream.aclose()
+        return wakeups, texts
+
+    wakeups, texts = asyncio.run(run())
+    assert all(text.startswith('id: ') and 'event: detections' in text for text in texts)
+    assert len(wakeups) == 1
+    assert hub.get_stats()['clients'] == 0
@@ -0,0 +1,76 @@
+import json
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+from batch_process import BatchProcessor
+
+class FakePool:
+    """Pool stand-in with a slot size limit; 'detects' one box at the frame centre"""
+    def __init__(self, max_frame_shape=(120, 160, 3)):
+        self.max_frame_bytes = int(np.prod(max_frame_shape))
+        self.shapes = []
+
+    def submit(self, frame):
+        if frame.nbytes > self.max_frame_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes exceeds pool slot size")
+        self.shapes.append(frame.shape)
+        height, width = frame.shape[:2]
+        future = Future()
+        future.set_result([{'class': 'person', 'confidence': 0.9,
+                            'bbox': [width // 4, height // 4, width // 2, height // 2],
+                            'area': width * height // 4, 'center': [width // 2, height // 2]}])
+        return future
+
+def test_oversized_frames_are_downscaled_not_fatal(tmp_path):
+    small = tmp_path / 'small.png'
+    large = tmp_path / 'large.png'
+    cv2.imwrite(str(small), np.zeros((120, 160, 3), dtype=np.uint8))
+    cv2.imwrite(str(large), np.zeros((480, 640, 3), dtype=np.uint8))
+    output = tmp_path / 'out.ndjson'
+
+    pool = FakePool()
+    processor = BatchProcessor(None, str(output), pool=pool)
+    stats = processor.run([('small', 'images', [str(small)]), ('large', 'images', [str(large)])])
+
+    assert stats['frames'] == 2
+    assert stats['frames_resized'] == 1
+    assert stats['sources_failed'] == 0
+    assert all(shape[0] * shape[1] * 3 <= pool.max_frame_bytes for shape in pool.shapes)
+
+    records = {record['source']: record for record in map(json.loads, output.read_text().splitlines())}
+    # Boxes of the downscaled frame are mapped back to full resolution
+    assert records['small']['objects'][0]['bbox'] == [40, 30, 80, 60]
+    assert records['large']['objects'][0]['bbox'] == [160, 120, 320, 240]
+
+class BrokenPool(FakePool):
+    """Pool whose workers all died: every Future fails"""
+    def submit(self, frame):
+        future = Future()
+        future.set_exception(BrokenProcessPool("Inference worker 0 died"))
+        return future
+
+def test_failed_futures_are_recorded_not_fatal(tmp_path):
+    paths = []
+    for index in range(40):
+        path = tmp_path / f'{index:03d}.png'
+        cv2.imwrite(str(path), np.zeros((120, 160, 3), dtype=np.uint8))
+        paths.append(str(path))
+    output = tmp_path / 'out.ndjson'
+
+    # Small queues: a dead writer would leave the inference stage blocked
+    processor = BatchProcessor(None, str(output), pool=BrokenPool(), queue_size=2)
+    thread = threading.Thread(target=lambda: processor.run([('frames', 'images', paths)]), daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+
+    stats = processor.get_stats()
+    assert stats['frames_failed'] == 40
+    assert stats['sources_failed'] == 1
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(records) == 40
+    assert all(record['status'] == 'error' and 'died' in record['message'] for record in records)
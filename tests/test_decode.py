@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from benchmark import StubNet, decode_outputs_loop, make_yolo_outputs
+from object_detector import ObjectDetector
+
+WIDTH, HEIGHT = 640, 480
+
+def row(cx, cy, w, h, class_id, score, num_classes=80):
+    """One YOLO output row with normalized box and a single class score"""
+    values = np.zeros(5 + num_classes, dtype=np.float32)
+    values[:5] = (cx, cy, w, h, 1.0)
+    values[5 + class_id] = score
+    return values
+
+@pytest.fixture
+def detector():
+    detector = ObjectDetector()
+    detector.use_net(StubNet(), 'stub')
+    return detector
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('threshold', [0.1, 0.5, 0.9])
+def test_vectorized_decode_matches_loop(detector, seed, threshold):
+    detector.confidence_threshold = threshold
+    outputs = make_yolo_outputs(seed)
+    ref_boxes, ref_conf, ref_ids = decode_outputs_loop(outputs, WIDTH, HEIGHT, threshold)
+
+    for ctx in (None, detector.context):
+        boxes, confidences, class_ids = detector.decode_outputs(outputs, WIDTH, HEIGHT, ctx)
+        assert boxes.tolist() == ref_boxes
+        assert class_ids.tolist() == [int(c) for c in ref_ids]
+        np.testing.assert_allclose(confidences, ref_conf, rtol=1e-6)
+    assert len(ref_boxes) > 0
+
+def test_decode_fixed_rows(detector):
+    outputs = [np.stack([row(0.5, 0.5, 0.25, 0.5, 0, 0.9),
+                         row(0.1, 0.2, 0.1, 0.1, 2, 0.3)])]
+    boxes, confidences, class_ids = detector.decode_outputs(outputs, WIDTH, HEIGHT)
+    assert boxes.tolist() == [[240, 120, 160, 240]]
+    assert class_ids.tolist() == [0]
+    assert confidences.tolist() == [pytest.approx(0.9)]
+
+def test_decode_flattens_batched_layers(detector):
+    rows = np.stack([row(0.5, 0.5, 0.25, 0.5, 1, 0.8), row(0.2, 0.2, 0.1, 0.1, 3, 0.7)])
+    flat = detector.decode_outputs([rows], WIDTH, HEIGHT)
+    stacked = detector.decode_outputs([rows[None]], WIDTH, HEIGHT)
+    for a, b in zip(flat, stacked):
+        assert np.array_equal(a, b)
+
+def test_empty_outputs(detector):
+    outputs = [np.empty((0, 85), dtype=np.float32), np.empty((0, 85), dtype=np.float32)]
+    boxes, confidences, class_ids = detector.decode_outputs(outputs, WIDTH, HEIGHT, detector.context)
+    assert boxes.shape == (0, 4)
+    assert len(confidences) == 0 and len(class_ids) == 0
+    assert detector.process_outputs(outputs, WIDTH, HEIGHT, detector.context) == []
+
+def test_low_confidence_rows_are_dropped(detector):
+    detector.confidence_threshold = 0.5
+    # Exactly at the threshold is dropped, like the reference loop
+    outputs = [np.stack([row(0.5, 0.5, 0.2, 0.2, 0, 0.5), row(0.3, 0.3, 0.2, 0.2, 1, 0.2)])]
+    boxes, _, _ = detector.decode_outputs(outputs, WIDTH, HEIGHT)
+    assert len(boxes) == 0
+    assert detector.process_outputs(outputs, WIDTH, HEIGHT) == []
+
+def test_nms_suppresses_overlaps_within_a_class(detector):
+    outputs = [np.stack([row(0.5, 0.5, 0.2, 0.2, 0, 0.9),
+                         row(0.505, 0.5, 0.2, 0.2, 0, 0.8),
+                         row(0.1, 0.1, 0.1, 0.1, 0, 0.7)])]
+    detected = detector.process_outputs(outputs, WIDTH, HEIGHT)
+    assert [obj['confidence'] for obj in detected] == [pytest.approx(0.9), pytest.approx(0.7)]
+    assert all(obj['class'] == 'person' for obj in detected)
+
+def test_nms_keeps_overlapping_boxes_of_different_classes(detector):
+    outputs = [np.stack([row(0.5, 0.5, 0.2, 0.2, 0, 0.9),
+                         row(0.5, 0.5, 0.2, 0.2, 16, 0.8)])]
+    detected = detector.process_outputs(outputs, WIDTH, HEIGHT)
+    assert sorted(obj['class'] for obj in detected) == ['dog', 'person']
+    assert detected[0]['bbox'] == detected[1]['bbox']
+
+def test_nms_empty(detector):
+    keep = detector.non_max_suppression(np.empty((0, 4), dtype=np.int64),
+                                        np.empty(0, dtype=np.float32),
+                                        np.empty(0, dtype=np.int64))
+    assert keep.tolist() == []
+
+def test_detect_batch_matches_single_frames(detector):
+    frames = [np.zeros((480, 640, 3), dtype=np.uint8), np.zeros((240, 320, 3), dtype=np.uint8)]
+    batch = detector.detect_batch(frames)
+    for frame, detected in zip(frames, batch):
+        single = detector.detect_objects(frame)
+        assert [obj['bbox'] for obj in detected] == [obj['bbox'] for obj in single]
+        assert [obj['class'] for obj in detected] == [obj['class'] for obj in single]
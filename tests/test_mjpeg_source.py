@@ -0,0 +1,130 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from benchmark import FakeMJPEGServer, make_jpegs
+from camera_handler import CameraHandler
+from camera_sources import MJPEGStreamSource
+
+HEADERS = (b'HTTP/1.1 200 OK\r\n'
+           b'Content-Type: multipart/x-mixed-replace; boundary=frame\r\n\r\n')
+
+class RawServer:
+    """Accepts one connection at a time and sends fixed bytes, then closes"""
+    def __init__(self, payload):
+        self.payload = payload
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(4)
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.sock.getsockname()[1]}/stream'
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                conn.recv(4096)
+                conn.sendall(self.payload)
+
+    def close(self):
+        self.sock.close()
+
+def part(jpeg, content_length=False):
+    header = b'--frame\r\nContent-Type: image/jpeg\r\n'
+    if content_length:
+        header += b'Content-Length: %d\r\n' % len(jpeg)
+    return header + b'\r\n' + jpeg + b'\r\n'
+
+@pytest.fixture(scope='module')
+def jpegs():
+    return make_jpegs(8)
+
+@pytest.mark.parametrize('content_length', [False, True])
+@pytest.mark.parametrize('chunk_size', [7, 1500, 65536])
+def test_payload_parity(jpegs, content_length, chunk_size):
+    with FakeMJPEGServer(jpegs, content_length=content_length) as server:
+        source = MJPEGStreamSource(server.url, chunk_size=chunk_size)
+        try:
+            assert source.isOpened()
+            for index in range(len(jpegs) * 2):
+                assert source.grab()
+                assert source.jpeg == jpegs[index % len(jpegs)]
+            ret, frame = source.read()
+            assert ret and frame.shape == (480, 640, 3)
+        finally:
+            source.release()
+
+def test_preamble_and_garbage_part_are_skipped(jpegs):
+    server = RawServer(HEADERS + b'junk before the first boundary\r\n' +
+                       part(jpegs[0]) + part(b'not a jpeg at all') + part(jpegs[1]) + b'--frame\r\n')
+    source = MJPEGStreamSource(server.url, chunk_size=5)
+    try:
+        assert source.grab() and source.jpeg == jpegs[0]
+        # A corrupt payload is cut out cleanly but does not decode
+        assert source.grab()
+        assert source.retrieve() == (False, None)
+        assert source.grab() and source.jpeg == jpegs[1]
+        assert source.get_stats()['frames_received'] == 3
+        assert source.get_stats()['frames_decoded'] == 0
+    finally:
+        source.release()
+        server.close()
+
+@pytest.mark.parametrize('content_length', [False, True])
+def test_truncated_part_fails_cleanly(jpegs, content_length):
+    truncated = part(jpegs[1], content_length)[:-len(jpegs[1]) // 2]
+    server = RawServer(HEADERS + part(jpegs[0], content_length) + truncated)
+    source = MJPEGStreamSource(server.url, chunk_size=1024)
+    try:
+        assert source.grab() and source.jpeg == jpegs[0]
+        assert not source.grab()
+        assert not source.isOpened()
+    finally:
+        source.release()
+        server.close()
+
+def test_truncated_boundary_fails_cleanly(jpegs):
+    server = RawServer(HEADERS + part(jpegs[0]) + b'--fr')
+    source = MJPEGStreamSource(server.url, chunk_size=3)
+    try:
+        # Without a following boundary the last part cannot be delimited
+        assert not source.grab()
+        assert not source.isOpened()
+    finally:
+        source.release()
+        server.close()
+
+def test_oversized_part_is_rejected(jpegs):
+    server = RawServer(HEADERS + b'--frame\r\n\r\n' + b'\xff' * 4096)
+    source = MJPEGStreamSource(server.url, chunk_size=512, max_buffer=2048)
+    try:
+        assert not source.grab()
+    finally:
+        source.release()
+        server.close()
+
+def test_camera_reconnects_after_server_drops(jpegs):
+    with FakeMJPEGServer(jpegs, fps=50, drop_after=10) as server:
+        camera = CameraHandler(reconnect_delay=0.05, max_reconnect_delay=0.2)
+        try:
+            assert camera.initialize(server.url)
+            deadline = time.time() + 10
+            while time.time() < deadline and camera.get_stats()['reconnects'] < 2:
+                time.sleep(0.05)
+            stats = camera.get_stats()
+            assert stats['reconnects'] >= 2
+            assert server.connections >= 3
+            # Frames keep coming from the real stream after reconnecting
+            last = camera.latest_frame().seq
+            ref = camera.wait_frame(last, timeout=2.0)
+            assert ref is not None and ref.frame.shape == (480, 640, 3)
+        finally:
+            camera.release()
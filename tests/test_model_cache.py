@@ -0,0 +1,39 @@
+import hashlib
+import os
+
+from model_cache import FingerprintCache
+
+def stat_files(*paths):
+    return [(str(path), os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths]
+
+def test_fingerprint_is_hashed_in_the_background_and_cached(tmp_path):
+    config = tmp_path / 'model.cfg'
+    weights = tmp_path / 'model.weights'
+    config.write_text('[net]\nwidth=416\n')
+    weights.write_bytes(os.urandom(1 << 20))
+    cache = FingerprintCache(str(tmp_path / 'cache.json'), chunk_size=4096)
+
+    # Nothing hashed yet: the load path gets no fingerprint instead of waiting
+    assert cache.cached(str(config), str(weights)) is None
+
+    results = []
+    cache.fingerprint_later(stat_files(config, weights), results.append).join()
+    expected = hashlib.sha256(b''.join(hashlib.sha256(path.read_bytes()).hexdigest().encode()
+                                       for path in (config, weights))).hexdigest()
+    assert results == [expected]
+
+    # Remembered across instances while the files are unchanged
+    reopened = FingerprintCache(str(tmp_path / 'cache.json'))
+    assert reopened.cached(str(config), str(weights)) == expected
+
+    weights.write_bytes(os.urandom(1 << 20))
+    assert reopened.cached(str(config), str(weights)) is None
+
+def test_changed_files_are_not_reported(tmp_path):
+    weights = tmp_path / 'model.weights'
+    weights.write_bytes(b'old')
+    files = stat_files(weights)
+    weights.write_bytes(b'newer')
+    results = []
+    FingerprintCache(str(tmp_path / 'cache.json')).fingerprint_later(files, results.append).join()
+    assert results == []
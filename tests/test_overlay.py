@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from benchmark import draw_detections_legacy, make_detections
+from object_detector import ObjectDetector
+
+@pytest.fixture
+def detector():
+    detector = ObjectDetector()
+    detector.current_model = 'stub'
+    return detector
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_sprite_overlay_matches_legacy_drawing(detector, seed):
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    original = frame.copy()
+    # Draw every scene twice so both sprite cache misses and hits are compared
+    scenes = [make_detections(detector, 10, rng) for _ in range(20)]
+    for detections in scenes + scenes:
+        expected = draw_detections_legacy(detector, frame.copy(), detections)
+        actual = detector.draw_detections(frame.copy(), detections)
+        differing = int(np.any(expected != actual, axis=2).sum())
+        assert differing == 0
+    assert np.array_equal(frame, original)
+
+def test_boxes_outside_the_frame(detector):
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    detections = [
+        {'class': 'person', 'confidence': 0.9, 'bbox': [-30, -20, 60, 50], 'center': [0, 5]},
+        {'class': 'car', 'confidence': 0.6, 'bbox': [140, 100, 80, 80], 'center': [180, 140]},
+        {'class': 'dog', 'confidence': 0.7, 'bbox': [500, 500, 10, 10], 'center': [505, 505]}
+    ]
+    expected = draw_detections_legacy(detector, frame.copy(), detections)
+    actual = detector.draw_detections(frame.copy(), detections)
+    assert np.array_equal(expected, actual)
+
+def test_no_detections_leaves_the_frame_untouched(detector):
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    assert detector.draw_detections(frame, []) is frame
+    assert frame.max() == 0
@@ -0,0 +1,43 @@
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from object_detector import ObjectDetector
+from process_pool import ProcessPoolDetector
+
+@pytest.fixture
+def pool():
+    pool = ProcessPoolDetector(ObjectDetector(), workers=1, model_name=None,
+                               max_frame_shape=(48, 64, 3), restart_interval=0.0)
+    assert pool.start(timeout=60)
+    yield pool
+    pool.close()
+
+def wait_for(condition, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+def test_dead_worker_fails_futures_and_restarts(pool):
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    # No model loaded: the worker answers with no detections
+    assert pool.submit(frame).result(timeout=30) == []
+
+    pool.processes[0].kill()
+    assert wait_for(lambda: not pool.get_stats()['alive'])
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(frame)
+
+    assert pool.restart_workers() == 1
+    assert wait_for(lambda: pool.get_stats()['alive'] == 1)
+    assert pool.submit(frame).result(timeout=30) == []
+    assert pool.get_stats()['restarts'] == 1
+
+def test_oversized_frame_is_rejected(pool):
+    with pytest.raises(ValueError):
+        pool.submit(np.zeros((480, 640, 3), dtype=np.uint8))
@@ -0,0 +1,63 @@
+import numpy as np
+
+from region_detector import RegionDetector
+
+class WindowStub:
+    """Detector stand-in reporting fixed frame-space objects, clipped to each window"""
+    context = None
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.windows = []
+
+    def detect_batch(self, crops, pixel_format):
+        results = []
+        for _ in crops:
+            x0, y0, x1, y1 = self.windows.pop(0)
+            detected = []
+            for class_name, confidence, (x, y, w, h) in self.objects:
+                cx0, cy0 = max(x, x0), max(y, y0)
+                cx1, cy1 = min(x + w, x1), min(y + h, y1)
+                if cx1 - cx0 < 4 or cy1 - cy0 < 4:
+                    continue
+                detected.append({'class': class_name, 'confidence': confidence,
+                                 'bbox': [cx0 - x0, cy0 - y0, cx1 - cx0, cy1 - cy0]})
+            results.append(detected)
+        return results
+
+def run(objects, width=832, height=416):
+    stub = WindowStub(objects)
+    regions = RegionDetector(stub, tile=True)
+    stub.windows = list(regions.windows(width, height))
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    return regions, regions.detect_objects(frame)
+
+def test_windows_overlap():
+    regions, _ = run([])
+    windows = regions.windows(832, 416)
+    assert windows == [(0, 0, 416, 416), (208, 0, 624, 416), (416, 0, 832, 416)]
+
+def test_same_window_overlapping_objects_stay_separate():
+    # Two people standing close together, both well inside the first window only
+    objects = [('person', 0.9, (20, 100, 60, 200)), ('person', 0.8, (40, 110, 60, 200))]
+    regions, detected = run(objects)
+    assert sorted(obj['bbox'][0] for obj in detected) == [20, 40]
+    assert regions.get_stats()['merged'] == 0
+
+def test_object_seen_by_two_windows_is_merged():
+    objects = [('person', 0.9, (300, 100, 60, 200))]
+    _, detected = run(objects)
+    assert len(detected) == 1
+    assert detected[0]['bbox'] == [300, 100, 60, 200]
+    assert detected[0]['center'] == [330, 200]
+
+def test_object_cut_at_window_edge_is_merged_into_union():
+    # Spans the right edge of window 0 (x=416), so window 0 sees a cut box
+    objects = [('car', 0.7, (380, 50, 100, 80))]
+    _, detected = run(objects)
+    assert [obj['bbox'] for obj in detected] == [[380, 50, 100, 80]]
+
+def test_different_classes_are_not_merged():
+    objects = [('person', 0.9, (300, 100, 60, 200)), ('dog', 0.8, (300, 100, 60, 200))]
+    _, detected = run(objects)
+    assert sorted(obj['class'] for obj in detected) == ['dog', 'person']
@@ -0,0 +1,241 @@
+import cv2
+import numpy as np
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+def box_iou(a, b):
+    """IoU of two [x, y, w, h] boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+class Track:
+    """One tracked object with a constant-velocity Kalman filter.
+
+    State is [cx, cy, w, h, vx, vy, vw, vh] with velocities in pixels per
+    second, so prediction works for any frame cadence.
+    """
+    def __init__(self, track_id, detection, now):
+        self.track_id = track_id
+        self.detection = detection
+        self.hits = 1
+        self.created = now
+        self.last_time = now
+        self.last_seen = now
+
+        self.kalman = cv2.KalmanFilter(8, 4)
+        self.kalman.measurementMatrix = np.eye(4, 8, dtype=np.float32)
+        self.kalman.processNoiseCov = np.diag(
+            [1, 1, 1, 1, 10, 10, 5, 5]).astype(np.float32)
+        self.kalman.measurementNoiseCov = np.eye(4, dtype=np.float32) * 4
+        self.kalman.errorCovPost = np.diag(
+            [10, 10, 10, 10, 1000, 1000, 1000, 1000]).astype(np.float32)
+        self.kalman.statePost = np.zeros((8, 1), dtype=np.float32)
+        self.kalman.statePost[:4, 0] = self._measurement(detection['bbox'])[:, 0]
+        self.transition = np.eye(8, dtype=np.float32)
+
+    @staticmethod
+    def _measurement(bbox):
+        x, y, w, h = bbox
+        return np.array([[x + w / 2], [y + h / 2], [w], [h]], dtype=np.float32)
+
+    def predict(self, now):
+        """Move the filter to time now (backwards for a late detection)"""
+        dt = now - self.last_time
+        if dt == 0:
+            return
+        self.transition[0:4, 4:8] = np.eye(4, dtype=np.float32) * dt
+        self.kalman.transitionMatrix = self.transition
+        self.kalman.predict()
+        # Keep predicted state so consecutive predictions compose
+        self.kalman.statePost = self.kalman.statePre.copy()
+        self.kalman.errorCovPost = self.kalman.errorCovPre.copy()
+        self.last_time = now
+
+    def correct(self, detection, now):
+        """Fold a matched detection into the filter"""
+        self.kalman.correct(self._measurement(detection['bbox']))
+        self.detection = detection
+        self.hits += 1
+        self.last_seen = now
+
+    def shift(self, dx, dy):
+        """Move the box by an optical-flow displacement"""
+        self.kalman.statePost[0, 0] += dx
+        self.kalman.statePost[1, 0] += dy
+
+    @property
+    def bbox(self):
+        cx, cy, w, h = self.kalman.statePost[:4, 0]
+        w = max(1.0, float(w))
+        h = max(1.0, float(h))
+        return [int(cx - w / 2), int(cy - h / 2), int(w), int(h)]
+
+    def to_dict(self):
+        x, y, w, h = self.bbox
+        return {
+            **self.detection,
+            'bbox': [x, y, w, h],
+            'area': int(w * h),
+            'center': [int(x + w/2), int(y + h/2)],
+            'track_id': self.track_id,
+            'track_age': round(self.last_time - self.created, 2),
+            'predicted': self.last_time > self.last_seen
+        }
+
+class MultiObjectTracker:
+    """IoU/Kalman multi-object tracker that runs between detector keyframes.
+
+    update() associates a fresh detection list with the existing tracks
+    (greedy, highest IoU first, same class only) and returns the detections
+    tagged with stable track IDs. predict() moves every track forward to
+    the current time, optionally refined by sparse optical flow on the
+    current frame, so overlays stay in place on frames the detector skips.
+
+    Times are capture times of the frames involved, so a detection that
+    took a while to come back is folded in where the object was. A track
+    expires after max_age seconds without a match, but never before
+    keyframe_margin keyframe periods (see set_keyframe_period) have passed,
+    so a MotionGate skipping a static scene cannot age out its tracks.
+    """
+    def __init__(self, iou_threshold=0.3, max_age=1.0, min_hits=1, optical_flow=False,
+                 keyframe_margin=2.0):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.keyframe_margin = keyframe_margin
+        self.keyframe_period = 0.0
+        self.min_hits = min_hits
+        self.optical_flow = optical_flow
+        self.lock = threading.Lock()
+        self.tracks = []
+        self.next_id = 1
+        self.prev_gray = None
+
+    def reset(self):
+        """Drop all tracks"""
+        with self.lock:
+            self.tracks = []
+            self.prev_gray = None
+
+    def update(self, detections, now=None):
+        """Associate detections with tracks, returns tracked detections"""
+        now = time.time() if now is None else now
+        with self.lock:
+            for track in self.tracks:
+                track.predict(now)
+
+            # Greedy association by descending IoU within each class
+            pairs = []
+            for ti, track in enumerate(self.tracks):
+                track_box = track.bbox
+                for di, detection in enumerate(detections):
+                    if detection['class'] != track.detection['class']:
+                        continue
+                    iou = box_iou(track_box, detection['bbox'])
+                    if iou >= self.iou_threshold:
+                        pairs.append((iou, ti, di))
+            pairs.sort(reverse=True)
+
+            matched_tracks = set()
+            matched_detections = {}
+            for _, ti, di in pairs:
+                if ti in matched_tracks or di in matched_detections:
+                    continue
+                matched_tracks.add(ti)
+                matched_detections[di] = self.tracks[ti]
+                self.tracks[ti].correct(detections[di], now)
+
+            for di, detection in enumerate(detections):
+                if di not in matched_detections:
+                    track = Track(self.next_id, detection, now)
+                    self.next_id += 1
+                    self.tracks.append(track)
+                    matched_detections[di] = track
+
+            self._expire(now)
+
+            results = []
+            for di, detection in enumerate(detections):
+                track = matched_detections[di]
+                results.append({
+                    **detection,
+                    'track_id': track.track_id,
+                    'track_age': round(now - track.created, 2)
+                })
+            return results
+
+    def predict(self, frame=None, now=None):
+        """Carry every track forward to now, returns current track boxes"""
+        now = time.time() if now is None else now
+        with self.lock:
+            for track in self.tracks:
+                track.predict(now)
+            if self.optical_flow and frame is not None:
+                self._apply_flow(frame)
+            self._expire(now)
+            return self._snapshot()
+
+    def set_keyframe_period(self, seconds):
+        """Seconds between forced detector passes at the current frame rate"""
+        with self.lock:
+            self.keyframe_period = seconds
+
+    def expiry_age(self):
+        """Seconds a track survives without a match"""
+        return max(self.max_age, self.keyframe_margin * self.keyframe_period)
+
+    def get_tracks(self):
+        """Current track boxes without advancing time"""
+        with self.lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        """Serialize confirmed tracks (caller holds lock)"""
+        return [track.to_dict() for track in self.tracks if track.hits >= self.min_hits]
+
+    def _expire(self, now):
+        """Drop tracks the detector has not confirmed for expiry_age() seconds"""
+        max_age = self.expiry_age()
+        self.tracks = [track for track in self.tracks
+                       if now - track.last_seen <= max_age]
+
+    def _apply_flow(self, frame):
+        """Shift tracks by the median optical flow inside each box"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        prev_gray, self.prev_gray = self.prev_gray, gray
+        if prev_gray is None or prev_gray.shape != gray.shape:
+            return
+
+        for track in self.tracks:
+            x, y, w, h = track.bbox
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(gray.shape[1], x + w), min(gray.shape[0], y + h)
+            if x1 - x0 < 8 or y1 - y0 < 8:
+                continue
+            points = cv2.goodFeaturesToTrack(prev_gray[y0:y1, x0:x1], 20, 0.01, 4)
+            if points is None:
+                continue
+            points = points + np.array([x0, y0], dtype=np.float32)
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None)
+            good = status.reshape(-1) == 1
+            if good.sum() < 3:
+                continue
+            dx, dy = np.median((moved - points).reshape(-1, 2)[good], axis=0)
+            track.shift(float(dx), float(dy))
+
+    def get_stats(self):
+        """Get tracker counters"""
+        with self.lock:
+            return {
+                'active_tracks': len(self.tracks),
+                'total_tracks': self.next_id - 1,
+                'max_age': round(self.expiry_age(), 2),
+                'optical_flow': self.optical_flow
+            }